@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+
+""" Experiments shared with the worker processes. They are filled in before
+the workers are forked, so the workers inherit the event data instead of
+receiving a pickled copy of it.
+"""
+shared = []
+
+
+def render_task(task):
+    """ Render the figure of one variable, or the heat map of a pair of
+    variables, of one experiment.
+    """
+    i, variable_name, fname = task
+    exp, cuts, cut_labels, histograms = shared[i]
+    if isinstance(variable_name, tuple):
+        exp.plot_heatmap(
+            variable_name, cuts, cut_labels, fname=fname, histograms=histograms)
+    else:
+        exp.plot_variable(
+            variable_name, cuts, cut_labels, fname=fname, histograms=histograms)
+    return fname
+
+
+def render(experiments, output, fmt="png", processes=None, chunk_size=None):
+    r"""Save the figures of every requested variable and heat map of several
+    experiments without displaying them, rendering them in a pool of
+    processes.
+    Args:
+        experiments ([(str, Experiment)]): Tag used to name the figures and
+            experiment, for each experiment.
+        output (str): Directory where the figures are saved.
+        fmt (str): Format of the figures (png or pdf).
+        processes (int): Number of worker processes. Defaults to the number
+            of CPUs; 1 renders everything in this process.
+        chunk_size (int): Compute the histograms over chunks of this many
+            events instead of loading the columns in memory.
+
+    Returns:
+        List of the names of the saved figures.
+    """
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+    os.makedirs(output, exist_ok=True)
+    shared.clear()
+    tasks = []
+    for i, (tag, exp) in enumerate(experiments):
+        """ Read the data and build the index, or compute the histograms
+        with the histogram store or by streaming, before forking the workers.
+        """
+        histograms = {}
+        if chunk_size is None:
+            if exp.store is None:
+                exp.fdata.load(exp.required_variables())
+            cuts, cut_labels = exp.cuts_and_breakdown()
+            if exp.store is not None:
+                histograms = {var: exp.histograms(var, cuts, cut_labels)
+                              for var in exp.plotted_variables()}
+                for names in exp.plotting_heatmaps:
+                    variables = tuple(exp.find_variable(name) for name in names)
+                    if all(variables):
+                        histograms[variables] = exp.histograms_nd(
+                            variables, cuts, cut_labels)
+        elif exp.plotting_heatmaps:
+            raise ValueError("Heat maps are not computed over chunks.")
+        else:
+            histograms = exp.streamed_histograms(exp.plotted_variables(), chunk_size)
+            cuts, cut_labels = None, None
+        shared.append((exp, cuts, cut_labels, histograms))
+        for var in exp.plotting_variables:
+            if exp.find_variable(var):
+                fname = os.path.join(output, exp.figure_name(var, fmt, tag))
+                tasks.append((i, var, fname))
+        for names in exp.plotting_heatmaps:
+            if all(exp.find_variable(name) for name in names):
+                fname = os.path.join(output, exp.figure_name(names, fmt, tag))
+                tasks.append((i, tuple(names), fname))
+    if processes == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return [render_task(task) for task in tasks]
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        return pool.map(render_task, tasks)
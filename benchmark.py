@@ -0,0 +1,325 @@
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import perf_counter
+import h5py
+import numpy as np
+from cache import write_atomic
+from joint_fit import DETECTORS, load_detector
+
+""" Number of event samples (itype or pid values) of each detector. """
+NSAMPLES = {"SK": 14, "SK-Htag": 16, "SK-Gd": 16, "HK": 16, "ICUp": 2, "ORCA": 3}
+
+""" Detectors with the SK file layout, and those with a tagged neutron count. """
+SK_FAMILY = ("SK", "SK-Htag", "SK-Gd", "HK")
+NEUTRON_TAG = ("SK-Htag", "SK-Gd", "HK")
+
+""" Variables histogrammed by default, as in plot_sim.py. """
+VARIABLES = ("Enu", "reco_coszen", "reco_energy")
+
+""" Number of events generated at once. """
+BLOCK = 1 << 20
+
+
+def sk_columns(rng, n, detector):
+    """ Synthetic columns of n events in the layout of the SK files. """
+    flavor = rng.choice([12, 14, 16], n, p=[0.35, 0.6, 0.05])
+    sign = np.where(rng.random(n) < 0.7, 1, -1)
+    energy = 10**rng.uniform(-1, 3, n)
+    cc = rng.random(n) < 0.7
+    columns = {"ipnu": (sign * flavor).astype(np.int32), "pnu": energy}
+    for prefix, spread in (("dirnu", 0.), ("dirlep", 0.2), ("recodir", 0.3)):
+        cosz = np.clip(rng.uniform(-1, 1, n) + rng.normal(0, spread, n), -1, 1)
+        phi = rng.uniform(0, 2 * np.pi, n)
+        sinz = np.sqrt(1 - cosz**2)
+        columns[f"{prefix}X"] = sinz * np.cos(phi)
+        columns[f"{prefix}Y"] = sinz * np.sin(phi)
+        columns[f"{prefix}Z"] = cosz
+    columns["azi"] = rng.uniform(0, 360, n)
+    columns["plep"] = energy * rng.uniform(0.2, 1, n)
+    mode = np.where(cc, rng.choice([1, 2, 11, 12, 13, 21, 26], n),
+                    rng.choice([31, 32, 36, 41, 46], n))
+    columns["mode"] = (np.where(rng.random(n) < 0.5, 1, -1) * mode).astype(np.int32)
+    columns["imass"] = rng.uniform(0, 0.3, n)
+    columns["pmax"] = columns["plep"] * rng.uniform(0.8, 1, n)
+    columns["evis"] = energy * rng.uniform(0.5, 1.2, n)
+    columns["ip"] = rng.choice([2, 3], n).astype(np.int32)
+    columns["nring"] = rng.integers(1, 5, n).astype(np.int32)
+    columns["muedk"] = rng.integers(0, 3, n).astype(np.int32)
+    columns["itype"] = rng.integers(-1, NSAMPLES[detector], n).astype(np.int32)
+    columns["weightSim"] = rng.uniform(0.5, 2, n)
+    columns["weightReco"] = rng.uniform(0.5, 2, n)
+    columns["weightOsc_SKpaper"] = rng.uniform(0, 1, n)
+    columns["weightOsc_SKbest"] = rng.uniform(0, 1, n)
+    if detector in NEUTRON_TAG:
+        columns["neutron"] = rng.poisson(np.where(sign < 0, 1.5, 0.5)).astype(np.int32)
+    return columns
+
+
+def ic_columns(rng, n, detector):
+    """ Synthetic columns of n events in the layout of the IC and ORCA
+    files, with zenith angles in radians.
+    """
+    flavor = rng.choice([12, 14, 16], n, p=[0.35, 0.6, 0.05])
+    sign = np.where(rng.random(n) < 0.7, 1, -1)
+    energy = 10**rng.uniform(0, 2.5, n)
+    zenith = np.arccos(rng.uniform(-1, 1, n))
+    columns = {
+        "pdg": (sign * flavor).astype(np.int32),
+        "true_energy": energy,
+        "true_zenith": zenith,
+        "true_azimuth": rng.uniform(0, 2 * np.pi, n),
+        "interaction_type": rng.integers(0, 4, n).astype(np.int32),
+        "current_type": (rng.random(n) < 0.7).astype(np.int32),
+        "reco_energy": energy * rng.uniform(0.5, 1.5, n),
+        "reco_azimuth": rng.uniform(0, 2 * np.pi, n),
+        "reco_zenith": np.clip(zenith + rng.normal(0, 0.2, n), 0, np.pi),
+        "Q2": rng.exponential(1, n),
+        "W": rng.uniform(0.9, 5, n),
+        "x": rng.uniform(0, 1, n),
+        "y": rng.uniform(0, 1, n),
+        "xsec": energy * rng.uniform(0.5, 1, n),
+        "dxsec": rng.uniform(0, 1, n),
+        "pid": rng.integers(0, NSAMPLES[detector], n).astype(np.int32),
+        "weight": rng.uniform(1e-14, 1e-12, n)}
+    return columns
+
+
+def generate(detector, fname, nevents, seed=0):
+    r"""Write a synthetic simulation file with the datasets the experiment
+    class of a detector expects. The events are generated block by block,
+    so files larger than the memory can be written.
+    Args:
+        detector (str): Name of the detector, as in joint_fit.DETECTORS.
+        fname (str): Name of the file.
+        nevents (int): Number of events.
+        seed (int): Seed of the random generator.
+    """
+    make = sk_columns if detector in SK_FAMILY else ic_columns
+    rng = np.random.default_rng(seed)
+    with h5py.File(fname, 'w') as hf:
+        for start in range(0, nevents, BLOCK):
+            stop = min(start + BLOCK, nevents)
+            for name, data in make(rng, stop - start, detector).items():
+                if name not in hf:
+                    hf.create_dataset(name, shape=(nevents,), dtype=data.dtype)
+                hf[name][start:stop] = data
+
+
+def peak_memory():
+    """ Peak resident memory of this process in MB. """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_stages(detector, fname, variables, options):
+    """ Time the stages of the plotting of a file in this process.
+    Returns:
+        List of (stage, seconds, peak memory in MB so far).
+    """
+    importlib.import_module(DETECTORS[detector][0])
+    results = []
+    begin = perf_counter()
+    exp = load_detector(detector, fname, variables, **options)
+    exp.fdata.load(exp.required_variables())
+    results.append(("load", perf_counter() - begin, peak_memory()))
+
+    begin = perf_counter()
+    cuts, cut_labels = exp.cuts_and_breakdown()
+    results.append(("cuts_and_breakdown", perf_counter() - begin, peak_memory()))
+
+    for variable in exp.plotted_variables():
+        begin = perf_counter()
+        exp.histograms(variable, cuts, cut_labels)
+        results.append((f"histogram {variable}", perf_counter() - begin, peak_memory()))
+    return results
+
+
+def run_plot_sim(detector, fname, variables, options):
+    """ Time a headless plot_sim.py run saving the figures of a file.
+    Returns:
+        (seconds, peak memory of the run in MB)
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plot_sim.py")
+    with tempfile.TemporaryDirectory() as output:
+        command = [sys.executable, script, "--experiment", detector,
+                   "--fname", fname, "--variables", *variables,
+                   "--output", output, "--processes", "1"]
+        if not options.get("cache", True):
+            command.append("--no-cache")
+        with tempfile.TemporaryFile() as errors:
+            begin = perf_counter()
+            process = subprocess.Popen(
+                command, stdout=subprocess.DEVNULL, stderr=errors)
+            """ wait4 gives the resource usage of this child only. """
+            __, status, usage = os.wait4(process.pid, 0)
+            seconds = perf_counter() - begin
+            process.returncode = os.waitstatus_to_exitcode(status)
+            if process.returncode != 0:
+                errors.seek(0)
+                raise RuntimeError(f"plot_sim.py failed: {errors.read().decode()}")
+    return seconds, usage.ru_maxrss / 1024
+
+
+def benchmark(detectors, sizes, directory, variables=VARIABLES, options=None,
+              plot=True, seed=0):
+    r"""Time every stage for each detector and number of events. Synthetic
+    files are generated in a directory and reused by later runs. Each case
+    runs in a fresh process, so the peak memory of a case is its own.
+    Args:
+        detectors ([str]): Names of the detectors.
+        sizes ([int]): Numbers of events.
+        directory (str): Directory of the synthetic files.
+        variables ([str]): Variables histogrammed.
+        options (dict): Options of the experiment classes.
+        plot (bool): Time an end-to-end plot_sim.py run too.
+        seed (int): Seed of the synthetic files.
+
+    Returns:
+        List of results with experiment, events, stage, seconds and peak
+        memory in MB.
+    """
+    options = {"cache": False} if options is None else options
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    for detector in detectors:
+        for nevents in sizes:
+            fname = os.path.join(directory, f"{detector}_{nevents}_{seed}.h5")
+            if not os.path.exists(fname):
+                generate(detector, f"{fname}.tmp", nevents, seed)
+                os.replace(f"{fname}.tmp", fname)
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                stages = pool.submit(
+                    run_stages, detector, fname, list(variables), options).result()
+            if plot:
+                stages.append(("plot_sim.py",) + run_plot_sim(
+                    detector, fname, variables, options))
+            for stage, seconds, memory in stages:
+                results.append({"experiment": detector, "events": nevents,
+                                "stage": stage, "seconds": seconds,
+                                "peak_mb": memory})
+    return results
+
+
+def git_commit():
+    """ Commit of the repository being benchmarked, None outside git. """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def record(history, results):
+    """ Append the results of a run to the JSON history and return the
+    previous run of the same host, if any.
+    """
+    runs = []
+    if os.path.exists(history):
+        with open(history) as f:
+            runs = json.load(f)
+    previous = None
+    for run in runs:
+        if run["host"] == platform.node():
+            previous = run
+    runs.append({
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "h5py": h5py.__version__,
+        "results": results})
+    write_atomic(history, lambda f: f.write(json.dumps(runs, indent=1).encode()))
+    return previous
+
+
+def print_results(results, previous=None):
+    """ Prints the results of a run and their change since a previous one. """
+    before = {}
+    if previous is not None:
+        before = {(r["experiment"], r["events"], r["stage"]): r["seconds"]
+                  for r in previous["results"]}
+    print("\nBenchmarks\n--------------------------------------------------")
+    for r in results:
+        line = (f"  {r['experiment']:>8} {r['events']:>10}  {r['stage']:<28}"
+                f"{r['seconds']:9.3f} s {r['peak_mb']:9.1f} MB")
+        key = (r["experiment"], r["events"], r["stage"])
+        if before.get(key):
+            line += f"  {100 * (r['seconds'] / before[key] - 1):+6.1f}%"
+        print(line)
+    if previous is not None:
+        print(f"\nChanges are relative to commit {previous['commit']} ({previous['date']}).")
+    print("\n")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Time the loading, cuts, histograms and plotting of \
+        synthetic simulation files.")
+    parser.add_argument(
+        "--experiment",
+        type=str,
+        nargs="+",
+        choices=tuple(DETECTORS),
+        default=tuple(DETECTORS),
+        help="Experiments benchmarked. Default is all of them.")
+    parser.add_argument(
+        "--events",
+        type=int,
+        nargs="+",
+        default=(100000,),
+        help="Numbers of events of the synthetic files (1e5 to 1e8). Default \
+        is 100000.")
+    parser.add_argument(
+        "--data",
+        type=str,
+        default=os.path.join(tempfile.gettempdir(), "atmospheric-neutrino-mc-bench"),
+        help="Directory of the synthetic files, reused across runs.")
+    parser.add_argument(
+        "--history",
+        type=str,
+        default="benchmarks.json",
+        help="JSON file the results are appended to. Default is benchmarks.json.")
+    parser.add_argument(
+        "--variables",
+        type=str,
+        nargs="+",
+        default=VARIABLES,
+        help="Variables histogrammed. Default are those of plot_sim.py.")
+    parser.add_argument(
+        "--no-plot",
+        action="store_true",
+        help="Do not time end-to-end plot_sim.py runs.")
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Use the on-disk cache of derived quantities.")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the synthetic files.")
+    args = parser.parse_args()
+
+    results = benchmark(
+        args.experiment, args.events, args.data, args.variables,
+        {"cache": args.cache}, not args.no_plot, args.seed)
+    previous = record(args.history, results)
+    print_results(results, previous)
+
+
+# ------------------------------------------------------- #
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import numpy as np
+
+""" Number of bins of the specifications without an explicit number. """
+BINS = 20
+
+""" Cosine zenith edges shared by every experiment, so their angular
+distributions are comparable.
+"""
+COSZEN_EDGES = np.linspace(-1., 1., 21)
+
+
+class Binning:
+    """ Specification of the bin edges of a variable. The edges are shared by
+    every sample and cut and depend only on the range of the variable over
+    all the events, or on its distribution for quantile bins.
+    """
+
+    """ Whether the edges need the values and weights of the events, not
+    only their range.
+    """
+    needs_values = False
+
+    def edges(self, lo, hi, positive):
+        r"""Early definition of method for getting the bin edges given the
+        range of the variable.
+        Args:
+            lo (float): Smallest value, +inf without events.
+            hi (float): Largest value, -inf without events.
+            positive (float): Smallest positive value, +inf without any.
+
+        Returns:
+            Increasing array of bin edges.
+        """
+        pass
+
+    def key(self):
+        """ Text identifying the specification, for caching its edges. """
+        return repr(self)
+
+    def __repr__(self):
+        args = ", ".join(f"{k}={v!r}" for k, v in vars(self).items())
+        return f"{type(self).__name__}({args})"
+
+
+def fallback_edges(lo, hi, bins):
+    """ Linear edges of numpy.histogram for a range, [0, 1] without events
+    and [lo - 0.5, lo + 0.5] for a single value.
+    """
+    values = np.array([] if lo > hi else [lo, hi])
+    return np.histogram_bin_edges(values, bins)
+
+
+class Linear(Binning):
+    """ Equally spaced bins between two values, by default the range of the
+    variable.
+    """
+
+    def __init__(self, bins=BINS, lo=None, hi=None):
+        self.bins = bins
+        self.lo = lo
+        self.hi = hi
+
+    def edges(self, lo, hi, positive):
+        lo = lo if self.lo is None else self.lo
+        hi = hi if self.hi is None else self.hi
+        return fallback_edges(lo, hi, self.bins)
+
+
+class Log(Binning):
+    """ Logarithmically spaced bins between two positive values, by default
+    the smallest positive and the largest values of the variable. Values
+    that are not positive fall outside the bins.
+    """
+
+    def __init__(self, bins=BINS, lo=None, hi=None):
+        self.bins = bins
+        self.lo = lo
+        self.hi = hi
+
+    def edges(self, lo, hi, positive):
+        lo = positive if self.lo is None else self.lo
+        hi = hi if self.hi is None else self.hi
+        if not 0 < lo < hi < np.inf:
+            return fallback_edges(lo, hi, self.bins)
+        return np.geomspace(lo, hi, self.bins + 1)
+
+
+class Fixed(Binning):
+    """ Explicit bin edges, e.g. for the cosine of zenith angles. """
+
+    def __init__(self, edges):
+        self.edges_ = [float(e) for e in edges]
+
+    def edges(self, lo, hi, positive):
+        return np.array(self.edges_)
+
+
+class Integer(Binning):
+    """ One bin centered on each integer of the range of the variable, or on
+    every step integers if there would be more than max_bins bins.
+    """
+
+    def __init__(self, max_bins=100):
+        self.max_bins = max_bins
+
+    def edges(self, lo, hi, positive):
+        if lo > hi:
+            return fallback_edges(lo, hi, 1)
+        lo, hi = np.floor(lo), np.ceil(hi)
+        step = max(1, int(np.ceil((hi - lo + 1) / self.max_bins)))
+        nbins = int(np.ceil((hi - lo + 1) / step))
+        return lo - 0.5 + step * np.arange(nbins + 1)
+
+
+class Quantile(Binning):
+    """ Bins holding equal sums of weights of the events, i.e. equal
+    expected numbers of events. Repeated values may merge bins.
+    """
+    needs_values = True
+
+    def __init__(self, bins=BINS):
+        self.bins = bins
+
+    def edges(self, lo, hi, positive):
+        return fallback_edges(lo, hi, self.bins)
+
+    def quantile_edges(self, values, weights):
+        """ Bin edges from the values and weights of the events. """
+        values = np.asarray(values, dtype=float)
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), values.shape)
+        finite = np.isfinite(values)
+        values, weights = values[finite], weights[finite]
+        if values.size == 0 or weights.sum() <= 0:
+            return self.edges(np.inf, -np.inf, np.inf)
+        order = np.argsort(values, kind="stable")
+        values, cumulative = values[order], np.cumsum(weights[order])
+        levels = np.linspace(0, cumulative[-1], self.bins + 1)[1:-1]
+        inner = values[np.minimum(np.searchsorted(cumulative, levels), values.size - 1)]
+        edges = np.unique(np.concatenate(([values[0]], inner, [values[-1]])))
+        if edges.size < 2:
+            return fallback_edges(values[0], values[0], 1)
+        return edges
+
+
+def value_range(values):
+    """ Smallest, largest and smallest positive values of an array, as used
+    by Binning.edges.
+    """
+    values = np.asarray(values)
+    if values.size == 0:
+        return np.inf, -np.inf, np.inf
+    positive = values[values > 0]
+    return (float(np.nanmin(values)), float(np.nanmax(values)),
+            float(positive.min()) if positive.size else np.inf)
+
+
+def merge_ranges(a, b):
+    """ Range of the union of two sets of values given their ranges. """
+    return min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2])
+
+
+def parse_binning(text):
+    r"""Binning specification from text: linear[:bins[:lo:hi]],
+    log[:bins[:lo:hi]], integer[:max_bins], quantile[:bins] or
+    fixed:e0,e1,...
+    Args:
+        text (str): Specification, e.g. log:30 or fixed:-1,-0.5,0,0.5,1.
+
+    Returns:
+        Binning.
+    """
+    kind, __, rest = text.partition(":")
+    args = rest.split(":") if rest else []
+    try:
+        if kind == "fixed":
+            return Fixed([float(e) for e in rest.split(",")])
+        if kind in ("linear", "log"):
+            cls = Linear if kind == "linear" else Log
+            bins = int(args[0]) if args else BINS
+            bounds = [float(a) for a in args[1:3]] if len(args) >= 3 else [None, None]
+            return cls(bins, *bounds)
+        if kind == "integer":
+            return Integer(*(int(a) for a in args[:1]))
+        if kind == "quantile":
+            return Quantile(*(int(a) for a in args[:1]))
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid binning specification {text}.")
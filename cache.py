@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+""" Location and maximum size in bytes of the cache of derived quantities. """
+CACHE_DIR = os.environ.get(
+    "ATMO_MC_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "atmospheric-neutrino-mc"))
+CACHE_SIZE = int(os.environ.get("ATMO_MC_CACHE_SIZE", 4 * 1024**3))
+
+
+def file_hash(fname, directory=CACHE_DIR):
+    """ Content hash of a file. The hash is remembered for each path, size
+    and modification time, so the file is only read again after it changes.
+    Cached entries of the previous content of the file are removed then.
+    """
+    stat = os.stat(fname)
+    path = os.path.realpath(fname)
+    tag = f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+    memo_path = os.path.join(directory, "hashes.json")
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path) as f:
+            memo = json.load(f)
+    if tag in memo:
+        return memo[tag]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            digest.update(block)
+    stale = [k for k in memo if k.rsplit(":", 2)[0] == path]
+    old = {memo.pop(k) for k in stale}
+    memo[tag] = digest.hexdigest()
+    write_atomic(memo_path, lambda f: f.write(json.dumps(memo).encode()))
+
+    for entry in os.listdir(directory):
+        if entry.split("_", 1)[0] in old - set(memo.values()):
+            os.remove(os.path.join(directory, entry))
+    return memo[tag]
+
+
+def write_atomic(path, write):
+    """ Write a file through a temporary one so readers never see it half
+    written.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class DerivedCache:
+    """ On-disk cache of the quantities derived from a simulation file, such
+    as transformed columns or normalization sums. Entries are stored as .npy
+    files keyed by the content hash of the simulation file and the experiment
+    class, and the least recently used entries are evicted once the cache
+    grows beyond its maximum size.
+    """
+
+    def __init__(self, fname, experiment, directory=CACHE_DIR,
+                 max_bytes=CACHE_SIZE):
+        r"""Find the cache entries of a simulation file.
+        Args:
+            fname (str): Name of simulation file.
+            experiment (str): Name of the experiment class.
+            directory (str): Directory of the cache.
+            max_bytes (int): Maximum size of the cache in bytes.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash = file_hash(fname, directory)
+        self.prefix = f"{self.hash}_{experiment}"
+
+    def path(self, name):
+        """ Path of the entry of a derived quantity. """
+        return os.path.join(self.directory, f"{self.prefix}_{name}.npy")
+
+    def get(self, name, compute):
+        """ Derived quantity, computed and stored on the first call. Arrays
+        read from the cache are memory-mapped.
+        Args:
+            name (str): Name of the derived quantity.
+            compute (callable): Function computing the quantity.
+        """
+        path = self.path(name)
+        if os.path.exists(path):
+            os.utime(path)
+            data = np.load(path, mmap_mode='r')
+            return data if data.ndim else data[()]
+        data = compute()
+        write_atomic(path, lambda f: np.save(f, np.asarray(data)))
+        self.evict()
+        return data
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache fits in
+        its maximum size.
+        """
+        entries = []
+        for entry in os.listdir(self.directory):
+            if entry.endswith(".npy"):
+                stat = os.stat(os.path.join(self.directory, entry))
+                entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for __, size, __ in entries)
+        for __, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, entry))
+            total -= size
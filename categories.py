@@ -0,0 +1,154 @@
+import json
+import numpy as np
+
+
+class Categories:
+    """ Layout of the categories of an index: the label and the (axis, code)
+    of each cut getter and the number of categories of each axis. It is all
+    that is needed to turn cut getters into selections of categories, so it
+    can be kept without the events.
+    """
+
+    def __init__(self, labels, codes, shape, nsamples):
+        r"""Layout of the categories.
+        Args:
+            labels ({str: str}): Label of each getter, by name.
+            codes ({str: (int, int)}): Axis and code of each getter, by name.
+            shape ([int]): Number of categories of each axis.
+            nsamples (int): Number of samples of the experiment.
+        """
+        self.labels = labels
+        self.codes = codes
+        self.shape = shape
+        self.nsamples = nsamples
+        self.ncube = int(np.prod(self.shape))
+        self.nkeys = (nsamples + 1) * self.ncube
+
+    def cut(self, getters):
+        """ Combine cut getters into a selection of categories.
+        Args:
+            getters ([callable]): Cut getters, one per category axis at most.
+
+        Returns:
+            [Label of the cut, boolean array over the categories]
+        """
+        selection = np.ones(self.shape, dtype=bool)
+        label = ""
+        for getter in getters:
+            name = getter.__name__
+            if name not in self.labels:
+                raise ValueError(f"Cut {name} is not part of the index.")
+            label += self.labels[name]
+            if name in self.codes:
+                axis, code = self.codes[name]
+                keep = np.zeros(self.shape[axis], dtype=bool)
+                keep[code] = True
+                shape = [1] * len(self.shape)
+                shape[axis] = self.shape[axis]
+                selection = selection & keep.reshape(shape)
+        return [label, selection.ravel()]
+
+    def to_json(self):
+        """ Layout as a JSON string. """
+        return json.dumps({"labels": self.labels, "codes": self.codes,
+                           "shape": self.shape, "nsamples": self.nsamples})
+
+    @classmethod
+    def from_json(cls, text):
+        """ Layout from a JSON string written by to_json. """
+        layout = json.loads(str(text))
+        codes = {name: tuple(code) for name, code in layout["codes"].items()}
+        return cls(layout["labels"], codes, layout["shape"], layout["nsamples"])
+
+
+class CategoryIndex(Categories):
+    """ One-time categorical index of the events of an experiment. Every event
+    gets a compact integer key encoding its sample, interaction, CP and flavor
+    categories, and the events are sorted by key once. Any combination of cuts
+    is then served as a slice (or a concatenation of slices) of the sorted
+    event order instead of a new full-length boolean mask.
+    """
+
+    def __init__(self, axes, sample_getter, nsamples, wildcards=()):
+        r"""Build the index from the cut getters of an experiment.
+        Args:
+            axes ([(str, [callable])]): Name of each category axis and the
+                getters returning [label, mask] for each of its categories.
+                Events not selected by any getter of an axis fall in an extra
+                "other" category. The categories of an axis must not overlap.
+            sample_getter (callable): Method returning the mask of a sample.
+                The samples must not overlap.
+            nsamples (int): Number of samples of the experiment.
+            wildcards ([callable]): Getters that select every event.
+        """
+        labels = {}
+        getter_codes = {}
+        shape = []
+        cube = 0
+        for axis, (name, getters) in enumerate(axes):
+            size = len(getters) + 1
+            codes = None
+            for code, getter in enumerate(getters):
+                label, mask = getter()
+                if codes is None:
+                    codes = np.full(mask.size, len(getters), dtype=np.int32)
+                if np.any(codes[mask] != len(getters)):
+                    raise ValueError(f"Categories of the {name} axis must not overlap.")
+                codes[mask] = code
+                labels[getter.__name__] = label
+                getter_codes[getter.__name__] = (axis, code)
+            cube = cube * size + codes
+            shape.append(size)
+        for getter in wildcards:
+            labels[getter.__name__] = getter()[0]
+        super(CategoryIndex, self).__init__(labels, getter_codes, shape, nsamples)
+
+        """ Sample category, "other" for events outside every sample. """
+        sample = np.full(cube.size, nsamples, dtype=np.int32)
+        for s in range(nsamples):
+            mask = sample_getter(s)
+            if np.any(sample[mask] != nsamples):
+                raise ValueError("Samples must not overlap.")
+            sample[mask] = s
+        dtype = np.int16 if self.nkeys <= np.iinfo(np.int16).max else np.int32
+        self.keys = (sample * self.ncube + cube).astype(dtype)
+
+        """ Sort permutation and offsets of each key in it. """
+        self.order = np.argsort(self.keys, kind="stable")
+        counts = np.bincount(self.keys, minlength=self.nkeys)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.cache = {}
+
+    def events(self, selection=None, sample=None):
+        """ Indices of the events in a selection of categories and a sample.
+        Contiguous runs of keys are returned as views of the sort order.
+        Args:
+            selection (array): Boolean array over the categories, as returned
+                by cut. None selects every category.
+            sample (int): Sample index. None selects every sample.
+
+        Returns:
+            Array with the indices of the selected events.
+        """
+        cube = np.arange(self.ncube) if selection is None else np.flatnonzero(selection)
+        tag = (None if selection is None else selection.tobytes(), sample)
+        if tag in self.cache:
+            return self.cache[tag]
+        if sample is None:
+            samples = np.arange(self.nsamples + 1)
+        else:
+            samples = np.array([sample])
+        keys = (samples[:, None] * self.ncube + cube[None, :]).ravel()
+        if keys.size == 0:
+            return self.order[:0]
+        """ Merge consecutive keys into runs of the sort order. """
+        breaks = np.flatnonzero(np.diff(keys) != 1) + 1
+        starts = self.offsets[keys[np.concatenate(([0], breaks))]]
+        stops = self.offsets[keys[np.concatenate((breaks - 1, [keys.size - 1]))] + 1]
+        if starts.size == 1:
+            result = self.order[starts[0]:stops[0]]
+        else:
+            result = np.concatenate(
+                [self.order[a:b] for a, b in zip(starts, stops)])
+        self.cache[tag] = result
+        return result
@@ -0,0 +1,400 @@
+import json
+from collections import deque
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import numpy as np
+from profiling import profiler
+
+
+def open_file(fname):
+    """ Open a simulation file for reading. h5py is imported on the first
+    call, so runs answered from the caches never import it.
+    """
+    import h5py
+    return h5py.File(fname, 'r')
+
+
+def inspect_file(fname):
+    r"""Describe the datasets of a simulation file from its metadata only,
+    without reading any event.
+    Args:
+        fname (str): Name of simulation file.
+
+    Returns:
+        (attributes of the file, {dataset: {shape, dtype, chunks,
+        compression, bytes stored}})
+    """
+    datasets = {}
+    with open_file(fname) as hf:
+        attrs = dict(hf.attrs)
+        for name, ds in hf.items():
+            if not hasattr(ds, "dtype"):
+                continue
+            datasets[name] = {
+                "shape": ds.shape,
+                "dtype": ds.dtype,
+                "chunks": ds.chunks,
+                "compression": ds.compression,
+                "stored": ds.id.get_storage_size()}
+    return attrs, datasets
+
+
+class LazyColumns(MutableMapping):
+    """ Dictionary-like view of the datasets in a simulation file. A dataset is
+    only read from disk the first time it is accessed and it is kept in memory
+    afterwards, so the memory footprint scales with the columns actually used.
+    Contiguous and uncompressed datasets are memory-mapped instead of copied,
+    so processes reading the same file share the page cache.
+    """
+
+    def __init__(self, fname, mmap=True):
+        r"""View of a simulation file. The file is only opened when its
+        datasets or their names are first needed.
+        Args:
+            fname (str): Name of simulation file.
+            mmap (bool): Memory-map the datasets stored contiguously.
+        """
+        self.fname = fname
+        self.mmap = mmap
+        self.columns = {}
+        self.transforms = {}
+        self.access = {}
+        self.cache = None
+        self.info = None
+
+    def file_info(self):
+        """ Names of the datasets and attributes of the file. They are read
+        the first time they are needed and kept in the cache of derived
+        quantities when there is one, so that a file whose results are all
+        cached is not opened at all.
+        """
+        if self.info is None:
+            def read():
+                with open_file(self.fname) as hf:
+                    return np.array(json.dumps({
+                        "names": list(hf.keys()),
+                        "repacked": int(hf.attrs.get("repacked", 0)),
+                        "chunk_events": int(hf.attrs.get("chunk_events", 0))}))
+            text = read() if self.cache is None else self.cache.get("file_info", read)
+            self.info = json.loads(str(text))
+        return self.info
+
+    @property
+    def names(self):
+        """ Names of the datasets in the file. """
+        return self.file_info()["names"]
+
+    @property
+    def repacked(self):
+        """ Version of the layout of files written by repack.py, 0 for other
+        files. Repacked files are chunked and compressed with narrow types.
+        """
+        return self.file_info()["repacked"]
+
+    @property
+    def chunk_events(self):
+        """ Number of events per chunk of repacked files, so that reads can
+        be aligned to their chunks, 0 for other files.
+        """
+        return self.file_info()["chunk_events"]
+
+    def __getitem__(self, name):
+        if name not in self.columns:
+            self.load([name])
+        return self.columns[name]
+
+    def __setitem__(self, name, value):
+        self.columns[name] = value
+
+    def __delitem__(self, name):
+        """ Drop a dataset from memory. Datasets of the file stay available
+        and are read again when next accessed.
+        """
+        if name not in self:
+            raise KeyError(name)
+        self.columns.pop(name, None)
+
+    def __iter__(self):
+        names = self.names + [k for k in self.columns if k not in self.names]
+        return iter(names)
+
+    def __len__(self):
+        return len(set(self.names) | set(self.columns))
+
+    def __contains__(self, name):
+        return name in self.columns or name in self.names
+
+    def load(self, names):
+        """ Read the given datasets in a single pass over the file. Datasets
+        already in memory are not read again.
+        """
+        missing = [name for name in names if name not in self.columns]
+        if not missing:
+            return
+        with profiler.stage("read columns"), open_file(self.fname) as hf:
+            for name in missing:
+                if name not in hf:
+                    raise KeyError(f"Variable {name} not in {self.fname}.")
+                self.columns[name] = self.read(hf, name)
+                profiler.read(self.columns[name].nbytes)
+
+    def read(self, hf, name):
+        """ Read a dataset from an open file applying its transformation.
+        Transformed datasets are taken from the cache of derived quantities
+        when there is one.
+        """
+        if name in self.transforms and self.cache is not None:
+            data = self.cache.get(
+                name, lambda: self.transforms[name](self.raw(hf, name)))
+            self.access[name] = "cached"
+            return data
+        data = self.raw(hf, name)
+        if name in self.transforms:
+            data = self.transforms[name](data)
+            self.access[name] = "copied"
+        return data
+
+    def raw(self, hf, name):
+        """ Read a dataset from an open file as it is stored. The datasets of
+        repacked files are all chunked and compressed, so they are never
+        memory-mapped.
+        """
+        data = self.map(hf, name) if self.mmap and not self.repacked else None
+        self.access[name] = "mapped"
+        if data is None:
+            data = np.array(hf[name])
+            self.access[name] = "copied"
+        return data
+
+    def map(self, hf, name):
+        """ Read-only memory map of a dataset. Returns None when the dataset
+        is chunked, compressed, stored externally or not yet allocated.
+        """
+        ds = hf[name]
+        if hf.driver != "sec2" or hf.userblock_size != 0:
+            return None
+        if ds.chunks is not None or ds.external is not None:
+            return None
+        if ds.dtype.kind not in "biuf" or ds.size == 0:
+            return None
+        offset = ds.id.get_offset()
+        if offset is None:
+            return None
+        return np.memmap(
+            self.fname,
+            dtype=ds.dtype,
+            mode='r',
+            offset=offset,
+            shape=ds.shape)
+
+    def length(self, name):
+        """ Number of entries of a dataset, read from the file metadata. """
+        if name in self.columns:
+            return len(self.columns[name])
+        with open_file(self.fname) as hf:
+            return hf[name].shape[0]
+
+    def add_transform(self, name, function):
+        """ Register a function applied to a dataset when it is read. If the
+        dataset is already in memory, the function is applied right away.
+        """
+        if name in self.columns:
+            self.columns[name] = function(self.columns[name])
+        else:
+            self.transforms[name] = function
+
+    def loaded(self):
+        """ Names of the datasets currently held in memory. """
+        return list(self.columns)
+
+    def print_access(self):
+        """ Prints which datasets were memory-mapped, copied or taken from the
+        cache of derived quantities, with the types of those in memory, which
+        are narrower for repacked files.
+        """
+        print(f"\nColumn access for {self.fname}\n--------------------------------------------------")
+        for name, how in self.access.items():
+            dtype = f" ({self.columns[name].dtype})" if name in self.columns else ""
+            print(f"  {how:>6}  ---  {name}{dtype}")
+        print("\n")
+
+
+class ChunkColumns(Mapping):
+    """ Dictionary-like view of a range of events of the datasets in an open
+    simulation file. Only that range of each dataset is read, so the memory
+    footprint is bounded by the size of the range.
+    """
+
+    def __init__(self, hf, start, stop, transforms=None, columns=None):
+        r"""View of the events in [start, stop).
+        Args:
+            hf (h5py.File): Open simulation file.
+            start (int): First event of the range.
+            stop (int): Event following the last one of the range.
+            transforms (dict): Functions applied to datasets when read.
+            columns (dict): Datasets of the range already read, e.g. by a
+                ChunkReader.
+        """
+        self.hf = hf
+        self.start = start
+        self.stop = stop
+        self.transforms = transforms or {}
+        self.columns = dict(columns or {})
+
+    def __getitem__(self, name):
+        if name not in self.columns:
+            if name not in self.hf:
+                raise KeyError(f"Variable {name} not in {self.hf.filename}.")
+            data = self.hf[name][self.start:self.stop]
+            if name in self.transforms:
+                data = self.transforms[name](data)
+            self.columns[name] = data
+        return self.columns[name]
+
+    def __iter__(self):
+        return iter(self.hf.keys())
+
+    def __len__(self):
+        return len(self.hf.keys())
+
+    def __contains__(self, name):
+        return name in self.hf
+
+    def length(self, name):
+        """ Number of events of the view. """
+        return self.stop - self.start
+
+
+class ChunkReader:
+    """ Reader of ranges of events of a simulation file that prefetches the
+    next ranges in a background thread while the current one is processed.
+    Contiguous datasets are read with plain file reads, which release the
+    GIL, so the reads overlap with the NumPy work of the main thread. The
+    time spent reading, waiting for reads and processing is accumulated.
+    """
+
+    def __init__(self, fname, names, ranges, transforms=None, weights=None,
+                 depth=2, timing=None):
+        r"""Plan the reads.
+        Args:
+            fname (str): Name of simulation file.
+            names ([str]): Datasets read for every range.
+            ranges ([(int, int)]): Ranges [start, stop) of events.
+            transforms (dict): Functions applied to datasets when read.
+            weights (str or array): Dataset of the weights, read for each
+                range like the other datasets, or weights of every event,
+                copied for each range in the background too.
+            depth (int): Number of ranges read ahead; 0 reads every range
+                when it is needed.
+            timing (dict): Seconds spent reading ("read"), waiting for reads
+                ("wait") and processing ("compute"), updated in place.
+        """
+        self.fname = fname
+        self.names = list(names)
+        self.ranges = list(ranges)
+        self.transforms = transforms or {}
+        self.weights = weights
+        self.depth = depth
+        self.timing = {"read": 0., "wait": 0., "compute": 0.} if timing is None else timing
+        for key in ("read", "wait", "compute"):
+            self.timing.setdefault(key, 0.)
+
+        """ Byte offset and type of the contiguous datasets. """
+        self.layout = {}
+        datasets = self.names + [weights] if isinstance(weights, str) else self.names
+        with open_file(fname) as hf:
+            contiguous = hf.driver == "sec2" and hf.userblock_size == 0
+            for name in datasets:
+                ds = hf[name]
+                if (contiguous and ds.chunks is None and ds.external is None
+                        and ds.dtype.kind in "biuf" and ds.ndim == 1):
+                    offset = ds.id.get_offset()
+                    if offset is not None:
+                        self.layout[name] = (offset, ds.dtype)
+
+    def read_dataset(self, f, hf, name, start, stop):
+        """ Read a range of events of a dataset. """
+        if name in self.layout:
+            offset, dtype = self.layout[name]
+            data = np.empty(stop - start, dtype=dtype)
+            view = memoryview(data).cast("B")
+            f.seek(offset + start * dtype.itemsize)
+            done = 0
+            while done < view.nbytes:
+                count = f.readinto(view[done:])
+                if not count:
+                    raise IOError(f"Unexpected end of {self.fname}.")
+                done += count
+        else:
+            data = hf[name][start:stop]
+        if name in self.transforms:
+            data = self.transforms[name](data)
+        return data
+
+    def read(self, f, hf, start, stop):
+        """ Read the datasets and weights of a range of events. """
+        columns = {name: self.read_dataset(f, hf, name, start, stop) for name in self.names}
+        weights = None
+        if isinstance(self.weights, str):
+            weights = self.read_dataset(f, hf, self.weights, start, stop)
+        elif self.weights is not None:
+            weights = np.array(self.weights[start:stop])
+        return columns, weights
+
+    def prefetch(self, *args):
+        """ Read a range of events in the background, timing the read. """
+        begin = perf_counter()
+        result = self.read(*args)
+        self.timing["read"] += perf_counter() - begin
+        return result
+
+    def __iter__(self):
+        """ Yields ((start, stop), datasets, weights) for every range. """
+        with open(self.fname, 'rb', buffering=0) as f, \
+                open_file(self.fname) as hf, \
+                ThreadPoolExecutor(max_workers=1) as pool:
+            pending = deque(
+                pool.submit(self.prefetch, f, hf, *bounds)
+                for bounds in self.ranges[:self.depth])
+            for i, bounds in enumerate(self.ranges):
+                begin = perf_counter()
+                if self.depth:
+                    columns, weights = pending.popleft().result()
+                    if i + self.depth < len(self.ranges):
+                        pending.append(pool.submit(
+                            self.prefetch, f, hf, *self.ranges[i + self.depth]))
+                else:
+                    columns, weights = self.read(f, hf, *bounds)
+                waited = perf_counter()
+                self.timing["wait"] += waited - begin
+                profiler.read(sum(data.nbytes for data in columns.values()))
+                yield bounds, columns, weights
+                self.timing["compute"] += perf_counter() - waited
+
+
+def print_timing(fname, timing):
+    """ Prints the time spent reading a file in the background, waiting for
+    the reads and processing the data.
+    """
+    print(f"\nI/O of {fname}\n--------------------------------------------------")
+    print(f"  read     {timing.get('read', 0.):8.3f} s (background)")
+    print(f"  wait     {timing.get('wait', 0.):8.3f} s")
+    print(f"  compute  {timing.get('compute', 0.):8.3f} s")
+    print("\n")
+
+
+def print_inspection(fname):
+    """ Prints the attributes and datasets of a simulation file, read from
+    its metadata only.
+    """
+    attrs, datasets = inspect_file(fname)
+    print(f"\nDatasets of {fname}\n--------------------------------------------------")
+    for key, value in attrs.items():
+        print(f"  @{key} = {value}")
+    print(f"  {'name':>20}  {'shape':>12}  {'type':>8}  {'chunks':>10}  {'filter':>6}  {'MB':>8}")
+    for name, info in datasets.items():
+        chunks = info["chunks"][0] if info["chunks"] else "-"
+        print(f"  {name:>20}  {str(info['shape']):>12}  {str(info['dtype']):>8}  "
+              f"{chunks:>10}  {info['compression'] or '-':>6}  {info['stored'] / 1e6:>8.2f}")
+    print("\n")
@@ -1,12 +1,29 @@
-import h5py
-import matplotlib.pyplot as plt
+import hashlib
 from math import sqrt
+import os
 import numpy as np
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from itertools import product, repeat
+from binning import Linear, Log, merge_ranges, value_range
+from cache import DerivedCache
+from categories import CategoryIndex
+from columns import ChunkColumns, ChunkReader, LazyColumns, open_file, print_timing
+from export import write_histograms
+from flux import flux_systematics
+from histogram import (Chunk, HistogramAccumulator, Histograms, accumulate, digitize,
+                       histogram, histogram_nd, sample_edges)
+from hypotheses import MEMORY_BUDGET, batched_histograms
+from oscillation import EarthModel, Oscillator, ProbabilityTable
+from profiling import profiler, timed
+from resampling import resample
+from response import ResponseMatrix
+from store import HistogramStore
 
 
 class Experiment:
-    def __init__(self, fname, variables, flavors, cp, interaction, samples):
+    def __init__(self, fname, variables, flavors, cp,
+                 interaction, samples, mmap=True, cache=True, store=True):
         r"""Method for modifying the atmospheric flux normalization.
         Args:
             fname (str): Name of simulation file.
@@ -15,25 +32,124 @@ class Experiment:
             cp (str): Neutrinos, antineutrinos or both.
             interaction (str): Interaction modes to be plotted.
             samples ([str]): List of samples to be plotted
+            mmap (bool): Memory-map contiguous datasets instead of copying.
+            cache (bool): Keep the derived columns and scalars in the on-disk
+                cache of derived quantities.
+            store (bool): Keep the histograms in the histogram store, within
+                the cache of derived quantities, and reuse them.
         """
-        self.fdata = {}
-        with h5py.File(fname, 'r') as hf:
-            for var in hf.keys():
-                self.fdata[var] = np.array(hf[var])
+        with profiler.stage("open file"):
+            self.fdata = LazyColumns(fname, mmap=mmap)
+        self.cache = None
+        if cache:
+            with profiler.stage("hash file"):
+                self.cache = DerivedCache(fname, type(self).__name__)
+            self.fdata.cache = self.cache
 
         self.plotting_variables = variables
         self.plotting_flavors = flavors
         self.plotting_cp = cp
         self.plotting_interaction = interaction
         self.plotting_samples = samples
+        self.plotting_heatmaps = []
         self.variable_names = {}
         self.variable_labels = {}
+        self.variable_binning = {}
+        self.edges = {}
+        self.bins = {}
         self.aux_variables = {}
+        self.cut_variables = []
         self.samples = []
+        self.index = None
+        self.true_variables = {}
+        self.reco_variables = {}
+        self.earth = EarthModel()
+        self.oscillators = {}
+        self.probability_table = None
+        self.io_timing = {}
+        self.flux_site = None
+        self.fluxes = {}
+        self.weights = None
+        self.weight_tag = "nominal"
+        self.weight_column = None
+        self.normalization = 1.
+        self.number_of_events = None
+        self.store = HistogramStore(self) if store and self.cache is not None else None
 
+    @property
+    def weights(self):
+        """ Weight of every event. Subclasses may set it to a function of no
+        arguments, called the first time the weights are needed, so that
+        the file is not read when every result comes from the caches.
+        """
+        if callable(self._weights):
+            with profiler.stage("weights"):
+                self._weights = self._weights()
+        return self._weights
+
+    @weights.setter
+    def weights(self, value):
+        self._weights = value
+
+    @property
+    def normalization(self):
+        """ Factor scaling the weights to events per year. Subclasses may
+        set it to a function of no arguments, called the first time it is
+        needed, e.g. when it depends on the sum of the weights of every
+        event.
+        """
+        if callable(self._normalization):
+            self._normalization = self._normalization()
+        return self._normalization
+
+    @normalization.setter
+    def normalization(self, value):
+        self._normalization = value
+
+    def scale_normalization(self, factor):
+        """ Scale the normalization by a factor, without computing it when
+        it is deferred.
+        """
+        normalization = self._normalization
+        if callable(normalization):
+            self._normalization = lambda: normalization() * factor
+        else:
+            self._normalization = normalization * factor
+
+    def get_number_of_events(self):
+        """ Sum of the nominal weights of every event, kept in the cache of
+        derived quantities. Streaming the nominal weights sets it from the
+        sums of the chunks, so the weight column is not read at once.
+        """
+        if self.number_of_events is None:
+            self.number_of_events = float(self.derived(
+                "number_of_events", lambda: np.sum(self.get_weights())))
+        return self.number_of_events
+
+    def sample_indices(self, samples):
+        """ Indices of samples given by index or by name (e.g. tracks,
+        cascades or intermediate for IC and ORCA), as a list or a comma
+        separated string.
+        """
+        if isinstance(samples, str):
+            samples = samples.split(",")
+        names = [name.lower() for name in self.samples]
+        indices = []
+        for sample in samples:
+            sample = str(sample).strip()
+            if sample.lower() in names:
+                indices.append(names.index(sample.lower()))
+            else:
+                try:
+                    indices.append(int(sample))
+                except ValueError:
+                    raise ValueError(f"Unknown sample {sample}.") from None
+        return indices
+
+    @timed("cuts_and_breakdown")
     def cuts_and_breakdown(self):
         """ Computes the cuts and breakdowns for the plots based on the
-        input parameters.
+        input parameters. Cuts are selections of categories of the event index.
         Returns:
             [Name of cut, List of cuts]
         """
@@ -43,47 +159,39 @@ class Experiment:
         if self.plotting_samples == "All":
             self.plotting_samples = range(len(self.samples))
         else:
-            if "tracks" in self.plotting_samples:
-                i = self.plotting_samples.index("cascades")
-                self.plotting_samples[i] = 0
-            elif "cascades" in self.plotting_samples:
-                i = self.plotting_samples.index("tracks")
-                self.plotting_samples[i] = 1
-            elif "intermediate" in self.plotting_samples:
-                i = self.plotting_samples.index("intermediate")
-                self.plotting_samples[i] = 2
-            else:
-                self.plotting_samples = list(map(int, self.plotting_samples))
+            self.plotting_samples = self.sample_indices(self.plotting_samples)
         """ Flavors """
         if self.plotting_flavors == "e":
-            self.plotting_flavors = [self.get_nue()]
+            self.plotting_flavors = [self.get_nue]
         elif self.plotting_flavors == "mu":
-            self.plotting_flavors = [self.get_numu()]
+            self.plotting_flavors = [self.get_numu]
         elif self.plotting_flavors == "e+mu":
-            self.plotting_flavors = [self.get_numu(), self.get_nue()]
+            self.plotting_flavors = [self.get_numu, self.get_nue]
         elif self.plotting_flavors == "tau":
-            self.plotting_flavors = [self.get_nutau()]
+            self.plotting_flavors = [self.get_nutau]
         """ (Anti)neutrinos """
         if self.plotting_cp == "nu":
-            self.plotting_cp = [self.get_neutrino()]
+            self.plotting_cp = [self.get_neutrino]
         elif self.plotting_cp == "antinu":
-            self.plotting_cp = [self.get_antineutrino()]
+            self.plotting_cp = [self.get_antineutrino]
         elif self.plotting_cp == "both":
-            self.plotting_cp = [self.get_neutrino(), self.get_antineutrino()]
+            self.plotting_cp = [self.get_neutrino, self.get_antineutrino]
         """ Interactions """
         if self.plotting_interaction == "CC":
-            self.plotting_interaction = [self.get_CC()]
+            self.plotting_interaction = [self.get_CC]
         elif self.plotting_interaction == "NC":
-            self.plotting_interaction = [self.get_NC()]
+            self.plotting_interaction = [self.get_NC]
         elif self.plotting_interaction == "ALL":
-            self.plotting_interaction = [self.get_CC(), self.get_NC()]
+            self.plotting_interaction = [self.get_CC, self.get_NC]
         elif not self.plotting_interaction:
-            self.plotting_interaction = [self.get_alltrue()]
+            self.plotting_interaction = [self.get_alltrue]
         """ Combine cuts and labels. """
+        categories = self.get_categories()
         for fl, cp, mode in product(
                 self.plotting_flavors, self.plotting_cp, self.plotting_interaction):
-            cuts.append(mode[1] * cp[1] * fl[1])
-            cut_labels.append(mode[0] + cp[0] + fl[0])
+            label, cut = categories.cut([mode, cp, fl])
+            cuts.append(cut)
+            cut_labels.append(label)
         return cuts, cut_labels
 
     def print_samples(self):
@@ -94,6 +202,157 @@ class Experiment:
             print(f"  {i}  ---  {name}")
         print("\n")
 
+    def print_variables(self):
+        """ Prints the variables of the given experiment found in the
+        simulation file, with the names they can be requested by.
+        """
+        print(
+            f"\nList of variables for {self.experiment}\n--------------------------------------------------\nName in file  -  Names")
+        for variable, names in self.variable_names.items():
+            if variable in self.fdata:
+                print(f"  {variable:>18}  ---  {', '.join(names)}")
+        print("\n")
+
+    def get_index(self):
+        """ Categorical index of the events by sample, interaction, CP and
+        flavor. It is built from the cut getters the first time it is needed.
+        """
+        if self.index is None:
+            with profiler.stage("index"):
+                self.index = CategoryIndex(
+                    [("interaction", [self.get_CC, self.get_NC]),
+                     ("cp", [self.get_neutrino, self.get_antineutrino]),
+                     ("flavor", [self.get_nue, self.get_numu, self.get_nutau])],
+                    self.get_sample,
+                    len(self.samples),
+                    wildcards=[self.get_alltrue])
+        return self.index
+
+    def get_categories(self):
+        """ Layout of the categories of the index, used to turn cut getters
+        into selections of categories. With a histogram store it is taken
+        from the store, so that the index is only built when events have to
+        be histogrammed.
+        """
+        if self.index is not None or self.store is None:
+            return self.get_index()
+        return self.store.categories()
+
+    def get_oscillator(self, resolution=None):
+        """ Oscillation engine for the events of the experiment, built from the
+        true energy, zenith and flavor the first time it is needed for a
+        resolution.
+        Args:
+            resolution ((float, float)): Bin widths in log10(energy) and cosine
+                zenith of events sharing their probabilities. None computes
+                them for every event.
+        """
+        key = None if resolution is None else tuple(resolution)
+        if key not in self.oscillators:
+            self.oscillators[key] = Oscillator(
+                self.fdata[self.true_variables["energy"]],
+                self.fdata[self.true_variables["coszen"]],
+                self.fdata[self.true_variables["flavor"]] < 0,
+                earth=self.earth,
+                resolution=key)
+        return self.oscillators[key]
+
+    def get_probability_table(self, **options):
+        """ Grid of oscillation probabilities interpolated for the events of
+        the experiment, built the first time it is needed. The options are
+        passed to oscillation.ProbabilityTable.
+        """
+        if self.probability_table is None:
+            self.probability_table = ProbabilityTable(
+                self.fdata[self.true_variables["energy"]],
+                self.fdata[self.true_variables["coszen"]],
+                self.fdata[self.true_variables["flavor"]] < 0,
+                earth=self.earth,
+                **options)
+        return self.probability_table
+
+    def get_osc_weights(self, params=None, flux_ratio=0.5, interpolate=False,
+                        resolution=None):
+        r"""Method for getting the oscillation weights of the events.
+        Args:
+            params (dict): Oscillation parameters, oscillation.DEFAULT_PARAMS
+                if None.
+            flux_ratio (float or array): Ratio of the electron to muon
+                neutrino flux of each event.
+            interpolate (bool): Interpolate the probabilities on the grid of
+                get_probability_table instead of computing them per event.
+            resolution ((float, float)): Bin widths in log10(energy) and cosine
+                zenith of events sharing their probabilities, see
+                get_oscillator. Not used when interpolating.
+        """
+        if interpolate:
+            engine = self.get_probability_table()
+        else:
+            engine = self.get_oscillator(resolution)
+        return engine.weights(
+            self.fdata[self.true_variables["flavor"]], params, flux_ratio)
+
+    def get_response(self, true_edges=None, reco_edges=None):
+        """ Detector response of the experiment from true to reconstructed
+        energy and cosine zenith, per sample and channel, for folding
+        predictions without the events. The edges default to the binning of
+        the true and reconstructed variables, see
+        response.ResponseMatrix.build.
+        """
+        with profiler.stage("response"):
+            return ResponseMatrix.build(self, true_edges, reco_edges)
+
+    def get_flux(self, table):
+        """ Flux of a flux table at the true energy, cosine zenith and flavor
+        of every event, at the site of the experiment. It is interpolated
+        once per table and kept in memory and in the on-disk cache, keyed by
+        the content of the table and of the simulation file.
+        Args:
+            table (flux.FluxTable): Atmospheric flux table.
+        """
+        key = f"flux_{self.flux_site}_{table.digest}"
+        if key not in self.fluxes:
+            self.fluxes[key] = self.derived(key, lambda: table.evaluate(
+                self.fdata[self.true_variables["energy"]],
+                self.fdata[self.true_variables["coszen"]],
+                self.fdata[self.true_variables["flavor"]],
+                self.flux_site))
+        return self.fluxes[key]
+
+    def get_flux_reweighting(self, table, tilt=0., nubar=0.):
+        r"""Weights of the events for the flux of a flux table: the weights
+        per unit flux of the simulation times the interpolated flux, scaled
+        by the flux systematics.
+        Args:
+            table (flux.FluxTable): Atmospheric flux table.
+            tilt (float): Change of the spectral index around
+                fit.PIVOT_ENERGY.
+            nubar (float): Relative shift of the neutrino (+) and
+                antineutrino (-) fluxes.
+
+        Returns:
+            Array with the weight of each event.
+        """
+        weights = self.get_generation_weights() * self.get_flux(table)
+        if tilt != 0 or nubar != 0:
+            weights = weights * flux_systematics(
+                self.fdata[self.true_variables["energy"]],
+                self.fdata[self.true_variables["flavor"]], tilt, nubar)
+        return weights
+
+    def set_flux(self, table, tilt=0., nubar=0.):
+        """ Use the weights of a flux table, see get_flux_reweighting, for
+        the histograms of the experiment. They are computed when first
+        needed, and the histogram store keeps them apart from those of other
+        fluxes.
+        """
+        self.weights = lambda: self.get_flux_reweighting(table, tilt, nubar)
+        self.weight_tag = f"flux_{table.digest}_{tilt:g}_{nubar:g}"
+
+    def get_generation_weights(self):
+        """ Early definition of method for getting the weights per unit flux. """
+        pass
+
     def get_CC(self):
         """ Early definition of method for getting charged-current events. """
         pass
@@ -145,47 +404,566 @@ class Experiment:
         print(f'Variable {variable_name} not found.')
         return False
 
-    def plot(self):
-        """ Plot all the variables requested. """
-        cuts, cut_labels = self.cuts_and_breakdown()
+    def derived(self, name, compute):
+        """ Quantity derived from the simulation file, taken from the on-disk
+        cache when enabled.
+        Args:
+            name (str): Name of the derived quantity.
+            compute (callable): Function computing the quantity.
+        """
+        with profiler.stage(f"derived {name}"):
+            if self.cache is None:
+                return compute()
+            return self.cache.get(name, compute)
+
+    def get_binning(self, variable):
+        """ Binning specification of a variable, from variable_binning, 20
+        equally spaced bins over the range of the variable by default.
+        """
+        return self.variable_binning.get(variable, Linear())
+
+    def binning_key(self, variable):
+        """ Digest of the binning of a variable, with the weights for the
+        binnings depending on them.
+        """
+        spec = self.get_binning(variable)
+        key = spec.key() + (self.weight_tag if spec.needs_values else "")
+        return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+    def get_edges(self, variable, column_range=None):
+        r"""Bin edges of a variable given by its binning specification,
+        shared by every sample and cut. They are computed once from all the
+        events, and kept in the cache of derived quantities.
+        Args:
+            variable (str): Name of the variable in the simulation file.
+            column_range (callable): Function returning the range of the
+                variable as binning.value_range, e.g. over chunks of events.
+                Defaults to the range of the loaded column.
+
+        Returns:
+            Array of bin edges.
+        """
+        key = (variable, self.binning_key(variable))
+        if key not in self.edges:
+            spec = self.get_binning(variable)
+
+            def compute():
+                if spec.needs_values:
+                    return spec.quantile_edges(self.fdata[variable], self.weights)
+                if column_range is not None:
+                    return spec.edges(*column_range())
+                return spec.edges(*value_range(self.fdata[variable]))
+
+            self.edges[key] = np.array(
+                self.derived(f"edges_{variable}_{key[1]}", compute), dtype=float)
+        return self.edges[key]
+
+    def get_bins(self, variable):
+        """ Bin of every event for a variable, computed once and shared by
+        the histograms of every sample and cut.
+        """
+        key = (variable, self.binning_key(variable))
+        if key not in self.bins:
+            with profiler.stage("binning"):
+                self.bins[key] = digitize(self.fdata[variable], self.get_edges(variable))
+        return self.bins[key]
+
+    def print_io_timing(self):
+        """ Prints the time spent reading the simulation file in chunks and
+        processing them.
+        """
+        print_timing(self.fdata.fname, self.io_timing)
+
+    def plotted_variables(self):
+        """ Names in the simulation file of the variables requested for
+        plotting.
+        """
+        plotted = []
+        for variable_name in self.plotting_variables:
+            for variable, names in self.variable_names.items():
+                if variable_name in names:
+                    plotted.append(variable)
+                    break
+        return [var for var in dict.fromkeys(plotted) if var in self.fdata]
+
+    def required_variables(self):
+        """ Names of the datasets needed for the requested plots, the cuts
+        and the weights. Only the dataset of the weights in use is needed,
+        not every auxiliary variable.
+        """
+        required = self.plotted_variables()
+        for names in self.plotting_heatmaps:
+            required += [self.find_variable(name) for name in names]
+        if self.weight_column is not None and self.weight_tag == "nominal":
+            required.append(self.weight_column)
+        required += list(self.cut_variables)
+        return [var for var in dict.fromkeys(required) if var in self.fdata]
+
+    def figure_name(self, names, fmt="png", tag=None):
+        r"""File name of the figure of a variable, or of the heat map of a
+        pair of variables, as saved by plot and batch.render.
+        Args:
+            names (str or [str]): Variable, or variables of the heat map, as
+                requested.
+            fmt (str): Format of the figure (png or pdf).
+            tag (str): Prefix naming the experiment, the name of its class by
+                default.
+        """
+        names = [names] if isinstance(names, str) else list(names)
+        tag = type(self).__name__ if tag is None else tag
+        return f"{tag}_{'_vs_'.join(names)}.{fmt}"
+
+    def plot(self, output=None, fmt="png", chunk_size=None, tag=None):
+        """ Plot all the variables and heat maps requested.
+        Args:
+            output (str): Directory where the figures are saved. Figures are
+                displayed when no directory is given.
+            fmt (str): Format of the saved figures (png or pdf).
+            chunk_size (int): Compute the histograms over chunks of this many
+                events instead of loading the columns in memory.
+            tag (str): Prefix of the names of the saved figures, see
+                figure_name.
+        """
+        streamed = {}
+        if chunk_size is None:
+            if self.store is None:
+                self.fdata.load(self.required_variables())
+            cuts, cut_labels = self.cuts_and_breakdown()
+        elif self.plotting_heatmaps:
+            raise ValueError("Heat maps are not computed over chunks.")
+        else:
+            with profiler.stage("stream"):
+                streamed = self.streamed_histograms(self.plotted_variables(), chunk_size)
+            cuts, cut_labels = None, None
+        if output is not None:
+            os.makedirs(output, exist_ok=True)
+        for var in self.plotting_variables:
+            fname = None
+            if output is not None:
+                fname = os.path.join(output, self.figure_name(var, fmt, tag))
+            self.plot_variable(var, cuts, cut_labels, fname=fname, histograms=streamed)
+        for names in self.plotting_heatmaps:
+            fname = None
+            if output is not None:
+                fname = os.path.join(output, self.figure_name(names, fmt, tag))
+            self.plot_heatmap(names, cuts, cut_labels, fname=fname)
+
+    def provenance(self):
+        """ Description of the input file and settings the histograms of the
+        experiment are computed from.
+        """
+        stat = os.stat(self.fdata.fname)
+        return {
+            "experiment": self.experiment,
+            "class": type(self).__name__,
+            "input_file": os.path.realpath(self.fdata.fname),
+            "input_size": stat.st_size,
+            "input_mtime": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+            "input_hash": None if self.cache is None else self.cache.hash,
+            "normalization": float(self.normalization),
+            "weights": self.weight_tag,
+            "flavors": [getter.__name__ for getter in self.plotting_flavors],
+            "cp": [getter.__name__ for getter in self.plotting_cp],
+            "interaction": [getter.__name__ for getter in self.plotting_interaction],
+            "created": datetime.now(timezone.utc).isoformat()}
+
+    def export(self, fname, chunk_size=None, replicas=0, method="poisson", seed=0):
+        """ Write the weighted and normalized histograms of the variables
+        requested for plotting, with the sums of squared weights for the
+        statistical errors of the simulation and the provenance of the input
+        file, without drawing them. The format (HDF5, NPZ or CSV) is given by
+        the extension of fname, see export.write_histograms.
+        Args:
+            fname (str): Name of the export file.
+            chunk_size (int): Compute the histograms over chunks of this many
+                events instead of loading the columns in memory.
+            replicas (int): Number of replicas of the simulation whose
+                histograms are exported too, see replica_histograms.
+            method (str): Resampling method of the replicas.
+            seed (int): Seed of the random streams of the replicas.
+        """
+        resampled = {}
+        if replicas:
+            if chunk_size is not None:
+                raise ValueError("Replicas are not computed over chunks.")
+            self.fdata.load(self.required_variables())
+            cuts, cut_labels = self.cuts_and_breakdown()
+            result = self.replica_histograms(
+                self.plotted_variables(), cuts, cut_labels, replicas, method, seed)
+            computed = {var: hists for var, (hists, __) in result.items()}
+            resampled = {var: sumw for var, (__, sumw) in result.items()}
+        elif chunk_size is None:
+            if self.store is None:
+                self.fdata.load(self.required_variables())
+            cuts, cut_labels = self.cuts_and_breakdown()
+            computed = {var: self.histograms(var, cuts, cut_labels)
+                        for var in self.plotted_variables()}
+        else:
+            with profiler.stage("stream"):
+                computed = self.streamed_histograms(self.plotted_variables(), chunk_size)
+        histograms, labels, replica_sumw = {}, {}, {}
         for var in self.plotting_variables:
-            self.plot_variable(var, cuts, cut_labels)
+            variable = self.find_variable(var)
+            if variable and variable in computed:
+                histograms[var] = computed[variable]
+                labels[var] = self.variable_labels[variable]
+                if variable in resampled:
+                    replica_sumw[var] = resampled[variable]
+        if not histograms:
+            raise ValueError(f"No variable of {self.experiment} to export.")
+        samples = histograms[next(iter(histograms))].samples
+        metadata = self.provenance()
+        if replicas:
+            metadata.update(replicas=replicas, resampling=method, seed=seed)
+        with profiler.stage("export"):
+            write_histograms(fname, histograms, [self.samples[s] for s in samples],
+                             labels, metadata, replica_sumw)
+
+    @contextmanager
+    def chunk(self, hf, start, stop, columns=None, weights=None):
+        """ Evaluate the cut getters and weights on a range of events only.
+        Inside the context, fdata, weights and the index of the experiment
+        refer to the events in [start, stop), and the index is returned.
+        Args:
+            hf (h5py.File): Open simulation file.
+            start (int): First event of the range.
+            stop (int): Event following the last one of the range.
+            columns (dict): Datasets of the range already read.
+            weights (array): Weights of the range already read. Without
+                them, the nominal weights are read from the range of the
+                weight dataset.
+        """
+        if weights is None:
+            if self.weight_column is not None and self.weight_tag == "nominal":
+                """ Range of the weight dataset, read when first needed. """
+                weights = lambda: self.fdata[self.weight_column]
+            else:
+                weights = self.weights[start:stop]
+        saved = self.fdata, self._weights, self.index
+        self.fdata = ChunkColumns(hf, start, stop, saved[0].transforms, columns)
+        self.weights = weights
+        self.index = None
+        try:
+            yield self.get_index()
+        finally:
+            self.fdata, self.weights, self.index = saved
+
+    def stream(self, variables, chunk_size=1000000, edges=None, prefetch=2):
+        r"""Histograms of variables in the simulation file computed over
+        chunks of events, so the memory footprint is bounded by the chunk
+        size. The columns are read from the file chunk by chunk, prefetching
+        the next chunks in the background, and the cut getters and weights
+        are evaluated on each chunk. The time spent reading and processing
+        is accumulated in io_timing.
+        Args:
+            variables ([str]): Names of the variables in the simulation file.
+            chunk_size (int): Number of events per chunk, rounded to whole
+                chunks of the datasets of repacked files.
+            edges ({str: array}): Bin edges of variables. The others follow
+                their binning specification as in histograms, with the range
+                of the variable found in a first pass over the chunks unless
+                the edges are cached. Quantile bins read the whole column.
+            prefetch (int): Number of chunks read ahead in the background; 0
+                reads each chunk when it is needed.
+
+        Yields:
+            Chunk with the unnormalized histograms of the events of a chunk.
+        """
+        nevents = self.fdata.length(self.true_variables["energy"])
+        if self.fdata.chunk_events:
+            """ Whole chunks of repacked files, so none is decompressed twice. """
+            step = self.fdata.chunk_events
+            chunk_size = max(1, round(chunk_size / step)) * step
+        ranges = [(start, min(start + chunk_size, nevents))
+                  for start in range(0, nevents, chunk_size)]
+
+        def column_range(var):
+            """ Range of a variable over the chunks. """
+            result = value_range([])
+            for __, columns, __ in ChunkReader(
+                    self.fdata.fname, [var], ranges, self.fdata.transforms,
+                    None, prefetch, self.io_timing):
+                result = merge_ranges(result, value_range(columns[var]))
+            return result
+
+        edges = dict(edges or {})
+        for var in variables:
+            if var not in edges:
+                edges[var] = self.get_edges(var, lambda: column_range(var))
 
-    def plot_variable(self, variable_name, cuts, cut_labels):
-        """ Find and plot a given variable. """
+        with open_file(self.fdata.fname) as hf:
+            with self.chunk(hf, *ranges[0]):
+                cuts, cut_labels = self.cuts_and_breakdown()
+            samples = list(self.plotting_samples)
+            distinct = list(dict.fromkeys(samples))
+            rows = [distinct.index(s) for s in samples]
+            cut_variables = [var for var in self.cut_variables if var in self.fdata]
+            """ The nominal weights are read chunk by chunk from their
+            dataset, other weights are computed for every event.
+            """
+            streamed = self.weight_column is not None and self.weight_tag == "nominal"
+            reader = ChunkReader(
+                self.fdata.fname, list(dict.fromkeys(cut_variables + list(variables))),
+                ranges, self.fdata.transforms,
+                self.weight_column if streamed else self.weights,
+                prefetch, self.io_timing)
+            for (start, stop), columns, weights in reader:
+                with self.chunk(hf, start, stop, columns, weights) as index:
+                    hists = {}
+                    for var in variables:
+                        sumw, sumw2 = accumulate(
+                            index, digitize(self.fdata[var], edges[var]),
+                            len(edges[var]) - 1, self.weights, cuts, distinct)
+                        hists[var] = Histograms(
+                            var, samples, cut_labels, sample_edges(edges[var], samples),
+                            sumw[rows], sumw2[rows])
+                    sum_weights = float(np.sum(self.weights))
+                yield Chunk(start, stop, hists, sum_weights)
+
+    def streamed_histograms(self, variables, chunk_size=1000000, **options):
+        """ Weighted and normalized histograms of variables in the simulation
+        file accumulated over chunks of events. They match those of
+        histograms. The options are passed to stream.
+        Returns:
+            {variable: Histograms}
+        """
+        accumulator = HistogramAccumulator()
+        for chunk in self.stream(variables, chunk_size, **options):
+            accumulator.add(chunk)
+        if self.weight_column is not None and self.weight_tag == "nominal":
+            """ The chunks summed the nominal weights of every event. """
+            self.number_of_events = float(self.derived(
+                "number_of_events", lambda: accumulator.sum_weights))
+        return accumulator.result(self.normalization)
+
+    @timed("histograms")
+    def histograms(self, variable, cuts, cut_labels):
+        """ Weighted and normalized histograms of a variable in the simulation
+        file for every requested sample and cut.
+        Args:
+            variable (str): Name of the variable in the simulation file.
+            cuts ([array]): Cuts as returned by cuts_and_breakdown.
+            cut_labels ([str]): Labels of the cuts.
+
+        Returns:
+            Histograms with the sum of weights per [sample, cut, bin].
+        """
+        edges = self.get_edges(variable)
+        if self.store is not None:
+            hists = self.store.histogram(
+                variable, cuts, cut_labels, self.plotting_samples, edges)
+            return hists.scale(self.normalization)
+        hists = histogram(
+            self.get_index(),
+            variable,
+            self.get_bins(variable),
+            edges,
+            self.weights,
+            cuts,
+            cut_labels,
+            self.plotting_samples)
+        return hists.scale(self.normalization)
+
+    @timed("histograms_nd")
+    def histograms_nd(self, variables, cuts, cut_labels):
+        """ Weighted and normalized N-dimensional histograms of variables in
+        the simulation file for every requested sample and cut, e.g. reco
+        energy and cosine zenith, or the true versus reconstructed energy
+        migration. Each variable keeps its own binning.
+        Args:
+            variables ([str]): Names of the variables in the simulation file.
+            cuts ([array]): Cuts as returned by cuts_and_breakdown.
+            cut_labels ([str]): Labels of the cuts.
+
+        Returns:
+            HistogramsND with the sums of weights of the non-empty bins.
+        """
+        hists = histogram_nd(
+            self.get_index(),
+            variables,
+            [self.get_bins(var) for var in variables],
+            [self.get_edges(var) for var in variables],
+            self.weights,
+            cuts,
+            cut_labels,
+            self.plotting_samples)
+        return hists.scale(self.normalization)
+
+    @timed("replicas")
+    def replica_histograms(self, variables, cuts, cut_labels, replicas=100,
+                           method="poisson", seed=0, workers=1):
+        r"""Histograms of Poisson or bootstrap replicas of the simulation, for
+        the statistical uncertainty of the simulation, computed in one
+        batched pass with the binning of the nominal histograms. Every
+        replica has its own random stream spawned from the seed, so the
+        results do not depend on the number of threads.
+        Args:
+            variables ([str]): Names of the variables in the simulation file.
+            cuts ([array]): Cuts as returned by cuts_and_breakdown.
+            cut_labels ([str]): Labels of the cuts.
+            replicas (int): Number of replicas.
+            method (str): poisson or bootstrap.
+            seed (int): Seed of the random streams.
+            workers (int): Number of threads computing the replicas.
+
+        Returns:
+            {variable: (nominal Histograms, normalized sums of weights of the
+            replicas with shape [replica, sample, cut, bin])}
+        """
+        nominal = {var: self.histograms(var, cuts, cut_labels) for var in variables}
+        samples = list(self.plotting_samples)
+        distinct = list(dict.fromkeys(samples))
+        rows = [distinct.index(s) for s in samples]
+        sumw = resample(
+            self.get_index(), {var: self.get_bins(var) for var in variables},
+            {var: self.get_edges(var) for var in variables},
+            self.weights, cuts, distinct, replicas, method, seed, workers)
+        return {var: (nominal[var], sumw[var][:, rows] * self.normalization)
+                for var in variables}
+
+    @timed("hypotheses")
+    def hypothesis_histograms(self, variables, cuts, cut_labels, hypotheses,
+                              flux_ratio=0.5, memory=MEMORY_BUDGET):
+        r"""Histograms of a batch of hypotheses on the flux normalization,
+        spectral tilt, neutrino/antineutrino ratio and oscillation
+        parameters, computed in one blocked sweep over the events, e.g. for
+        the points of a scan. The oscillation probabilities are interpolated
+        on the grid of get_probability_table.
+        Args:
+            variables ([str]): Names of the variables in the simulation file.
+            cuts ([array]): Cuts as returned by cuts_and_breakdown.
+            cut_labels ([str]): Labels of the cuts.
+            hypotheses ([dict]): Hypotheses with norm, tilt, nubar and the
+                oscillation parameters params, see
+                hypotheses.hypothesis_parameters.
+            flux_ratio (float or array): Ratio of the electron to muon
+                neutrino flux of each event.
+            memory (float): Memory budget in bytes of the [hypothesis, event]
+                arrays of a block of events.
+
+        Returns:
+            {variable: normalized sums of weights with shape [hypothesis,
+            sample, cut, bin]}
+        """
+        samples = list(self.plotting_samples)
+        distinct = list(dict.fromkeys(samples))
+        rows = [distinct.index(s) for s in samples]
+        oscillated = any(h.get("params") is not None for h in hypotheses)
+        sumw = batched_histograms(
+            self.get_index(), {var: self.get_bins(var) for var in variables},
+            {var: self.get_edges(var) for var in variables},
+            self.weights, cuts, distinct, hypotheses,
+            self.fdata[self.true_variables["energy"]],
+            self.fdata[self.true_variables["flavor"]],
+            self.get_probability_table() if oscillated else None,
+            flux_ratio, memory)
+        return {var: sumw[var][:, rows] * self.normalization for var in variables}
+
+    @timed("plot_variable")
+    def plot_variable(self, variable_name, cuts, cut_labels, fname=None,
+                      histograms=None, fmt=None):
+        """ Find and plot a given variable. The figure is saved to fname, a
+        file name or a binary file object, in the format fmt (taken from the
+        file name if None) if given and displayed otherwise. Histograms
+        already computed, e.g. by streamed_histograms, can be given by
+        variable.
+        """
         variable = self.find_variable(variable_name)
         if variable:
-            """ Select variable data """
-            array = self.fdata[variable]
-            """ Setup plots """
-            rows, cols = self.grid_plots()
-            fig, axes = plt.subplots(
-                nrows=rows, ncols=cols, figsize=(
-                    3 * cols, 2.75 * rows))
-            axis = axes.flat
-            for i, s in enumerate(self.plotting_samples):
-                bins = 20
-                for k, (c, ctag) in enumerate(zip(cuts, cut_labels)):
-                    cut_and_sample = c * self.get_sample(s)
-                    __, bins, __ = axis[i].hist(
-                        array[cut_and_sample], weights=self.normalization * self.weights[cut_and_sample],
-                        bins=bins, stacked=True, label=ctag)
-                axis[i].set_title(self.samples[s], fontsize=9)
-                axis[i].set_xlabel(self.variable_labels[variable], fontsize=8)
-                axis[i].legend(
-                    loc="best",
-                    fontsize=7,
-                    labelspacing=0.1,
-                    ncol=2)
-                ymin, ymax = axis[i].get_ylim()
-                if self.variable_logscale[variable]:
-                    axis[i].set_ylim([0.00001 * ymax, 5 * ymax])
-                    axis[i].set_yscale("log")
+            """ Histograms of the variable data """
+            if histograms and variable in histograms:
+                hists = histograms[variable]
+            else:
+                hists = self.histograms(variable, cuts, cut_labels)
+            with profiler.stage("rendering"):
+                """ pyplot is imported when a figure is drawn, so that runs
+                without figures never load matplotlib.
+                """
+                import matplotlib.pyplot as plt
+                """ Setup plots """
+                rows, cols = self.grid_plots()
+                fig, axes = plt.subplots(
+                    nrows=rows, ncols=cols, figsize=(
+                        3 * cols, 2.75 * rows), squeeze=False)
+                axis = axes.flat
+                for i, s in enumerate(self.plotting_samples):
+                    bins = hists.edges[i]
+                    for k, ctag in enumerate(hists.cut_labels):
+                        axis[i].hist(
+                            bins[:-1], weights=hists.sumw[i, k],
+                            bins=bins, stacked=True, label=ctag)
+                    axis[i].set_title(self.samples[s], fontsize=9)
+                    axis[i].set_xlabel(self.variable_labels[variable], fontsize=8)
+                    if isinstance(self.get_binning(variable), Log):
+                        axis[i].set_xscale("log")
+                    axis[i].legend(
+                        loc="best",
+                        fontsize=7,
+                        labelspacing=0.1,
+                        ncol=2)
+                    ymin, ymax = axis[i].get_ylim()
+                    if self.variable_logscale[variable]:
+                        axis[i].set_ylim([0.00001 * ymax, 5 * ymax])
+                        axis[i].set_yscale("log")
+                    else:
+                        axis[i].set_ylim([0, 1.5 * ymax])
+                fig.tight_layout()
+            with profiler.stage("figure output"):
+                if fname is None:
+                    plt.show()
+                    plt.clf()
+                else:
+                    fig.savefig(fname, format=fmt)
+                    plt.close(fig)
+
+    @timed("plot_heatmap")
+    def plot_heatmap(self, variable_names, cuts, cut_labels, fname=None,
+                     histograms=None, fmt=None):
+        """ Find two variables and plot their 2D histogram summed over the
+        cuts as a heat map for each sample, with a logarithmic color scale.
+        The figure is saved to fname, in the format fmt, if given and
+        displayed otherwise. Histograms already computed can be given by
+        tuple of variables.
+        """
+        variables = tuple(self.find_variable(name) for name in variable_names)
+        if len(variables) != 2:
+            raise ValueError("Heat maps need two variables.")
+        if all(variables):
+            if histograms and variables in histograms:
+                hists = histograms[variables]
+            else:
+                hists = self.histograms_nd(variables, cuts, cut_labels)
+            with profiler.stage("rendering"):
+                import matplotlib.pyplot as plt
+                from matplotlib.colors import LogNorm
+                content = hists.dense().sum(axis=1)
+                positive = content[content > 0]
+                norm = LogNorm(positive.min(), positive.max()) if positive.size else None
+                rows, cols = self.grid_plots()
+                fig, axes = plt.subplots(
+                    nrows=rows, ncols=cols, figsize=(
+                        3.5 * cols, 2.75 * rows), squeeze=False)
+                axis = axes.flat
+                for i, s in enumerate(hists.samples):
+                    mesh = axis[i].pcolormesh(
+                        hists.edges[0], hists.edges[1],
+                        np.ma.masked_less_equal(content[i].T, 0), norm=norm)
+                    fig.colorbar(mesh, ax=axis[i])
+                    axis[i].set_title(self.samples[s], fontsize=9)
+                    axis[i].set_xlabel(self.variable_labels[variables[0]], fontsize=8)
+                    axis[i].set_ylabel(self.variable_labels[variables[1]], fontsize=8)
+                    if isinstance(self.get_binning(variables[0]), Log):
+                        axis[i].set_xscale("log")
+                    if isinstance(self.get_binning(variables[1]), Log):
+                        axis[i].set_yscale("log")
+                fig.tight_layout()
+            with profiler.stage("figure output"):
+                if fname is None:
+                    plt.show()
+                    plt.clf()
                 else:
-                    axis[i].set_ylim([0, 1.5 * ymax])
-            fig.tight_layout()
-            plt.show()
-            plt.clf()
+                    fig.savefig(fname, format=fmt)
+                    plt.close(fig)
 
     def grid_plots(self):
         """ Compute rows and columns for grid plots. """
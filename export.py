@@ -0,0 +1,135 @@
+import csv
+import json
+import os
+import numpy as np
+from histogram import Histograms
+
+""" File format of each extension of the exported histograms. """
+FORMATS = {".h5": "hdf5", ".hdf5": "hdf5", ".npz": "npz", ".csv": "csv"}
+
+""" Version of the layout of the exported files. """
+EXPORT_VERSION = 1
+
+
+def export_format(fname):
+    """ Format of an export file given its extension. """
+    ext = os.path.splitext(fname)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Unknown export format {ext}, use one of {', '.join(FORMATS)}.")
+    return FORMATS[ext]
+
+
+def write_histograms(fname, histograms, sample_names, labels, metadata,
+                     replicas=None):
+    r"""Write the histograms of several variables, with their bin edges, sums
+    of weights and of squared weights per (sample, cut) pair. The format is
+    given by the extension of the file: HDF5 (.h5, .hdf5) and NPZ (.npz)
+    files are compressed binary files, CSV files have one row per bin.
+    Args:
+        fname (str): Name of the export file.
+        histograms ({str: Histograms}): Histograms of each variable, by
+            requested name, sharing their samples and cuts.
+        sample_names ([str]): Name of each sample of the histograms.
+        labels ({str: str}): Axis label of each variable.
+        metadata (dict): Provenance of the histograms, JSON serializable.
+        replicas ({str: array}): Sums of weights of replicas of the
+            simulation of some variables, with shape [replica, sample, cut,
+            bin]. They are not written to CSV files.
+    """
+    replicas = replicas or {}
+    fmt = export_format(fname)
+    first = next(iter(histograms.values()))
+    metadata = dict(metadata, export_version=EXPORT_VERSION)
+    if fmt == "hdf5":
+        import h5py
+        with h5py.File(fname, 'w') as hf:
+            hf.attrs["metadata"] = json.dumps(metadata)
+            hf["samples"] = np.asarray(first.samples)
+            hf["sample_names"] = np.array(sample_names, dtype=h5py.string_dtype())
+            hf["cut_labels"] = np.array(first.cut_labels, dtype=h5py.string_dtype())
+            for name, hists in histograms.items():
+                group = hf.create_group(name)
+                group.attrs["variable"] = hists.variable
+                group.attrs["label"] = labels[name]
+                group["edges"] = hists.edges
+                for key in ("sumw", "sumw2"):
+                    group.create_dataset(
+                        key, data=getattr(hists, key), compression="gzip", shuffle=True)
+                if name in replicas:
+                    group.create_dataset(
+                        "replicas", data=replicas[name], compression="gzip", shuffle=True)
+    elif fmt == "npz":
+        arrays = {"samples": np.asarray(first.samples),
+                  "sample_names": np.array(sample_names),
+                  "cut_labels": np.array(first.cut_labels),
+                  "metadata": np.array(json.dumps(metadata))}
+        for name, hists in histograms.items():
+            arrays[f"{name}/variable"] = np.array(hists.variable)
+            arrays[f"{name}/label"] = np.array(labels[name])
+            arrays[f"{name}/edges"] = hists.edges
+            arrays[f"{name}/sumw"] = hists.sumw
+            arrays[f"{name}/sumw2"] = hists.sumw2
+            if name in replicas:
+                arrays[f"{name}/replicas"] = replicas[name]
+        with open(fname, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+    else:
+        with open(fname, 'w', newline='') as f:
+            f.write(f"# {json.dumps(metadata)}\n")
+            writer = csv.writer(f)
+            writer.writerow(["name", "variable", "sample", "sample_name", "cut",
+                             "bin", "low", "high", "sumw", "sumw2"])
+            for name, hists in histograms.items():
+                for i, s in enumerate(hists.samples):
+                    for k, cut in enumerate(hists.cut_labels):
+                        for b in range(hists.sumw.shape[-1]):
+                            writer.writerow([
+                                name, hists.variable, s, sample_names[i], cut, b,
+                                repr(float(hists.edges[i, b])),
+                                repr(float(hists.edges[i, b + 1])),
+                                repr(float(hists.sumw[i, k, b])),
+                                repr(float(hists.sumw2[i, k, b]))])
+
+
+def read_histograms(fname):
+    r"""Read histograms written by write_histograms to an HDF5 or NPZ file.
+    Args:
+        fname (str): Name of the export file.
+
+    Returns:
+        ({name: Histograms}, sample names, metadata). The histograms of
+        variables exported with replicas have a replicas attribute with shape
+        [replica, sample, cut, bin].
+    """
+    fmt = export_format(fname)
+    histograms = {}
+    if fmt == "hdf5":
+        import h5py
+        with h5py.File(fname, 'r') as hf:
+            metadata = json.loads(hf.attrs["metadata"])
+            samples = list(hf["samples"][()])
+            sample_names = [n.decode() for n in hf["sample_names"][()]]
+            cut_labels = [n.decode() for n in hf["cut_labels"][()]]
+            for name, group in hf.items():
+                if hasattr(group, "attrs") and "variable" in group.attrs:
+                    histograms[name] = Histograms(
+                        group.attrs["variable"], samples, cut_labels,
+                        group["edges"][()], group["sumw"][()], group["sumw2"][()])
+                    if "replicas" in group:
+                        histograms[name].replicas = group["replicas"][()]
+    elif fmt == "npz":
+        with np.load(fname) as data:
+            metadata = json.loads(str(data["metadata"]))
+            samples = list(data["samples"])
+            sample_names = [str(n) for n in data["sample_names"]]
+            cut_labels = [str(n) for n in data["cut_labels"]]
+            names = [key.rsplit("/", 1)[0] for key in data.files if key.endswith("/edges")]
+            for name in names:
+                histograms[name] = Histograms(
+                    str(data[f"{name}/variable"]), samples, cut_labels,
+                    data[f"{name}/edges"], data[f"{name}/sumw"], data[f"{name}/sumw2"])
+                if f"{name}/replicas" in data.files:
+                    histograms[name].replicas = data[f"{name}/replicas"]
+    else:
+        raise ValueError("CSV exports are read with any CSV reader.")
+    return histograms, sample_names, metadata
@@ -0,0 +1,204 @@
+import numpy as np
+
+""" Prior width of the systematic (nuisance) parameters: overall flux
+normalization, spectral index tilt of the flux and neutrino/antineutrino
+flux ratio. Their nominal values are 1, 0 and 0.
+"""
+PRIORS = {"norm": 0.2, "tilt": 0.05, "nubar": 0.05}
+NOMINAL = {"norm": 1., "tilt": 0., "nubar": 0.}
+
+""" Pivot energy of the spectral index tilt in GeV. """
+PIVOT_ENERGY = 10.
+
+
+def poisson_chi2(expected, observed):
+    """ Poisson chi^2 (Baker and Cousins) of observed counts given expected
+    ones, summed over all bins. The term of each bin, e - o + o log(o/e), is
+    computed from x = o/e - 1 as e (x log(1 + x) + log(1 + x) - x), which is
+    not lost to cancellation when e and o are large and close, and it is
+    never negative.
+    """
+    expected = np.maximum(expected, 1e-10)
+    observed = np.asarray(observed, dtype=float)
+    chi2 = expected.copy()
+    filled = observed > 0
+    x = observed[filled] / expected[filled] - 1
+    log = np.log1p(x)
+    chi2[filled] = expected[filled] * np.maximum(x * log + (log - x), 0)
+    return 2 * chi2.sum()
+
+
+def minimize(function, x0, step, tolerance=1e-6, iterations=500):
+    """ Nelder-Mead minimization of a function of a few parameters.
+    Args:
+        function (callable): Function of an array of parameters.
+        x0 (array): Starting point.
+        step (array): Initial size of the simplex along each parameter.
+        tolerance (float): Spread of the function values in the simplex at
+            which the minimization stops.
+        iterations (int): Maximum number of iterations.
+
+    Returns:
+        (Parameters at the minimum, value of the function)
+    """
+    x0 = np.asarray(x0, dtype=float)
+    simplex = np.vstack([x0, x0 + np.diag(step)])
+    values = np.array([function(x) for x in simplex])
+    for __ in range(iterations):
+        order = np.argsort(values)
+        simplex, values = simplex[order], values[order]
+        if values[-1] - values[0] < tolerance:
+            break
+        centroid = simplex[:-1].mean(axis=0)
+        reflected = centroid + (centroid - simplex[-1])
+        f_reflected = function(reflected)
+        if f_reflected < values[0]:
+            expanded = centroid + 2 * (centroid - simplex[-1])
+            f_expanded = function(expanded)
+            if f_expanded < f_reflected:
+                simplex[-1], values[-1] = expanded, f_expanded
+            else:
+                simplex[-1], values[-1] = reflected, f_reflected
+        elif f_reflected < values[-2]:
+            simplex[-1], values[-1] = reflected, f_reflected
+        else:
+            contracted = centroid + 0.5 * (simplex[-1] - centroid)
+            f_contracted = function(contracted)
+            if f_contracted < values[-1]:
+                simplex[-1], values[-1] = contracted, f_contracted
+            else:
+                simplex[1:] = simplex[0] + 0.5 * (simplex[1:] - simplex[0])
+                values[1:] = [function(x) for x in simplex[1:]]
+    best = np.argmin(values)
+    return simplex[best], values[best]
+
+
+class BinnedFit:
+    """ Binned expectations of the samples of an experiment in reconstructed
+    energy and cosine zenith, and their Poisson chi^2 against reference
+    counts with nuisance parameters for the flux. The bin of every event is
+    found once, so each evaluation of the expectations is a single weighted
+    bincount over the events.
+    """
+
+    def __init__(self, exp, energy_edges=None, coszen_edges=None,
+                 exposure=1., priors=None, interpolate=True):
+        r"""Bin the events of the samples of an experiment.
+        Args:
+            exp (Experiment): Experiment with the simulation loaded.
+            energy_edges (array): Edges in reconstructed energy (GeV).
+                Defaults to 15 logarithmic bins spanning the events.
+            coszen_edges (array): Edges in reconstructed cosine zenith.
+                Defaults to 10 bins between -1 and 1.
+            exposure (float): Exposure in years.
+            priors (dict): Prior width of each nuisance parameter, PRIORS
+                if None.
+            interpolate (bool): Interpolate the oscillation probabilities
+                on a grid instead of computing them for every event.
+        """
+        self.exp = exp
+        self.priors = PRIORS if priors is None else priors
+        self.interpolate = interpolate
+        energy = exp.fdata[exp.reco_variables["energy"]]
+        coszen = exp.fdata[exp.reco_variables["coszen"]]
+        if energy_edges is None:
+            positive = energy[energy > 0]
+            energy_edges = np.logspace(
+                np.log10(positive.min()), np.log10(positive.max()), 16)
+        if coszen_edges is None:
+            coszen_edges = np.linspace(-1, 1, 11)
+        self.energy_edges = np.asarray(energy_edges, dtype=float)
+        self.coszen_edges = np.asarray(coszen_edges, dtype=float)
+        self.shape = (len(exp.samples), len(self.energy_edges) - 1,
+                      len(self.coszen_edges) - 1)
+
+        """ Flat bin of each event in the samples, found once. """
+        index = exp.get_index()
+        sample = index.keys // index.ncube
+        ebin = np.searchsorted(self.energy_edges, energy, side="right") - 1
+        zbin = np.searchsorted(self.coszen_edges, coszen, side="right") - 1
+        ebin[energy == self.energy_edges[-1]] = self.shape[1] - 1
+        zbin[coszen == self.coszen_edges[-1]] = self.shape[2] - 1
+        inside = ((sample < self.shape[0])
+                  & (ebin >= 0) & (ebin < self.shape[1])
+                  & (zbin >= 0) & (zbin < self.shape[2]))
+        self.events = np.flatnonzero(inside)
+        self.bins = np.ravel_multi_index(
+            (sample[inside], ebin[inside], zbin[inside]), self.shape)
+        self.weights = exposure * exp.normalization * exp.weights[self.events]
+
+        """ Per-event inputs of the nuisance parameters. """
+        true_energy = exp.fdata[exp.true_variables["energy"]][self.events]
+        self.log_energy = np.log(true_energy / PIVOT_ENERGY)
+        flavor = exp.fdata[exp.true_variables["flavor"]][self.events]
+        self.cp_sign = np.where(flavor < 0, -1., 1.)
+        self.osc_cache = (None, None)
+
+    def osc_weights(self, params):
+        """ Oscillation weights of the binned events, None for no
+        oscillations. The weights of the last parameters are kept.
+        """
+        if params is None:
+            return None
+        key = tuple(sorted(params.items()))
+        if self.osc_cache[0] != key:
+            weights = self.exp.get_osc_weights(
+                params, interpolate=self.interpolate)[self.events]
+            self.osc_cache = (key, weights)
+        return self.osc_cache[1]
+
+    def expectation(self, params=None, nuisance=None):
+        r"""Expected counts in every bin.
+        Args:
+            params (dict): Oscillation parameters, no oscillations if None.
+            nuisance (dict): Values of the nuisance parameters, NOMINAL for
+                those missing.
+
+        Returns:
+            Array with shape [sample, energy bin, cosine zenith bin].
+        """
+        nuisance = dict(NOMINAL, **(nuisance or {}))
+        weights = self.weights * nuisance["norm"]
+        if nuisance["tilt"] != 0:
+            weights = weights * np.exp(nuisance["tilt"] * self.log_energy)
+        if nuisance["nubar"] != 0:
+            weights = weights * (1 + nuisance["nubar"] * self.cp_sign)
+        osc = self.osc_weights(params)
+        if osc is not None:
+            weights = weights * osc
+        counts = np.bincount(
+            self.bins, weights=weights, minlength=np.prod(self.shape))
+        return counts.reshape(self.shape)
+
+    def asimov(self, params=None):
+        """ Asimov data set: expected counts with nominal nuisance parameters. """
+        return self.expectation(params)
+
+    def chi2(self, observed, params=None, nuisance=None):
+        """ Poisson chi^2 of observed counts plus the Gaussian pull terms of
+        the nuisance parameters.
+        """
+        nuisance = dict(NOMINAL, **(nuisance or {}))
+        chi2 = poisson_chi2(self.expectation(params, nuisance), observed)
+        for name, width in self.priors.items():
+            chi2 += ((nuisance[name] - NOMINAL[name]) / width)**2
+        return chi2
+
+    def profile(self, observed, params=None):
+        """ Chi^2 minimized over the nuisance parameters.
+        Args:
+            observed (array): Reference counts, e.g. from asimov.
+            params (dict): Oscillation parameters, no oscillations if None.
+
+        Returns:
+            (minimum chi^2, dictionary with the best nuisance parameters)
+        """
+        names = list(self.priors)
+        x0 = [NOMINAL[name] for name in names]
+        step = [self.priors[name] for name in names]
+
+        def function(x):
+            return self.chi2(observed, params, dict(zip(names, x)))
+
+        best, chi2 = minimize(function, x0, step)
+        return float(chi2), {name: float(x) for name, x in zip(names, best)}
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import numpy as np
+from fit import PIVOT_ENERGY
+
+""" PDG codes of the flavors of a flux table, in the order of its rows. Tau
+neutrinos are simulated with the muon neutrino flux.
+"""
+FLAVORS = (12, -12, 14, -14)
+
+""" Columns of the HKKM tables (NuMu, NuMubar, NuE, NuEbar) as rows of
+FLAVORS.
+"""
+HKKM_COLUMNS = (2, 3, 0, 1)
+
+
+def grid_position(nodes, x):
+    """ Cell of a grid and position inside it of every value, clamped to the
+    nodes of the grid.
+    Returns:
+        (index of the lower node, fraction of the cell between 0 and 1)
+    """
+    x = np.clip(x, nodes[0], nodes[-1])
+    i = np.clip(np.searchsorted(nodes, x, side="right") - 1, 0, len(nodes) - 2)
+    return i, (x - nodes[i]) / (nodes[i + 1] - nodes[i])
+
+
+def flavor_row(flavor):
+    """ Row of FLAVORS of the neutrino PDG codes, muon neutrinos for tau
+    neutrinos.
+    """
+    flavor = np.asarray(flavor)
+    return np.where(np.abs(flavor) == 12, 0, 2) + (flavor < 0)
+
+
+class FluxTable:
+    """ Atmospheric neutrino flux tabulated in energy and cosine zenith for
+    each flavor and site, e.g. the HKKM tables. The flux of every event is
+    interpolated bilinearly in log10(energy) and cosine zenith on the
+    logarithm of the flux, and clamped to the range of the table.
+    """
+
+    def __init__(self, sites, energy, coszen, flux, name="flux"):
+        r"""Flux table.
+        Args:
+            sites ([str]): Names of the sites.
+            energy (array): Energy nodes in GeV, increasing.
+            coszen (array): Cosine zenith nodes, increasing.
+            flux (array): Flux with shape [site, flavor, coszen, energy],
+                flavors as in FLAVORS.
+            name (str): Name of the flux model.
+        """
+        self.sites = list(sites)
+        self.energy = np.asarray(energy, dtype=float)
+        self.coszen = np.asarray(coszen, dtype=float)
+        self.flux = np.asarray(flux, dtype=float)
+        self.name = name
+        if self.flux.shape != (len(self.sites), len(FLAVORS),
+                               len(self.coszen), len(self.energy)):
+            raise ValueError(f"Flux table {name} has shape {self.flux.shape}.")
+        digest = hashlib.blake2b(digest_size=8)
+        for array in (self.energy, self.coszen, self.flux):
+            digest.update(array.tobytes())
+        digest.update(" ".join(self.sites).encode())
+        self.digest = digest.hexdigest()
+        self.log_energy = np.log10(self.energy)
+        self.log_flux = np.log(np.maximum(self.flux, np.finfo(float).tiny))
+
+    @classmethod
+    def load(cls, fname, site=None):
+        r"""Read a flux table from an NPZ file written by save, or from an
+        HKKM text table (one block per cosine zenith bin, averaged over the
+        azimuth bins).
+        Args:
+            fname (str): Name of the flux file.
+            site (str): Site of an HKKM table. Defaults to the prefix of the
+                file name, e.g. kam for kam-ally-20-12-solmax.d.
+        """
+        name = os.path.basename(fname)
+        if fname.endswith(".npz"):
+            with np.load(fname) as data:
+                return cls([str(s) for s in data["sites"]], data["energy"],
+                           data["coszen"], data["flux"], name)
+        blocks = {}
+        energy = []
+        with open(fname) as f:
+            for line in f:
+                if "cosZ" in line:
+                    bounds = line.split("cosZ")[1].split(",")[0]
+                    lo, hi = (float(v) for v in bounds.strip(" =").split("--"))
+                    rows = blocks.setdefault(round((lo + hi) / 2, 6), [])
+                    rows.append([])
+                    energy = []
+                    continue
+                values = line.split()
+                if len(values) == 5 and blocks:
+                    try:
+                        values = [float(v) for v in values]
+                    except ValueError:
+                        continue
+                    energy.append(values[0])
+                    rows[-1].append(values[1:])
+        if not blocks:
+            raise ValueError(f"No flux block found in {fname}.")
+        coszen = sorted(blocks)
+        """ [coszen, azimuth, energy, column] averaged over the azimuth. """
+        table = np.array([np.mean(blocks[c], axis=0) for c in coszen])
+        flux = table[:, :, list(HKKM_COLUMNS)].transpose(2, 0, 1)
+        site = site or name.split("-")[0]
+        return cls([site], energy, coszen, flux[None], name)
+
+    def save(self, fname):
+        """ Write the table to an NPZ file. """
+        with open(fname, 'wb') as f:
+            np.savez_compressed(
+                f, sites=np.array(self.sites), energy=self.energy,
+                coszen=self.coszen, flux=self.flux)
+
+    def site_index(self, site):
+        """ Index of a site, the only site of single-site tables. """
+        if site in self.sites:
+            return self.sites.index(site)
+        if len(self.sites) == 1:
+            return 0
+        raise ValueError(f"Site {site} not in flux table {self.name} ({', '.join(self.sites)}).")
+
+    def evaluate(self, energy, coszen, flavor, site=None):
+        r"""Flux of every event.
+        Args:
+            energy (array): True neutrino energy in GeV.
+            coszen (array): True cosine of the zenith angle.
+            flavor (array): PDG code of the neutrino.
+            site (str): Site of the detector.
+
+        Returns:
+            Array with the flux of each event.
+        """
+        log_flux = self.log_flux[self.site_index(site)]
+        row = flavor_row(flavor)
+        i, fe = grid_position(self.log_energy, np.log10(np.asarray(energy, dtype=float)))
+        j, fz = grid_position(self.coszen, np.asarray(coszen, dtype=float))
+        value = ((1 - fz) * ((1 - fe) * log_flux[row, j, i] + fe * log_flux[row, j, i + 1])
+                 + fz * ((1 - fe) * log_flux[row, j + 1, i] + fe * log_flux[row, j + 1, i + 1]))
+        return np.exp(value)
+
+
+def flux_systematics(energy, flavor, tilt=0., nubar=0.):
+    """ Reweighting of the flux by a spectral index tilt around
+    fit.PIVOT_ENERGY and a neutrino/antineutrino ratio shift, as the
+    nuisance parameters of fit.BinnedFit.
+    """
+    factor = np.ones(len(energy))
+    if tilt != 0:
+        factor *= (np.asarray(energy, dtype=float) / PIVOT_ENERGY) ** tilt
+    if nubar != 0:
+        factor *= 1 + nubar * np.where(np.asarray(flavor) < 0, -1., 1.)
+    return factor
@@ -0,0 +1,323 @@
+import numpy as np
+
+""" Largest number of bins of the N-dimensional histograms of a breakdown
+filled with a dense bincount. Larger grids are filled through the unique
+non-empty bins of the events only.
+"""
+DENSE_BINS = 1 << 24
+
+
+class Histograms:
+    """ Weighted histograms of a variable for every (sample, cut) pair, kept
+    apart from any plotting so they can be reused.
+    """
+
+    def __init__(self, variable, samples, cut_labels, edges, sumw, sumw2=None):
+        r"""Container of the histograms.
+        Args:
+            variable (str): Name of the variable in the simulation file.
+            samples ([int]): Sample indices, one per row of the histograms.
+            cut_labels ([str]): Labels of the cuts.
+            edges (array): Bin edges with shape [sample, bin + 1].
+            sumw (array): Sum of weights with shape [sample, cut, bin].
+            sumw2 (array): Sum of squared weights with shape [sample, cut,
+                bin], the variance of sumw from the simulation statistics.
+        """
+        self.variable = variable
+        self.samples = list(samples)
+        self.cut_labels = list(cut_labels)
+        self.edges = edges
+        self.sumw = sumw
+        self.sumw2 = sumw2
+
+    def scale(self, factor):
+        """ Scale the histograms by a factor, e.g. a normalization. """
+        self.sumw *= factor
+        if self.sumw2 is not None:
+            self.sumw2 *= factor ** 2
+        return self
+
+
+def group_events(index, cuts, samples):
+    """ Group id of every event, sample slot * number of cuts + cut slot, or
+    -1 for events outside every (sample, cut) pair.
+    Args:
+        index (CategoryIndex): Categorical index of the experiment.
+        cuts ([array]): Category selections of the cuts.
+        samples ([int]): Distinct sample indices.
+
+    Returns:
+        Array with the group id of each event.
+    """
+    lookup = np.full(index.nkeys, -1, dtype=np.int32)
+    for i, s in enumerate(samples):
+        for k, c in enumerate(cuts):
+            keys = s * index.ncube + np.flatnonzero(c)
+            if np.any(lookup[keys] >= 0):
+                raise ValueError("Cuts of a histogram must not overlap.")
+            lookup[keys] = i * len(cuts) + k
+    return lookup[index.keys]
+
+
+def digitize(values, edges):
+    """ Bin of each value following numpy.histogram: bins are half open but
+    the last one, which includes its right edge. The bins need not be
+    equally wide, e.g. logarithmic or quantile bins.
+    Args:
+        values (array): Values to bin.
+        edges (array): Increasing bin edges.
+
+    Returns:
+        Array with the bin of each value, -1 for values out of range or NaN,
+        in the narrowest integer type holding the bins.
+    """
+    values = np.asarray(values)
+    nbins = len(edges) - 1
+    index = np.searchsorted(edges, values, side="right") - 1
+    index[values == edges[-1]] = nbins - 1
+    index[(index >= nbins) | np.isnan(values)] = -1
+    return index.astype(np.int16 if nbins < np.iinfo(np.int16).max else np.int32)
+
+
+def fill(groups, bins, weights, ngroups, nbins):
+    """ Weighted histograms of every group in a single bincount pass.
+    Args:
+        groups (array): Group id of each entry.
+        bins (array): Bin of each entry.
+        weights (array): Weight of each entry.
+        ngroups (int): Number of groups.
+        nbins (int): Number of bins.
+
+    Returns:
+        Array with shape [group, bin].
+    """
+    flat = np.bincount(
+        groups * nbins + bins,
+        weights=weights,
+        minlength=ngroups * nbins)
+    return flat.reshape(ngroups, nbins)
+
+
+def locate(index, bins, cuts, samples, nbins):
+    r"""Events falling in a histogram of a (sample, cut) pair and their flat
+    bin over all histograms.
+    Args:
+        index (CategoryIndex): Categorical index of the events.
+        bins (array): Bin of every event, as returned by digitize.
+        cuts ([array]): Category selections of the cuts.
+        samples ([int]): Distinct sample indices.
+        nbins (int): Number of bins.
+
+    Returns:
+        (event indices, flat bin (sample * cuts + cut) * bins + bin of each)
+    """
+    groups = group_events(index, cuts, samples)
+    selected = np.flatnonzero((groups >= 0) & (bins >= 0))
+    return selected, groups[selected] * nbins + bins[selected]
+
+
+def accumulate(index, bins, nbins, weights, cuts, samples):
+    r"""Sums of weights and of squared weights of a variable for every
+    (sample, cut) pair in one pass over the events.
+    Args:
+        index (CategoryIndex): Categorical index of the events.
+        bins (array): Bin of every event, as returned by digitize.
+        nbins (int): Number of bins.
+        weights (array): Weight of every event.
+        cuts ([array]): Category selections of the cuts.
+        samples ([int]): Distinct sample indices.
+
+    Returns:
+        (sumw, sumw2), arrays with shape [sample, cut, bin].
+    """
+    events, flat = locate(index, bins, cuts, samples, nbins)
+    weights = weights[events]
+    shape = (len(samples), len(cuts), nbins)
+    size = int(np.prod(shape))
+    sumw = np.bincount(flat, weights=weights, minlength=size)
+    sumw2 = np.bincount(flat, weights=weights * weights, minlength=size)
+    return sumw.reshape(shape), sumw2.reshape(shape)
+
+
+def histogram(index, variable, bins, edges, weights, cuts, cut_labels, samples):
+    r"""Histograms of a variable for every (sample, cut) pair in one pass over
+    the events. The bins of the events are shared by every sample and cut.
+    Args:
+        index (CategoryIndex): Categorical index of the experiment.
+        variable (str): Name of the variable in the simulation file.
+        bins (array): Bin of every event, as returned by digitize.
+        edges (array): Bin edges of the variable.
+        weights (array): Weight of every event.
+        cuts ([array]): Category selections of the cuts.
+        cut_labels ([str]): Labels of the cuts.
+        samples ([int]): Sample indices.
+
+    Returns:
+        Histograms of the variable.
+    """
+    distinct = list(dict.fromkeys(samples))
+    sumw, sumw2 = accumulate(index, bins, len(edges) - 1, weights, cuts, distinct)
+    rows = [distinct.index(s) for s in samples]
+    return Histograms(
+        variable, samples, cut_labels, sample_edges(edges, samples),
+        sumw[rows], sumw2[rows])
+
+
+def sample_edges(edges, samples):
+    """ Bin edges of a variable repeated for every sample, with shape
+    [sample, bin + 1] as in Histograms.
+    """
+    return np.tile(np.asarray(edges, dtype=float), (len(samples), 1))
+
+
+class HistogramsND:
+    """ Weighted N-dimensional histograms of several variables for every
+    (sample, cut) pair, e.g. reconstructed energy and cosine zenith, or true
+    versus reconstructed energy for migration matrices. Only the non-empty
+    bins are kept, as flat indices over [sample, cut, bin of each variable]
+    in the order of the distinct samples, so mostly empty grids take little
+    memory.
+    """
+
+    def __init__(self, variables, samples, cut_labels, edges, keys, sumw, sumw2):
+        r"""Container of the histograms.
+        Args:
+            variables ([str]): Names of the variables in the simulation file.
+            samples ([int]): Sample indices, one per row of the histograms.
+            cut_labels ([str]): Labels of the cuts.
+            edges ([array]): Bin edges of each variable.
+            keys (array): Increasing flat indices of the non-empty bins.
+            sumw (array): Sum of weights of each non-empty bin.
+            sumw2 (array): Sum of squared weights of each non-empty bin.
+        """
+        self.variables = list(variables)
+        self.samples = list(samples)
+        self.cut_labels = list(cut_labels)
+        self.edges = [np.asarray(e, dtype=float) for e in edges]
+        self.keys = keys
+        self.sumw = sumw
+        self.sumw2 = sumw2
+
+    @property
+    def distinct(self):
+        """ Distinct sample indices, in the order of the flat indices. """
+        return list(dict.fromkeys(self.samples))
+
+    @property
+    def shape(self):
+        """ Number of bins of each variable. """
+        return tuple(len(e) - 1 for e in self.edges)
+
+    def dense(self, sumw2=False):
+        """ Histograms as a dense array with shape [sample, cut, bin of each
+        variable], of the sums of weights or of squared weights.
+        """
+        distinct = self.distinct
+        result = np.zeros((len(distinct), len(self.cut_labels)) + self.shape)
+        result.reshape(-1)[self.keys] = self.sumw2 if sumw2 else self.sumw
+        return result[[distinct.index(s) for s in self.samples]]
+
+    def scale(self, factor):
+        """ Scale the histograms by a factor, e.g. a normalization. """
+        self.sumw *= factor
+        self.sumw2 *= factor ** 2
+        return self
+
+
+def histogram_nd(index, variables, bins, edges, weights, cuts, cut_labels, samples):
+    r"""N-dimensional histograms of variables for every (sample, cut) pair in
+    one pass over the events, from the flat index of the group and bins of
+    every event.
+    Args:
+        index (CategoryIndex): Categorical index of the experiment.
+        variables ([str]): Names of the variables in the simulation file.
+        bins ([array]): Bin of every event for each variable, as returned by
+            digitize.
+        edges ([array]): Bin edges of each variable.
+        weights (array): Weight of every event.
+        cuts ([array]): Category selections of the cuts.
+        cut_labels ([str]): Labels of the cuts.
+        samples ([int]): Sample indices.
+
+    Returns:
+        HistogramsND of the variables.
+    """
+    distinct = list(dict.fromkeys(samples))
+    groups = group_events(index, cuts, distinct)
+    inside = groups >= 0
+    for binned in bins:
+        inside &= binned >= 0
+    selected = np.flatnonzero(inside)
+    flat = groups[selected].astype(np.int64)
+    shape = [len(e) - 1 for e in edges]
+    for binned, nbins in zip(bins, shape):
+        flat *= nbins
+        flat += binned[selected]
+    weights = np.asarray(weights)[selected]
+    size = len(distinct) * len(cuts) * int(np.prod(shape))
+    if size <= DENSE_BINS:
+        sumw = np.bincount(flat, weights=weights, minlength=size)
+        sumw2 = np.bincount(flat, weights=weights * weights, minlength=size)
+        keys = np.flatnonzero(sumw2)
+        sumw, sumw2 = sumw[keys], sumw2[keys]
+    else:
+        keys, inverse = np.unique(flat, return_inverse=True)
+        sumw = np.bincount(inverse, weights=weights, minlength=len(keys))
+        sumw2 = np.bincount(inverse, weights=weights * weights, minlength=len(keys))
+    return HistogramsND(variables, samples, cut_labels, edges, keys, sumw, sumw2)
+
+
+class Chunk:
+    """ Histograms of the events in a chunk of a simulation file and the sum
+    of their weights, as produced by Experiment.stream.
+    """
+
+    def __init__(self, start, stop, histograms, sum_weights):
+        r"""Container of the results of a chunk.
+        Args:
+            start (int): First event of the chunk.
+            stop (int): Event following the last one of the chunk.
+            histograms ({str: Histograms}): Unnormalized histograms of each
+                variable.
+            sum_weights (float): Sum of the weights of the events.
+        """
+        self.start = start
+        self.stop = stop
+        self.histograms = histograms
+        self.sum_weights = sum_weights
+
+
+class HistogramAccumulator:
+    """ Running sums of the histograms and weights of the chunks of a file.
+    Once every chunk has been added, the histograms are those of the whole
+    file up to the order of the floating point additions.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.sum_weights = 0.
+        self.nevents = 0
+
+    def add(self, chunk):
+        """ Add the results of a chunk. """
+        for variable, hists in chunk.histograms.items():
+            if variable in self.histograms:
+                self.histograms[variable].sumw += hists.sumw
+                self.histograms[variable].sumw2 += hists.sumw2
+            else:
+                self.histograms[variable] = Histograms(
+                    variable, hists.samples, hists.cut_labels,
+                    hists.edges, hists.sumw.copy(), hists.sumw2.copy())
+        self.sum_weights += chunk.sum_weights
+        self.nevents += chunk.stop - chunk.start
+
+    def result(self, normalization=1.):
+        """ Accumulated histograms of each variable scaled by a
+        normalization.
+        """
+        result = {}
+        for variable, hists in self.histograms.items():
+            result[variable] = Histograms(
+                variable, hists.samples, hists.cut_labels, hists.edges,
+                hists.sumw.copy(), hists.sumw2.copy()).scale(normalization)
+        return result
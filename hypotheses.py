@@ -0,0 +1,135 @@
+import numpy as np
+from fit import NOMINAL, PIVOT_ENERGY
+from histogram import group_events
+
+""" Default memory budget in bytes of the [hypothesis, event] arrays of a
+block of events. Blocks of a few megabytes stay in the processor caches
+and are faster than larger ones.
+"""
+MEMORY_BUDGET = 8 * 2**20
+
+""" Bytes per hypothesis and event of a block: the weights, the flat bins
+of the selected events, their weights and a temporary of the systematics.
+"""
+BYTES_PER_ENTRY = 32
+
+
+def block_size(nhypotheses, memory=MEMORY_BUDGET):
+    """ Number of events of a block so that its [hypothesis, event] arrays
+    fit in a memory budget in bytes, at least one event.
+    """
+    return max(1, int(memory // (BYTES_PER_ENTRY * max(1, nhypotheses))))
+
+
+def hypothesis_parameters(hypotheses):
+    r"""Flux parameters and oscillation parameters of hypotheses.
+    Args:
+        hypotheses ([dict]): Hypotheses with the parameters of fit.NOMINAL
+            (norm, tilt, nubar), nominal when missing, and params, the
+            oscillation parameters, no oscillation when missing or None.
+
+    Returns:
+        (norm, tilt, nubar arrays with shape [1, hypothesis], distinct
+        oscillation parameters, slot of each hypothesis in them)
+    """
+    flux = {}
+    for name in NOMINAL:
+        flux[name] = np.array([float(h.get(name, NOMINAL[name])) for h in hypotheses])[None, :]
+    keys = [None if h.get("params") is None else tuple(sorted(h["params"].items()))
+            for h in hypotheses]
+    distinct = list(dict.fromkeys(keys))
+    slots = np.array([distinct.index(k) for k in keys], dtype=np.intp)
+    params = [None if k is None else dict(k) for k in distinct]
+    return flux["norm"], flux["tilt"], flux["nubar"], params, slots
+
+
+def batched_histograms(index, bins, edges, weights, cuts, samples, hypotheses,
+                       energy, flavor, table=None, flux_ratio=0.5,
+                       memory=MEMORY_BUDGET):
+    r"""Histograms of a batch of weight hypotheses, e.g. the points of a
+    parameter scan, in one sweep over the events. The events are read in
+    blocks: the weights of every hypothesis are computed for a block and
+    added to the histograms of every variable in one bincount, so the
+    selection, bins and probabilities of an event are looked up once for
+    the whole batch. The blocks are sized so that the [hypothesis, event]
+    arrays stay within a memory budget, and only the bins touched by a block
+    are accumulated.
+    Args:
+        index (CategoryIndex): Categorical index of the events.
+        bins ({str: array}): Bin of every event of each variable, as
+            returned by histogram.digitize.
+        edges ({str: array}): Bin edges of each variable.
+        weights (array): Nominal weight of every event.
+        cuts ([array]): Category selections of the cuts.
+        samples ([int]): Distinct sample indices.
+        hypotheses ([dict]): Hypotheses, see hypothesis_parameters. The
+            flux is scaled by norm * (E / fit.PIVOT_ENERGY)**tilt *
+            (1 +/- nubar) as in flux.flux_systematics.
+        energy (array): True neutrino energy of every event in GeV.
+        flavor (array): PDG code of the neutrino of every event.
+        table (ProbabilityTable): Oscillation probabilities of the events,
+            needed by the hypotheses with oscillation parameters.
+        flux_ratio (float or array): Ratio of the electron to muon neutrino
+            flux of each event.
+        memory (float): Memory budget in bytes of the arrays of a block.
+
+    Returns:
+        {variable: array with shape [hypothesis, sample, cut, bin]}
+    """
+    nhyp = len(hypotheses)
+    norm, tilt, nubar, params, slots = hypothesis_parameters(hypotheses)
+    if table is None and any(p is not None for p in params):
+        raise ValueError("Oscillated hypotheses need a probability table.")
+    """ The grid of every distinct set of oscillation parameters is fetched
+    once, not once per block, as the cache of the table may hold fewer
+    grids than the batch.
+    """
+    grids = [None if p is None else table.grid(p) for p in params]
+
+    groups = group_events(index, cuts, samples)
+    events = np.flatnonzero(groups >= 0)
+    groups = groups[events]
+    flats, result = {}, {}
+    for var, binned in bins.items():
+        nbins = len(edges[var]) - 1
+        binned = binned[events]
+        flats[var] = np.where(binned >= 0, groups * nbins + binned, -1)
+        result[var] = np.zeros((len(samples) * len(cuts) * nbins, nhyp))
+    hypothesis = np.arange(nhyp, dtype=np.int64)
+
+    """ The arrays of a block have shape [event, hypothesis], so that the
+    weights of the events of a bin are contiguous.
+    """
+    weights = np.asarray(weights)
+    energy = np.asarray(energy)
+    flavor = np.asarray(flavor)
+    step = block_size(nhyp, memory)
+    for start in range(0, events.size, step):
+        block = events[start:start + step]
+        w = weights[block][:, None] * norm
+        if np.any(tilt != 0):
+            w *= (energy[block][:, None] / PIVOT_ENERGY) ** tilt
+        if np.any(nubar != 0):
+            w *= 1 + np.where(flavor[block] < 0, -1., 1.)[:, None] * nubar
+        ratio = flux_ratio[block] if np.ndim(flux_ratio) else flux_ratio
+        for slot, grid in enumerate(grids):
+            if grid is not None:
+                w[:, slots == slot] *= table.grid_weights(
+                    grid, flavor[block], ratio, block)[:, None]
+        for var, flat in flats.items():
+            flat = flat[start:start + step]
+            inside = flat >= 0
+            """ Histograms larger than a block only accumulate the bins the
+            block touches, so the cost of a block is bounded by its size and
+            not by the size of the histograms.
+            """
+            keys, touched = flat[inside], slice(None)
+            if len(result[var]) > step:
+                touched, keys = np.unique(keys, return_inverse=True)
+            keys = keys[:, None] * nhyp + hypothesis
+            total = result[var][touched]
+            total += np.bincount(keys.ravel(), weights=w[inside].ravel(),
+                                 minlength=total.size).reshape(total.shape)
+            result[var][touched] = total
+    return {var: result[var].T.reshape(nhyp, len(samples), len(cuts), -1)
+            for var in bins}
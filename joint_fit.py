@@ -0,0 +1,166 @@
+import importlib
+import multiprocessing
+from fit import BinnedFit
+
+""" Module and class of each detector, by the names used in plot_sim.py. """
+DETECTORS = {
+    "SK": ("kamioka", "SK"),
+    "SK-Htag": ("kamioka", "SK_Htag"),
+    "SK-Gd": ("kamioka", "SK_Gdtag"),
+    "HK": ("kamioka", "HK"),
+    "ICUp": ("south_pole", "IC"),
+    "ORCA": ("mediterranean", "ORCA")}
+
+
+def load_detector(detector, fname, variables=(), **options):
+    """ Load the simulation file of a detector given its name, with every
+    sample and the default breakdown. The options are passed to the
+    experiment class.
+    """
+    module, name = DETECTORS[detector]
+    cls = getattr(importlib.import_module(module), name)
+    return cls(fname, list(variables), "e+mu", "both", False, "All", **options)
+
+
+def serve(connection, detector, fname, options, fit_options, truth):
+    """ Worker process of one detector. It loads the simulation and bins it
+    once, then answers requests from the parent until it receives None:
+        ("chi2", params, profile): chi^2 at an oscillation parameter point,
+            minimized over the nuisance parameters if profile.
+        ("data", params): use the Asimov data set at params as reference.
+    """
+    try:
+        fit = BinnedFit(load_detector(detector, fname, **options), **fit_options)
+        observed = fit.asimov(truth)
+        connection.send(("ready", fit.shape))
+    except Exception as error:
+        connection.send(("error", repr(error)))
+        return
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        try:
+            if request[0] == "chi2":
+                __, params, profile = request
+                if profile:
+                    result = fit.profile(observed, params)
+                else:
+                    result = (fit.chi2(observed, params), {})
+            elif request[0] == "data":
+                observed = fit.asimov(request[1])
+                result = None
+            else:
+                raise ValueError(f"Unknown request {request[0]}.")
+            connection.send(("ok", result))
+        except Exception as error:
+            connection.send(("error", repr(error)))
+    connection.close()
+
+
+class JointFit:
+    """ Combined chi^2 of several experiments. Each experiment lives in its
+    own long-lived worker process holding its events and binning, so the
+    parent only sends oscillation parameters and receives partial chi^2
+    values, and the experiments are evaluated in parallel.
+    """
+
+    def __init__(self, detectors, truth=None, options=None, fit_options=None):
+        r"""Start one worker process per detector.
+        Args:
+            detectors ([(str, str)]): Name (as in DETECTORS) and simulation
+                file of each detector.
+            truth (dict): Oscillation parameters of the Asimov data sets, no
+                oscillations if None.
+            options (dict): Options of the experiment classes.
+            fit_options (dict): Options of fit.BinnedFit.
+        """
+        context = multiprocessing.get_context("spawn")
+        self.names = [name for name, __ in detectors]
+        self.connections = []
+        self.workers = []
+        try:
+            for detector, fname in detectors:
+                parent, child = context.Pipe()
+                worker = context.Process(
+                    target=serve,
+                    args=(child, detector, fname, options or {},
+                          fit_options or {}, truth),
+                    daemon=True)
+                worker.start()
+                child.close()
+                self.connections.append(parent)
+                self.workers.append(worker)
+            self.shapes = self.gather()
+        except BaseException:
+            """ Do not leave the workers already started running. """
+            for worker in self.workers:
+                worker.terminate()
+            for worker in self.workers:
+                worker.join()
+            for connection in self.connections:
+                connection.close()
+            self.connections, self.workers = [], []
+            raise
+
+    def gather(self):
+        """ Collect the answer of every worker. Every answer is received
+        before raising on failures, so none is left in the pipes to be read
+        as the answer of a later request.
+        """
+        results, errors = [], []
+        for name, connection in zip(self.names, self.connections):
+            try:
+                status, result = connection.recv()
+            except EOFError:
+                status, result = "error", "worker exited"
+            if status == "error":
+                errors.append(f"{name}: {result}")
+            results.append(result)
+        if errors:
+            raise RuntimeError(f"Workers failed: {'; '.join(errors)}")
+        return results
+
+    def chi2(self, params, profile=True):
+        """ Combined chi^2 at an oscillation parameter point.
+        Args:
+            params (dict): Oscillation parameters.
+            profile (bool): Minimize each chi^2 over its nuisance parameters.
+
+        Returns:
+            (total chi^2, {detector name: (chi^2, nuisance parameters)})
+        """
+        for connection in self.connections:
+            connection.send(("chi2", params, profile))
+        results = self.gather()
+        return (sum(chi2 for chi2, __ in results),
+                dict(zip(self.names, results)))
+
+    def scan(self, points, profile=True):
+        """ Combined chi^2 of a list of oscillation parameter points. """
+        return [self.chi2(params, profile)[0] for params in points]
+
+    def set_data(self, params):
+        """ Use the Asimov data sets at params as reference. """
+        for connection in self.connections:
+            connection.send(("data", params))
+        self.gather()
+
+    def close(self):
+        """ Stop the worker processes. """
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                """ The worker already exited, e.g. after failing to load. """
+                pass
+            connection.close()
+        for worker in self.workers:
+            worker.join()
+        self.connections, self.workers = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
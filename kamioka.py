@@ -1,9 +1,12 @@
+from binning import COSZEN_EDGES, Fixed, Integer, Linear, Log
 from experiment import Experiment
+from oscillation import EarthModel
 import numpy as np
 
 """ Class for the Super-Kamiokande experiment with no neutron tagging. """
 class SK(Experiment):
-    def __init__(self, fname, variables, flavors, cp, interaction, samples):
+    def __init__(self, fname, variables, flavors, cp,
+                 interaction, samples, **kwargs):
         super(
             SK,
             self).__init__(
@@ -12,7 +15,8 @@ class SK(Experiment):
             flavors,
             cp,
             interaction,
-            samples)
+            samples,
+            **kwargs)
 
         """ Name of the experiment. """
         self.experiment = "SK"
@@ -95,15 +99,67 @@ class SK(Experiment):
             "muedk": False,
             "itype": False}
 
-        """ Auxiliary variables for computing the weights. """
+        """ Dictionary defining the bin edges of each variable, shared by every
+        sample and cut: logarithmic for energies and momenta, fixed for
+        directions and one bin per value for integer variables.
+        """
+        self.variable_binning = {
+            "ipnu": Integer(),
+            "pnu": Log(),
+            "dirnuX": Linear(20, -1., 1.),
+            "dirnuY": Linear(20, -1., 1.),
+            "dirnuZ": Fixed(COSZEN_EDGES),
+            "azi": Linear(),
+            "plep": Log(),
+            "dirlepX": Linear(20, -1., 1.),
+            "dirlepY": Linear(20, -1., 1.),
+            "dirlepZ": Linear(20, -1., 1.),
+            "mode": Integer(),
+            "imass": Linear(),
+            "pmax": Log(),
+            "evis": Log(),
+            "recodirX": Linear(20, -1., 1.),
+            "recodirY": Linear(20, -1., 1.),
+            "recodirZ": Fixed(COSZEN_EDGES),
+            "ip": Integer(),
+            "nring": Integer(),
+            "muedk": Integer(),
+            "itype": Integer()}
+
+        """ Auxiliary variables for computing the weights, kept when the
+        file is repacked.
+        """
         self.aux_variables = [
             "weightSim",
             "weightReco",
             "weightOsc_SKpaper",
             "weightOsc_SKbest"]
 
-        """ Compute the weights. """
-        self.weights = self.get_weights()
+        """ Variables used by the flavor, interaction and sample cuts. """
+        self.cut_variables = ["ipnu", "mode", "itype"]
+
+        """ True variables used for computing the oscillation weights. """
+        self.true_variables = {
+            "energy": "pnu",
+            "coszen": "dirnuZ",
+            "flavor": "ipnu"}
+
+        """ Reconstructed variables used for binning the samples in fits. """
+        self.reco_variables = {"energy": "evis", "coszen": "recodirZ"}
+
+        """ SK lies 1 km underground. """
+        self.earth = EarthModel(detector_depth=1.)
+
+        """ Site of the flux tables (HKKM Kamioka tables). """
+        self.flux_site = "kam"
+
+        """ Dataset of the weights based on the simulation, the only
+        auxiliary variable read for the nominal weights.
+        """
+        self.weight_column = "weightReco"
+
+        """ Weights, computed when they are first needed. """
+        self.weights = self.get_weights
         # self.flux_weights = self.get_flux_weights()
         # self.osc_weights = self.get_osc_weights()
 
@@ -112,11 +168,16 @@ class SK(Experiment):
         Extracted from https://doi.org/10.1103/PhysRevD.97.072001
         """
         sk_rate_yr = 36437.9607 / 5326 * 365.25
-        number_of_events = np.sum(self.weights)
-        mc_years = number_of_events / sk_rate_yr
-        self.normalization = 1 / mc_years  # events / SK / year
-        # self.normalization = 1.2 / mc_years  # events / SK / year
-        # (with expanded fiducial volume 20% more events are expected)
+
+        def normalization():
+            """ Computed when first needed, so that streaming can sum the
+            weights chunk by chunk instead of reading them at once.
+            """
+            mc_years = self.get_number_of_events() / sk_rate_yr
+            return 1 / mc_years  # events / SK / year
+            # return 1.2 / mc_years  # events / SK / year
+            # (with expanded fiducial volume 20% more events are expected)
+        self.normalization = normalization
 
         """ Names of the SuperK event samples. """
         self.samples = [
@@ -173,7 +234,7 @@ class SK(Experiment):
 
     def get_weights(self):
         """ Method for getting the weights based on the simulation. """
-        return self.fdata["weightReco"]
+        return self.fdata[self.weight_column]
 
     def get_flux_weights(self):
         """ Method for getting the inverse of the HKKM atmospheric neutrino
@@ -181,13 +242,22 @@ class SK(Experiment):
         """
         return self.fdata["weightSim"]
 
-    def get_osc_weights(self):
-        """ Method for getting the pre-computed oscillation weights.
+    def get_generation_weights(self):
+        """ Method for getting the weights per unit flux, the weights based
+        on the simulation divided by the HKKM flux used in the simulation.
+        """
+        return self.fdata["weightReco"] * self.get_flux_weights()
+
+    def get_osc_weights(self, params=None, **options):
+        """ Method for getting the oscillation weights. Without oscillation
+        parameters, the pre-computed ones are used:
           a) Oscillation parameters as in table II
           of https://doi.org/10.1103/PhysRevD.97.072001
           b) Oscillation parameters as the best fit result
           in https://doi.org/10.1103/PhysRevD.97.072001
         """
+        if params is not None:
+            return super(SK, self).get_osc_weights(params, **options)
         # a)
         return self.fdata["weightOsc_SKpaper"]
         # b)
@@ -196,7 +266,8 @@ class SK(Experiment):
 
 """ Class for the Super-Kamiokande experiment with H-neutron tagging. """
 class SK_Htag(SK):
-    def __init__(self, fname, variables, flavors, cp, interaction, samples):
+    def __init__(self, fname, variables, flavors, cp,
+                 interaction, samples, **kwargs):
         super(
             SK_Htag,
             self).__init__(
@@ -205,7 +276,8 @@ class SK_Htag(SK):
             flavors,
             cp,
             interaction,
-            samples)
+            samples,
+            **kwargs)
 
         """ Name of the experiment. """
         self.experiment = "SK w/ H-neutron tagging"
@@ -225,6 +297,9 @@ class SK_Htag(SK):
         """
         self.variable_logscale["neutron"] = False
 
+        """ Dictionary defining the bin edges of each variable. """
+        self.variable_binning["neutron"] = Integer()
+
         """ Names of the SuperK event samples. """
         self.samples = [
             'SingleRing SubGeV NuElike',
@@ -247,7 +322,8 @@ class SK_Htag(SK):
 
 """ Class for the Super-Kamiokande experiment with Gd-neutron tagging. """
 class SK_Gdtag(SK_Htag):
-    def __init__(self, fname, variables, flavors, cp, interaction, samples):
+    def __init__(self, fname, variables, flavors, cp,
+                 interaction, samples, **kwargs):
         super(
             SK_Gdtag,
             self).__init__(
@@ -256,7 +332,8 @@ class SK_Gdtag(SK_Htag):
             flavors,
             cp,
             interaction,
-            samples)
+            samples,
+            **kwargs)
 
         """ Name of the experiment. """
         self.experiment = "SuperK-Gd"
@@ -269,7 +346,8 @@ class SK_Gdtag(SK_Htag):
 
 """ Class for the Hyper-Kamiokande experiment assuming H-neutron tagging. """
 class HK(SK_Htag):
-    def __init__(self, fname, variables, flavors, cp, interaction, samples):
+    def __init__(self, fname, variables, flavors, cp,
+                 interaction, samples, **kwargs):
         super(
             HK,
             self).__init__(
@@ -278,10 +356,11 @@ class HK(SK_Htag):
             flavors,
             cp,
             interaction,
-            samples)
+            samples,
+            **kwargs)
 
         """ Name of the experiment. """
         self.experiment = "HyperK"
 
         """ Assuming HK will have 8.3 times larger volume than SK. """
-        self.normalization *= 8.3  # events / HK / year
+        self.scale_normalization(8.3)  # events / HK / year
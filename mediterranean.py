@@ -1,9 +1,11 @@
 from south_pole import IC
+from oscillation import EarthModel
 import numpy as np
 
 """ Class for the ORCA experiment. """
 class ORCA(IC):
-    def __init__(self, fname, variables, flavors, cp, interaction, samples):
+    def __init__(self, fname, variables, flavors, cp,
+                 interaction, samples, **kwargs):
         super(
             ORCA,
             self).__init__(
@@ -12,7 +14,8 @@ class ORCA(IC):
             flavors,
             cp,
             interaction,
-            samples)
+            samples,
+            **kwargs)
 
         """ Name of the experiment. """
         self.experiment = "ORCA"
@@ -20,5 +23,11 @@ class ORCA(IC):
         """ ORCA MC file was enlarged by 15. """
         self.normalization *= 1 / 15  # events / ORCA / year
 
+        """ ORCA lies about 2.45 km under the sea surface. """
+        self.earth = EarthModel(detector_depth=2.45)
+
+        """ Site of the flux tables, Frejus being the closest HKKM site. """
+        self.flux_site = "frj"
+
         """ Names of the IC event samples. """
-        self.samples = ["Cascades", "Tracks", "Itermediate"]
+        self.samples = ["Cascades", "Tracks", "Intermediate"]
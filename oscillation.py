@@ -0,0 +1,518 @@
+from collections import OrderedDict
+import numpy as np
+
+""" Default oscillation parameters (normal ordering, NuFIT 5.2). Angles in
+radians and mass splittings in eV^2.
+"""
+DEFAULT_PARAMS = {
+    "theta12": np.arcsin(np.sqrt(0.303)),
+    "theta13": np.arcsin(np.sqrt(0.02225)),
+    "theta23": np.arcsin(np.sqrt(0.451)),
+    "dcp": np.radians(232),
+    "dm21": 7.41e-5,
+    "dm31": 2.507e-3}
+
+""" Delta m^2 / (2 E) in 1/km for Delta m^2 in eV^2 and E in GeV, and the
+matter potential sqrt(2) G_F N_e in 1/km for a density in g/cm^3 times the
+electron fraction.
+"""
+VACUUM_FACTOR = 2.533865
+MATTER_FACTOR = 3.867882e-4
+
+""" Neutrino PDG codes of each flavor index. """
+FLAVORS = (12, 14, 16)
+
+
+class EarthModel:
+    """ Earth made of concentric shells of constant density, surrounded by
+    the atmosphere where the neutrinos are produced. The default is a four
+    layer approximation of PREM.
+    """
+
+    def __init__(self, radii=(1221.5, 3480., 5701., 6371.),
+                 densities=(13.0, 11.3, 5.0, 3.3),
+                 electron_fractions=(0.466, 0.466, 0.496, 0.496),
+                 production_height=15., detector_depth=0.):
+        r"""Define the shells of the Earth.
+        Args:
+            radii ([float]): Outer radius of each shell in km, increasing.
+            densities ([float]): Density of each shell in g/cm^3.
+            electron_fractions ([float]): Electron fraction of each shell.
+            production_height (float): Height of neutrino production in km.
+            detector_depth (float): Depth of the detector in km.
+        """
+        self.radii = np.append(radii, radii[-1] + production_height)
+        self.potentials = MATTER_FACTOR * np.append(
+            np.multiply(densities, electron_fractions), 0.)
+        self.detector_radius = radii[-1] - detector_depth
+
+    def segments(self, coszen):
+        """ Lengths and matter potentials of the segments crossed by each
+        neutrino, in the order they are traveled from production to detection.
+        Args:
+            coszen (array): Cosine of the zenith angle at the detector.
+
+        Returns:
+            (array of lengths in km [event, segment],
+             array of potentials in 1/km [segment])
+        """
+        coszen = np.asarray(coszen, dtype=float)
+        rd = self.detector_radius
+        total = np.sqrt(self.radii[-1]**2 - rd**2 * (1 - coszen**2)) - rd * coszen
+        """ Interval of distances from the detector, towards the production
+        point, spent inside each sphere. Empty intervals collapse to a point
+        at the start of the enclosing one.
+        """
+        lo, hi = [], []
+        a, b = np.zeros_like(total), total
+        for r in self.radii[::-1]:
+            disc = rd**2 * coszen**2 - rd**2 + r**2
+            root = np.sqrt(np.maximum(disc, 0))
+            a_in = np.clip(-rd * coszen - root, a, b)
+            b_in = np.clip(-rd * coszen + root, a, b)
+            empty = (disc <= 0) | (b_in <= a_in)
+            a = np.where(empty, a, a_in)
+            b = np.where(empty, a, b_in)
+            lo.append(a)
+            hi.append(b)
+        lo.append(lo[-1])
+        hi.append(lo[-1])
+        nshells = len(self.radii)
+        """ Far side of every shell from the outermost inwards, then the near
+        side from the innermost outwards.
+        """
+        far = [hi[i] - hi[i + 1] for i in range(nshells)]
+        near = [lo[i + 1] - lo[i] for i in range(nshells)]
+        lengths = np.stack(far + near[::-1], axis=-1)
+        potentials = np.concatenate(
+            (self.potentials[::-1], self.potentials))
+        return lengths, potentials
+
+
+def pmns(params):
+    """ PMNS mixing matrix for a set of oscillation parameters. """
+    s12, c12 = np.sin(params["theta12"]), np.cos(params["theta12"])
+    s13, c13 = np.sin(params["theta13"]), np.cos(params["theta13"])
+    s23, c23 = np.sin(params["theta23"]), np.cos(params["theta23"])
+    phase = np.exp(1j * params["dcp"])
+    return np.array([
+        [c12 * c13, s12 * c13, s13 / phase],
+        [-s12 * c23 - c12 * s23 * s13 * phase,
+         c12 * c23 - s12 * s23 * s13 * phase, s23 * c13],
+        [s12 * s23 - c12 * c23 * s13 * phase,
+         -c12 * s23 - s12 * c23 * s13 * phase, c23 * c13]])
+
+
+def vacuum_hamiltonian(params, antineutrino=False):
+    """ Vacuum Hamiltonian in the flavor basis times the energy, in GeV/km. """
+    u = pmns(params)
+    if antineutrino:
+        u = u.conj()
+    masses = np.diag([0, params["dm21"], params["dm31"]])
+    return VACUUM_FACTOR * u @ masses @ u.conj().T
+
+
+def propagate(h, potential, length, psi, eigenvalues=None):
+    """ Apply the evolution operators exp(-i H L) of constant Hamiltonians to
+    flavor states, up to a global phase. The operator is written in terms of
+    the eigenvalues of the traceless part T of H as c2 T^2 + c1 T + c0 (Ohlsson
+    and Snellman, J. Math. Phys. 41, 2768), so it is never built explicitly.
+    Args:
+        h (dict): Components (i, j) of the Hermitian vacuum Hamiltonians,
+            upper triangle, one value per event in 1/km. Diagonal components
+            are real.
+        potential (array): Matter potential added to the (e, e) component.
+        length (array): Lengths in km.
+        psi (array): Flavor states with shape [flavor, state, event].
+        eigenvalues ([array]): Two eigenvalues of T when already known, as
+            in vacuum.
+
+    Returns:
+        Array with the evolved states.
+    """
+    d0 = h[0, 0] + potential
+    trace = (d0 + h[1, 1] + h[2, 2]) / 3
+    d0 = d0 - trace
+    d1 = h[1, 1] - trace
+    d2 = h[2, 2] - trace
+    t01, t02, t12 = h[0, 1], h[0, 2], h[1, 2]
+    if eigenvalues is None:
+        n01 = t01.real**2 + t01.imag**2
+        n02 = t02.real**2 + t02.imag**2
+        n12 = t12.real**2 + t12.imag**2
+        a = np.maximum((d0**2 + d1**2 + d2**2) / 2 + n01 + n02 + n12, 1e-300)
+        b = (d0 * d1 * d2 + 2 * (t01 * t12 * t02.conj()).real
+             - d0 * n12 - d1 * n02 - d2 * n01)
+        scale = np.sqrt(a / 3)
+        cos_angle = np.cos(np.arccos(np.clip(b / (2 * scale**3), -1, 1)) / 3)
+        sin_angle = np.sqrt(1 - cos_angle**2)
+        lam = [2 * scale * cos_angle,
+               scale * (np.sqrt(3) * sin_angle - cos_angle)]
+    else:
+        lam = list(eigenvalues)
+    lam.append(-lam[0] - lam[1])
+
+    """ Phases exp(-i lambda L), the third one from the first two as the
+    eigenvalues add up to zero, with arguments reduced to [-pi, pi].
+    """
+    cos, sin = [], []
+    for k in range(2):
+        phase = lam[k] * length
+        phase -= 2 * np.pi * np.rint(phase / (2 * np.pi))
+        cos.append(np.cos(phase))
+        sin.append(-np.sin(phase))
+    cos.append(cos[0] * cos[1] - sin[0] * sin[1])
+    sin.append(-(sin[0] * cos[1] + cos[0] * sin[1]))
+    c = np.zeros((3, 2, len(length)))
+    for k in range(3):
+        w = 1 / ((lam[k] - lam[k - 1]) * (lam[k] - lam[k - 2]))
+        re, im = cos[k] * w, sin[k] * w
+        c[0, 0] += re
+        c[0, 1] += im
+        c[1, 0] += re * lam[k]
+        c[1, 1] += im * lam[k]
+        re *= lam[k]**2 - (lam[0]**2 + lam[1]**2 + lam[2]**2) / 2
+        im *= lam[k]**2 - (lam[0]**2 + lam[1]**2 + lam[2]**2) / 2
+        c[2, 0] += re
+        c[2, 1] += im
+    c = c[:, 0] + 1j * c[:, 1]
+    d0, d1, d2 = (d.astype(complex) for d in (d0, d1, d2))
+    t10, t20, t21 = t01.conj(), t02.conj(), t12.conj()
+
+    def apply(v):
+        out = np.empty_like(v)
+        out[0] = d0 * v[0] + t01 * v[1] + t02 * v[2]
+        out[1] = t10 * v[0] + d1 * v[1] + t12 * v[2]
+        out[2] = t20 * v[0] + t21 * v[1] + d2 * v[2]
+        return out
+
+    tpsi = apply(psi)
+    return c[0] * apply(tpsi) + c[1] * tpsi + c[2] * psi
+
+
+class Oscillator:
+    """ Three-flavor oscillation probabilities of a set of events crossing a
+    layered Earth. The path through the Earth of each event only depends on
+    its zenith angle and is computed once, so the probabilities can be
+    evaluated again for any set of oscillation parameters. Events are kept
+    sorted by zenith angle, so the events crossing each layer are contiguous.
+    """
+
+    def __init__(self, energy, coszen, antineutrino, earth=None,
+                 resolution=None, block=8192):
+        r"""Prepare the events for the computation of the probabilities.
+        Args:
+            energy (array): True neutrino energy in GeV.
+            coszen (array): True cosine of the zenith angle.
+            antineutrino (array): True for antineutrinos.
+            earth (EarthModel): Model of the Earth. Defaults to EarthModel().
+            resolution ((float, float)): Bin widths in log10(energy) and
+                cosine zenith. Events in the same bin share the probabilities
+                computed at the center of the bin. None computes them for
+                every event.
+            block (int): Number of events processed at once.
+        """
+        self.earth = EarthModel() if earth is None else earth
+        self.block = block
+        energy = np.asarray(energy, dtype=float)
+        coszen = np.asarray(coszen, dtype=float)
+        antineutrino = np.asarray(antineutrino, dtype=bool)
+        inverse = None
+        if resolution is not None:
+            logbin = np.floor(np.log10(energy) / resolution[0])
+            zenbin = np.floor(coszen / resolution[1])
+            keys = np.stack((zenbin, logbin, antineutrino), axis=-1)
+            keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            coszen = np.clip((keys[:, 0] + 0.5) * resolution[1], -1, 1)
+            energy = 10**((keys[:, 1] + 0.5) * resolution[0])
+            antineutrino = keys[:, 2].astype(bool)
+        """ Position of each event in the zenith ordering. """
+        order = np.argsort(coszen, kind="stable")
+        self.position = np.empty_like(order)
+        self.position[order] = np.arange(order.size)
+        if inverse is not None:
+            self.position = self.position[inverse]
+        self.inv_energy = 1 / energy[order]
+        self.antineutrino = antineutrino[order]
+        self.lengths, self.potentials = self.earth.segments(coszen[order])
+
+    def probabilities(self, params=None):
+        """ Oscillation probabilities from electron and muon neutrinos, the
+        flavors in the atmospheric flux, of every event.
+        Args:
+            params (dict): Oscillation parameters, DEFAULT_PARAMS if None.
+
+        Returns:
+            Array with shape [event, alpha, beta], alpha over (e, mu) and
+            beta over (e, mu, tau).
+        """
+        params = DEFAULT_PARAMS if params is None else params
+        hvac = np.stack((vacuum_hamiltonian(params, False),
+                         vacuum_hamiltonian(params, True)))
+        nevents = len(self.inv_energy)
+        prob = np.empty((nevents, 2, 3))
+        for start in range(0, nevents, self.block):
+            stop = min(start + self.block, nevents)
+            nubar = self.antineutrino[start:stop].astype(np.intp)
+            inv_energy = self.inv_energy[start:stop]
+            h = {(i, j): hvac[nubar, i, j] * inv_energy
+                 for i in range(3) for j in range(i + 1, 3)}
+            h.update({(i, i): hvac[nubar, i, i].real * inv_energy
+                      for i in range(3)})
+            sign = 1 - 2. * nubar
+            """ Eigenvalues of the traceless vacuum Hamiltonian. """
+            shift = (params["dm21"] + params["dm31"]) / 3
+            vacuum = [VACUUM_FACTOR * -shift * inv_energy,
+                      VACUUM_FACTOR * (params["dm21"] - shift) * inv_energy]
+            psi = np.zeros((3, 2, stop - start), dtype=complex)
+            psi[0, 0] = psi[1, 1] = 1
+            for j, potential in enumerate(self.potentials):
+                length = self.lengths[start:stop, j]
+                active = np.flatnonzero(length > 0)
+                if active.size == 0:
+                    continue
+                if active[-1] == active.size - 1:
+                    active = slice(0, active.size)
+                eigenvalues = None
+                if potential == 0:
+                    eigenvalues = [lam[active] for lam in vacuum]
+                psi[:, :, active] = propagate(
+                    {key: value[active] for key, value in h.items()},
+                    sign[active] * potential,
+                    length[active],
+                    psi[:, :, active],
+                    eigenvalues)
+            prob[start:stop] = (psi.real**2 + psi.imag**2).transpose(2, 1, 0)
+        return prob[self.position]
+
+    def weights(self, flavor, params=None, flux_ratio=0.5):
+        r"""Oscillation weights of events simulated without oscillations. The
+        flux of each flavor is reweighted by the oscillated fluxes reaching
+        the detector, with tau neutrinos simulated with the muon neutrino flux.
+        Args:
+            flavor (array): PDG code of the neutrino of each event.
+            params (dict): Oscillation parameters, DEFAULT_PARAMS if None.
+            flux_ratio (float or array): Ratio of the electron to muon
+                neutrino flux of each event.
+
+        Returns:
+            Array with the weight of each event.
+        """
+        prob = self.probabilities(params)
+        beta = flavor_index(flavor)
+        events = np.arange(len(beta))
+        return oscillation_weights(
+            prob[events, 0, beta], prob[events, 1, beta], beta, flux_ratio)
+
+
+def flavor_index(flavor):
+    """ Index over (e, mu, tau) of the neutrino PDG codes. """
+    return np.minimum(np.searchsorted(FLAVORS, np.abs(flavor)), 2)
+
+
+def oscillation_weights(p_e, p_mu, beta, flux_ratio=0.5):
+    r"""Oscillation weights of events simulated without oscillations given
+    their oscillation probabilities, with tau neutrinos simulated with the
+    muon neutrino flux.
+    Args:
+        p_e (array): Probability of an electron neutrino to oscillate into
+            the flavor of each event.
+        p_mu (array): Same for a muon neutrino.
+        beta (array): Flavor index of each event, as given by flavor_index.
+        flux_ratio (float or array): Ratio of the electron to muon neutrino
+            flux of each event.
+
+    Returns:
+        Array with the weight of each event.
+    """
+    ratio = np.broadcast_to(flux_ratio, beta.shape)
+    return np.where(beta == 0, p_e + p_mu / ratio, p_mu + ratio * p_e)
+
+
+class ProbabilityTable:
+    """ Oscillation probabilities tabulated on a grid of log10(energy) and
+    cosine zenith, for neutrinos and antineutrinos, and interpolated
+    bilinearly for every event. The grid of each set of oscillation
+    parameters is computed once and kept in a least recently used cache, so
+    scans revisiting parameter points do not compute it again. Events whose
+    grid cell spans too large a change of the oscillation phase, e.g. at low
+    energy or near the horizon, where interpolating between nodes would be
+    meaningless, are computed exactly instead.
+    """
+
+    def __init__(self, energy, coszen, antineutrino, earth=None,
+                 energy_nodes=400, coszen_nodes=200, maxsize=32,
+                 max_phase=0.5, max_dm2=3e-3):
+        r"""Locate the events in the grid.
+        Args:
+            energy (array): True neutrino energy in GeV.
+            coszen (array): True cosine of the zenith angle.
+            antineutrino (array): True for antineutrinos.
+            earth (EarthModel): Model of the Earth. Defaults to EarthModel().
+            energy_nodes (int): Number of grid nodes in log10(energy),
+                spanning the energies of the events.
+            coszen_nodes (int): Number of grid nodes in cosine zenith.
+            maxsize (int): Number of grids kept in the cache.
+            max_phase (float): Largest change in radians of the oscillation
+                phase over the grid cell of an interpolated event.
+            max_dm2 (float): Largest mass splitting in eV^2 of the
+                parameters evaluated, bounding the oscillation phase.
+        """
+        self.energy = np.asarray(energy, dtype=float)
+        self.coszen = np.asarray(coszen, dtype=float)
+        self.antineutrino = np.asarray(antineutrino, dtype=bool)
+        self.maxsize = maxsize
+        self.grids = OrderedDict()
+        logs = np.log10(self.energy)
+        log_nodes = np.linspace(logs.min(), logs.max(), energy_nodes)
+        zen_nodes = np.linspace(-1, 1, coszen_nodes)
+        self.shape = (2, energy_nodes, coszen_nodes)
+        nubar, log_mesh, zen_mesh = np.meshgrid(
+            [False, True], log_nodes, zen_nodes, indexing="ij")
+        self.nodes = Oscillator(
+            10**log_mesh.ravel(), zen_mesh.ravel(), nubar.ravel(), earth=earth)
+
+        """ Corners of the grid cell of each event and their weights. """
+        corners, fractions = [], []
+        for x, grid in ((logs, log_nodes), (self.coszen, zen_nodes)):
+            step = grid[1] - grid[0]
+            i = np.clip(((x - grid[0]) / step).astype(np.intp), 0, len(grid) - 2)
+            corners.append(i)
+            fractions.append(np.clip((x - grid[i]) / step, 0, 1))
+        base = np.ravel_multi_index(
+            (self.antineutrino.astype(np.intp), corners[0], corners[1]),
+            self.shape)
+        self.corners = [base, base + 1, base + coszen_nodes,
+                        base + coszen_nodes + 1]
+        fe, fz = fractions
+        self.fractions = [(1 - fe) * (1 - fz), (1 - fe) * fz,
+                          fe * (1 - fz), fe * fz]
+
+        """ Bound on the change of the phase over the cell of each event:
+        the eigenvalues of the Hamiltonian in a segment differ by at most
+        the vacuum splitting plus its matter potential, and the phase is
+        their difference times the length of the segment. The lengths of
+        the segments change fastest at the boundaries of the shells.
+        """
+        earth = self.nodes.earth
+        lengths, potentials = earth.segments(zen_nodes)
+        steps = np.abs(np.diff(lengths, axis=0))
+        baselines = lengths.sum(axis=-1)
+        i, j = corners
+        e_lo, e_hi = 10**log_nodes[i], 10**log_nodes[i + 1]
+        phase = (VACUUM_FACTOR * max_dm2 / e_lo * steps.sum(axis=-1)[j]
+                 + (steps @ np.abs(potentials))[j]
+                 + VACUUM_FACTOR * max_dm2 * np.maximum(baselines[j], baselines[j + 1])
+                 * (1 / e_lo - 1 / e_hi))
+        self.exact_events = np.flatnonzero(phase > max_phase)
+        self.exact_slot = np.full(len(self.energy), -1, dtype=np.intp)
+        self.exact_slot[self.exact_events] = np.arange(self.exact_events.size)
+        self.exact = None
+        if self.exact_events.size:
+            self.exact = Oscillator(
+                self.energy[self.exact_events], self.coszen[self.exact_events],
+                self.antineutrino[self.exact_events], earth=earth)
+
+    def grid(self, params=None):
+        """ Probabilities at the nodes of the grid and exact probabilities
+        of the events computed exactly, for a set of oscillation parameters,
+        from the cache when available.
+        """
+        params = DEFAULT_PARAMS if params is None else params
+        key = tuple(sorted(params.items()))
+        if key in self.grids:
+            self.grids.move_to_end(key)
+            return self.grids[key]
+        exact = None if self.exact is None else self.exact.probabilities(params)
+        grid = (self.nodes.probabilities(params), exact)
+        self.grids[key] = grid
+        if len(self.grids) > self.maxsize:
+            self.grids.popitem(last=False)
+        return grid
+
+    def probabilities(self, params=None):
+        """ Interpolated oscillation probabilities of every event.
+        Args:
+            params (dict): Oscillation parameters, DEFAULT_PARAMS if None.
+
+        Returns:
+            Array with shape [event, alpha, beta], alpha over (e, mu) and
+            beta over (e, mu, tau).
+        """
+        nodes, exact = self.grid(params)
+        prob = 0
+        for corner, fraction in zip(self.corners, self.fractions):
+            prob = prob + nodes[corner] * fraction[:, None, None]
+        if exact is not None:
+            prob[self.exact_events] = exact
+        return prob
+
+    def weights(self, flavor, params=None, flux_ratio=0.5):
+        r"""Oscillation weights interpolated for every event.
+        Args:
+            flavor (array): PDG code of the neutrino of each event.
+            params (dict): Oscillation parameters, DEFAULT_PARAMS if None.
+            flux_ratio (float or array): Ratio of the electron to muon
+                neutrino flux of each event.
+
+        Returns:
+            Array with the weight of each event.
+        """
+        return self.grid_weights(self.grid(params), flavor, flux_ratio)
+
+    def grid_weights(self, grid, flavor, flux_ratio=0.5, events=None):
+        r"""Oscillation weights interpolated on a grid of probabilities.
+        Args:
+            grid ((array, array)): Probabilities at the nodes and of the
+                events computed exactly, as returned by grid.
+            flavor (array): PDG code of the neutrino of each event.
+            flux_ratio (float or array): Ratio of the electron to muon
+                neutrino flux of each event.
+            events (array or slice): Events whose weights are interpolated,
+                every event if None. flavor holds the flavors of these
+                events only.
+
+        Returns:
+            Array with the weight of each event.
+        """
+        nodes, exact = grid
+        nodes = nodes.reshape(-1, 6)
+        beta = flavor_index(flavor)
+        events = slice(None) if events is None else events
+        p_e = p_mu = 0
+        for corner, fraction in zip(self.corners, self.fractions):
+            corner, fraction = corner[events], fraction[events]
+            p_e = p_e + nodes[corner, beta] * fraction
+            p_mu = p_mu + nodes[corner, beta + 3] * fraction
+        if exact is not None:
+            slot = self.exact_slot[events]
+            inside = np.flatnonzero(slot >= 0)
+            p_e[inside] = exact[slot[inside], 0, beta[inside]]
+            p_mu[inside] = exact[slot[inside], 1, beta[inside]]
+        return oscillation_weights(p_e, p_mu, beta, flux_ratio)
+
+    def accuracy(self, params=None, nevents=100000, seed=0):
+        """ Difference between the interpolated probabilities and the exact
+        ones of a random subset of the events.
+        Args:
+            params (dict): Oscillation parameters, DEFAULT_PARAMS if None.
+            nevents (int): Number of events compared.
+            seed (int): Seed of the selection of events.
+
+        Returns:
+            Dictionary with the maximum, root mean square and mean absolute
+            difference of the probabilities.
+        """
+        rng = np.random.default_rng(seed)
+        nevents = min(nevents, len(self.energy))
+        events = rng.choice(len(self.energy), nevents, replace=False)
+        exact = Oscillator(
+            self.energy[events],
+            self.coszen[events],
+            self.antineutrino[events],
+            earth=self.nodes.earth).probabilities(params)
+        diff = np.abs(self.probabilities(params)[events] - exact)
+        return {"max": float(diff.max()),
+                "rms": float(np.sqrt(np.mean(diff**2))),
+                "mean": float(diff.mean())}
@@ -1,7 +1,45 @@
 import argparse
+import os
 import sys
 
 
+def load_experiment(experiment, input_file, variables, flavors, cp,
+                    interaction, samples, **options):
+    """ Load the simulation file of an experiment given its name. The options
+    are passed to the experiment class.
+    """
+    if experiment == "ICUp":
+        from south_pole import IC
+        exp = IC(input_file, variables, flavors, cp, interaction, samples, **options)
+    elif experiment == "ORCA":
+        from mediterranean import ORCA
+        exp = ORCA(input_file, variables, flavors, cp, interaction, samples, **options)
+    elif experiment == "SK":
+        from kamioka import SK
+        exp = SK(input_file, variables, flavors, cp, interaction, samples, **options)
+        exp.print_samples()
+    elif experiment == "SK-Htag":
+        from kamioka import SK_Htag
+        exp = SK_Htag(input_file, variables, flavors, cp, interaction, samples, **options)
+        exp.print_samples()
+    elif experiment == "SK-Gd":
+        from kamioka import SK_Gdtag
+        exp = SK_Gdtag(
+            input_file,
+            variables,
+            flavors,
+            cp,
+            interaction,
+            samples,
+            **options)
+        exp.print_samples()
+    elif experiment == "HK":
+        from kamioka import HK
+        exp = HK(input_file, variables, flavors, cp, interaction, samples, **options)
+        exp.print_samples()
+    return exp
+
+
 def main():
 
     parser = argparse.ArgumentParser()
@@ -10,17 +48,17 @@ def main():
     required.add_argument(
         "--experiment",
         type=str,
-        nargs="?",
+        nargs="+",
         choices=("SK", "SK-Htag", "SK-Gd", "ORCA", "ICUp", "HK"),
         required=True,
-        help="Experiment you would like to use.")
+        help="Experiment(s) you would like to use.")
     required.add_argument(
         "--fname",
         type=str,
-        nargs="?",
+        nargs="+",
         required=True,
         help="Path to simulation file of the experiment you would \
-        like to use (SK, SK-Htag, SK-Gd, ORCA, ICUp or HK).")
+        like to use (SK, SK-Htag, SK-Gd, ORCA, ICUp or HK), one per experiment.")
     optional.add_argument(
         "--variables",
         type=str,
@@ -59,24 +97,201 @@ def main():
         (for IC: tracks or cascades; for ORCA: tracks, intermediate or cascades; \
         for SK and HK numerical indeces (displayed when calling these detectors)). \
         Default is plotting all samples. Default is plotting all samples.")
+    optional.add_argument(
+        "--flux",
+        type=str,
+        default=None,
+        help="Reweight the events to the atmospheric flux of this table, an \
+        HKKM text table or an NPZ file written by flux.FluxTable.save.")
+    optional.add_argument(
+        "--flux-tilt",
+        type=float,
+        default=0.,
+        help="Change of the spectral index of the flux given by --flux. \
+        Default is 0.")
+    optional.add_argument(
+        "--flux-nubar",
+        type=float,
+        default=0.,
+        help="Relative shift of the neutrino (+) and antineutrino (-) fluxes \
+        given by --flux. Default is 0.")
+    optional.add_argument(
+        "--no-mmap",
+        action="store_true",
+        help="Copy every dataset into memory instead of memory-mapping the \
+        contiguous ones.")
+    optional.add_argument(
+        "--column-report",
+        action="store_true",
+        help="Report which datasets were memory-mapped, copied or read from the \
+        cache of derived quantities, and the time spent reading and processing \
+        chunks with --chunk-size.")
+    optional.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the on-disk cache of derived columns and scalars.")
+    optional.add_argument(
+        "--no-store",
+        action="store_true",
+        help="Do not reuse or save the histograms in the histogram store.")
+    optional.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Directory where the figures are saved without displaying them.")
+    optional.add_argument(
+        "--format",
+        type=str,
+        choices=("png", "pdf"),
+        default="png",
+        help="Format of the saved figures. Default is png.")
+    optional.add_argument(
+        "--export",
+        type=str,
+        default=None,
+        help="Directory where the histograms are saved as numbers, with bin \
+        edges, sums of weights and of squared weights, normalization and the \
+        provenance of the input file. No figure is displayed unless --output \
+        is also given.")
+    optional.add_argument(
+        "--export-format",
+        type=str,
+        choices=("hdf5", "npz", "csv"),
+        default="hdf5",
+        help="Format of the exported histograms. Default is hdf5.")
+    optional.add_argument(
+        "--replicas",
+        type=int,
+        default=0,
+        help="Number of Poisson or bootstrap replicas of the simulation whose \
+        histograms are exported with --export (hdf5 or npz), for the \
+        statistical uncertainty of the simulation. Default is none.")
+    optional.add_argument(
+        "--resampling",
+        type=str,
+        choices=("poisson", "bootstrap"),
+        default="poisson",
+        help="Resampling method of the replicas. Default is poisson.")
+    optional.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the random streams of the replicas. Default is 0.")
+    optional.add_argument(
+        "--heatmaps",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Pairs of variables, comma separated, whose 2D histograms are \
+        drawn as heat maps per sample, e.g. reco_energy,reco_coszen or \
+        Enu,reco_energy for the energy migration.")
+    optional.add_argument(
+        "--oscillogram",
+        action="store_true",
+        help="Draw the heat map of the true neutrino energy and cosine zenith \
+        (Enu,cos_zen) of every sample.")
+    optional.add_argument(
+        "--binning",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Binning of variables as name=spec, overriding those of the \
+        experiments, with spec linear[:bins[:lo:hi]], log[:bins[:lo:hi]], \
+        integer[:max_bins], quantile[:bins] (equal sums of weights) or \
+        fixed:e0,e1,... e.g. Enu=log:30 reco_coszen=fixed:-1,-0.5,0,0.5,1.")
+    optional.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of processes rendering the saved figures. Default is the \
+        number of CPUs.")
+    optional.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Process the simulation files in chunks of this many events \
+        instead of loading the plotted columns in memory.")
+    optional.add_argument(
+        "--list-samples",
+        action="store_true",
+        help="Print the event samples of the experiments and exit without \
+        plotting.")
+    optional.add_argument(
+        "--list-variables",
+        action="store_true",
+        help="Print the variables found in the simulation files, with the \
+        names they can be requested by, and exit without plotting.")
+    optional.add_argument(
+        "--inspect",
+        action="store_true",
+        help="Print the datasets of the simulation files, with their shape, \
+        type, chunks, compression and size, read from the file metadata only, \
+        and exit.")
+    optional.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report the wall time, data read, memory allocated and peak \
+        memory of each stage of the run (also set by ATMO_MC_PROFILE=1). Figures \
+        rendered by worker processes are only included with --processes 1.")
+    optional.add_argument(
+        "--profile-output",
+        type=str,
+        default=None,
+        help="Save the cProfile statistics of the run to this file, e.g. for \
+        snakeviz or flameprof (also set by ATMO_MC_PROFILE_OUTPUT).")
     parser._action_groups.append(optional)
     args = parser.parse_args()
+    if len(args.experiment) != len(args.fname):
+        parser.error("--experiment and --fname need the same number of values.")
+    if args.replicas and (args.chunk_size is not None or args.export_format == "csv"):
+        parser.error("--replicas needs in-memory histograms and an hdf5 or npz export.")
+    heatmaps = [tuple(pair.split(",")) for pair in args.heatmaps]
+    if args.oscillogram:
+        heatmaps.append(("Enu", "cos_zen"))
+    if any(len(pair) != 2 for pair in heatmaps):
+        parser.error("--heatmaps takes pairs of variables, e.g. reco_energy,reco_coszen.")
+    if heatmaps and args.chunk_size is not None:
+        parser.error("--heatmaps and --oscillogram need in-memory histograms.")
+    from binning import parse_binning
+    binnings = []
+    for text in args.binning:
+        name, __, spec = text.partition("=")
+        try:
+            binnings.append((name, parse_binning(spec)))
+        except ValueError as error:
+            parser.error(f"--binning {text}: {error}")
 
-    input_file = args.fname
-    experiment = args.experiment
     variables = args.variables
     flavors = args.flavor
     interaction = args.interaction
     cp = args.CP
-    if "," in args.samples:
-        samples = [int(item) for item in args.samples.split(',')]
-    else:
-        samples = args.samples
+    samples = args.samples
+    if samples != "All":
+        samples = samples.split(",")
+    options = dict(mmap=not args.no_mmap, cache=not args.no_cache,
+                   store=not args.no_store)
+
+    if args.inspect:
+        from columns import print_inspection
+        for input_file in args.fname:
+            print_inspection(input_file)
+        return
+    listing = args.list_samples or args.list_variables
+    if listing:
+        """ Listing reads no events: the cache and the histogram store would
+        hash the whole simulation file for nothing.
+        """
+        options.update(cache=False, store=False)
+
+    from profiling import profiler
+    if (args.profile or args.profile_output) and not profiler.enabled:
+        profiler.enable(args.profile_output)
 
     """ Telling which variables the program is about to plot."""
-    print("\nVariables to be plotted\n-------------------------------------")
-    for variable in variables:
-        print(f"  + {variable}")
+    if not listing:
+        print("\nVariables to be plotted\n-------------------------------------")
+        for variable in variables:
+            print(f"  + {variable}")
 
     r""" Calling each experiment"s plotting module. One-dimensional non-oscillated
     variable  distributions will be displayed. For additional plots and breakdowns,
@@ -86,40 +301,63 @@ def main():
     in the atmosphere and in the simulations, they assume the muon neutrino flux.
     """
 
-    if experiment == "ICUp":
-        from south_pole import IC
-        exp = IC(input_file, variables, flavors, cp, interaction, samples)
-        exp.plot()
-    elif experiment == "ORCA":
-        from mediterranean import ORCA
-        exp = ORCA(input_file, variables, flavors, cp, interaction, samples)
-        exp.plot()
-    elif experiment == "SK":
-        from kamioka import SK
-        exp = SK(input_file, variables, flavors, cp, interaction, samples)
-        exp.print_samples()
-        exp.plot()
-    elif experiment == "SK-Htag":
-        from kamioka import SK_Htag
-        exp = SK_Htag(input_file, variables, flavors, cp, interaction, samples)
-        exp.print_samples()
-        exp.plot()
-    elif experiment == "SK-Gd":
-        from kamioka import SK_Gdtag
-        exp = SK_Gdtag(
+    table = None
+    if args.flux is not None:
+        from flux import FluxTable
+        table = FluxTable.load(args.flux)
+
+    experiments = []
+    for experiment, input_file in zip(args.experiment, args.fname):
+        exp = load_experiment(
+            experiment,
             input_file,
-            variables,
+            list(variables),
             flavors,
             cp,
             interaction,
-            samples)
-        exp.print_samples()
-        exp.plot()
-    elif experiment == "HK":
-        from kamioka import HK
-        exp = HK(input_file, variables, flavors, cp, interaction, samples)
-        exp.print_samples()
-        exp.plot()
+            samples if isinstance(samples, str) else list(samples),
+            **options)
+        if table is not None:
+            exp.set_flux(table, args.flux_tilt, args.flux_nubar)
+        exp.plotting_heatmaps = list(heatmaps)
+        for name, spec in binnings:
+            variable = exp.find_variable(name)
+            if variable:
+                exp.variable_binning[variable] = spec
+        experiments.append((experiment, exp))
+
+    if listing:
+        """ Samples of SK and HK are printed when they are loaded. """
+        for experiment, exp in experiments:
+            if args.list_samples and experiment in ("ICUp", "ORCA"):
+                exp.print_samples()
+            if args.list_variables:
+                exp.print_variables()
+        return
+
+    if args.export is not None:
+        os.makedirs(args.export, exist_ok=True)
+        for experiment, exp in experiments:
+            fname = os.path.join(args.export, f"{experiment}_histograms.{args.export_format}")
+            exp.export(fname, args.chunk_size, args.replicas, args.resampling, args.seed)
+            print(f"Histograms of {experiment} saved to {fname}")
+
+    if args.output is not None:
+        from batch import render
+        render(experiments, args.output, args.format, args.processes,
+               args.chunk_size)
+    elif args.export is None:
+        for __, exp in experiments:
+            exp.plot(chunk_size=args.chunk_size)
+
+    if args.column_report:
+        for __, exp in experiments:
+            exp.fdata.print_access()
+            if exp.io_timing:
+                exp.print_io_timing()
+
+    if profiler.enabled:
+        profiler.report()
 
 
 # ------------------------------------------------------- #
@@ -0,0 +1,226 @@
+import argparse
+import sys
+import h5py
+import numpy as np
+from joint_fit import DETECTORS, load_detector
+
+""" Version of the layout written by repack, stored in the "repacked"
+attribute of the files.
+"""
+REPACK_VERSION = 1
+
+""" Number of events per chunk of the repacked datasets. """
+CHUNK_EVENTS = 1 << 16
+
+
+def blocks(length, size):
+    """ Ranges [start, stop) splitting a dataset in blocks. """
+    return [(start, min(start + size, length)) for start in range(0, length, size)]
+
+
+def narrow_dtype(ds, float32=True, block=CHUNK_EVENTS * 16):
+    r"""Narrowest type holding every value of a dataset without loss. Integer
+    columns, and float columns with integer values only, get the narrowest
+    signed integer type. Other float columns get float32 if allowed.
+    Args:
+        ds (h5py.Dataset): Dataset to narrow.
+        float32 (bool): Allow float columns to be stored as float32.
+        block (int): Number of events read at once.
+
+    Returns:
+        numpy dtype.
+    """
+    kind = ds.dtype.kind
+    if kind not in "iuf" or ds.ndim != 1 or ds.size == 0:
+        return ds.dtype
+    lo, hi, integral = np.inf, -np.inf, True
+    for start, stop in blocks(ds.shape[0], block):
+        data = ds[start:stop]
+        if kind == "f":
+            integral = integral and bool(np.all(np.isfinite(data) & (data == np.round(data))))
+        lo = min(lo, data.min())
+        hi = max(hi, data.max())
+    if integral:
+        for dtype in (np.int8, np.int16, np.int32, np.int64):
+            info = np.iinfo(dtype)
+            if info.min <= lo and hi <= info.max:
+                return np.dtype(dtype)
+    if kind == "f" and float32 and ds.dtype.itemsize > 4:
+        limit = np.finfo(np.float32).max
+        if not np.isfinite([lo, hi]).all() or max(-lo, hi) < limit:
+            return np.dtype(np.float32)
+    return ds.dtype
+
+
+def repack(input_file, output_file, keep=(), float32=True,
+           chunk_events=CHUNK_EVENTS, compression="lzf"):
+    r"""Rewrite a simulation file with the narrowest safe types, chunks
+    suited to scanning whole columns and a fast compression filter. The
+    datasets are copied block by block, so the memory footprint does not
+    depend on the size of the file.
+    Args:
+        input_file (str): Name of simulation file.
+        output_file (str): Name of the repacked file.
+        keep ([str]): Datasets whose type is kept, e.g. the weights.
+        float32 (bool): Allow float columns to be stored as float32.
+        chunk_events (int): Number of events per chunk.
+        compression (str): Compression filter, lzf or gzip.
+
+    Returns:
+        {dataset: (original dtype, repacked dtype)}
+    """
+    options = {"compression": compression, "shuffle": True}
+    if compression == "gzip":
+        options["compression_opts"] = 1
+    types = {}
+    with h5py.File(input_file, 'r') as fin, h5py.File(output_file, 'w') as fout:
+        fout.attrs.update(fin.attrs)
+        for name, ds in fin.items():
+            if not isinstance(ds, h5py.Dataset):
+                fin.copy(ds, fout, name)
+                continue
+            dtype = ds.dtype if name in keep else narrow_dtype(ds, float32)
+            if ds.ndim == 0 or ds.size == 0:
+                out = fout.create_dataset(name, data=ds[()], dtype=dtype)
+            else:
+                chunks = (min(chunk_events, ds.shape[0]),) + ds.shape[1:]
+                out = fout.create_dataset(
+                    name, shape=ds.shape, dtype=dtype, chunks=chunks, **options)
+                for start, stop in blocks(ds.shape[0], chunk_events * 16):
+                    out[start:stop] = ds[start:stop].astype(dtype)
+            out.attrs.update(ds.attrs)
+            out.attrs["original_dtype"] = ds.dtype.str
+            types[name] = (ds.dtype, dtype)
+        fout.attrs["repacked"] = REPACK_VERSION
+        fout.attrs["chunk_events"] = chunk_events
+    return types
+
+
+def verify(detector, original, repacked, tolerance=1e-3, **options):
+    r"""Check that a repacked file gives the same cut masks, weights and
+    histograms as the original one.
+    Args:
+        detector (str): Name of the detector, as in joint_fit.DETECTORS.
+        original (str): Name of the original simulation file.
+        repacked (str): Name of the repacked file.
+        tolerance (float): Largest difference allowed in a histogram bin,
+            relative to the sum of the histogram. Float32 values next to a
+            bin edge may fall in the neighbouring bin.
+        options: Passed to the experiment classes.
+
+    Returns:
+        List of the failed checks, empty if the files agree.
+    """
+    options.setdefault("cache", False)
+    exps = [load_detector(detector, fname, **options)
+            for fname in (original, repacked)]
+    failures = []
+
+    """ Cut masks must be identical. """
+    getters = ["get_CC", "get_NC", "get_neutrino", "get_antineutrino",
+               "get_nue", "get_numu", "get_nutau"]
+    for getter in getters:
+        a, b = (getattr(exp, getter)()[1] for exp in exps)
+        if not np.array_equal(a, b):
+            failures.append(f"Cut {getter} differs.")
+    for s in range(len(exps[0].samples)):
+        a, b = (exp.get_sample(s) for exp in exps)
+        if not np.array_equal(a, b):
+            failures.append(f"Sample {s} differs.")
+
+    """ Weights and histograms agree within tolerance. """
+    if not np.allclose(exps[0].weights, exps[1].weights, rtol=1e-6, atol=0):
+        failures.append("Weights differ.")
+    if not np.isclose(exps[0].normalization, exps[1].normalization, rtol=1e-6, atol=0):
+        failures.append("Normalization differs.")
+    breakdowns = [exp.cuts_and_breakdown() for exp in exps]
+    for variable in exps[0].variable_names:
+        if variable not in exps[0].fdata:
+            continue
+        a, b = (exp.histograms(variable, *breakdown)
+                for exp, breakdown in zip(exps, breakdowns))
+        total = np.maximum(a.sumw.sum(axis=-1, keepdims=True), 1e-300)
+        deviation = np.max(np.abs(a.sumw - b.sumw) / total)
+        span = a.edges[:, -1:] - a.edges[:, :1]
+        if np.any(np.abs(a.edges - b.edges) > 1e-6 * span):
+            failures.append(f"Bin edges of {variable} differ.")
+        if deviation > tolerance:
+            failures.append(f"Histograms of {variable} differ by {deviation:.2e}.")
+    return failures
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Rewrite a simulation file with narrow types, chunks \
+        suited to column scans and a fast compression filter.")
+    optional = parser._action_groups.pop()
+    required = parser.add_argument_group("required arguments")
+    required.add_argument(
+        "--experiment",
+        type=str,
+        choices=tuple(DETECTORS),
+        required=True,
+        help="Experiment of the simulation file.")
+    required.add_argument(
+        "--fname",
+        type=str,
+        required=True,
+        help="Path to simulation file.")
+    required.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="Path to the repacked file.")
+    optional.add_argument(
+        "--keep",
+        type=str,
+        nargs="*",
+        default=None,
+        help="Datasets whose type is kept. Default is the weights of the \
+        experiment.")
+    optional.add_argument(
+        "--no-float32",
+        action="store_true",
+        help="Keep the width of the float columns.")
+    optional.add_argument(
+        "--chunk-events",
+        type=int,
+        default=CHUNK_EVENTS,
+        help=f"Number of events per chunk. Default is {CHUNK_EVENTS}.")
+    optional.add_argument(
+        "--compression",
+        type=str,
+        choices=("lzf", "gzip"),
+        default="lzf",
+        help="Compression filter. Default is lzf.")
+    optional.add_argument(
+        "--no-verify",
+        action="store_true",
+        help="Do not check the repacked file against the original one.")
+    parser._action_groups.append(optional)
+    args = parser.parse_args()
+
+    keep = args.keep
+    if keep is None:
+        keep = load_detector(args.experiment, args.fname, cache=False).aux_variables
+    types = repack(args.fname, args.output, keep, not args.no_float32,
+                   args.chunk_events, args.compression)
+
+    print(f"\nRepacked {args.fname} into {args.output}\n--------------------------------------------------")
+    for name, (before, after) in types.items():
+        print(f"  {name:>20}  {str(before):>8} -> {after}")
+    print("\n")
+
+    if not args.no_verify:
+        failures = verify(args.experiment, args.fname, args.output)
+        for failure in failures:
+            print(f"  FAILED  {failure}")
+        if failures:
+            sys.exit(1)
+        print("Cut masks, weights and histograms agree with the original file.\n")
+
+
+# ------------------------------------------------------- #
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import json
+from time import perf_counter
+import numpy as np
+from histogram import digitize, histogram_nd
+from oscillation import Oscillator, flavor_index, oscillation_weights
+
+""" Version of the layout of the response files. """
+RESPONSE_VERSION = 1
+
+""" Short names of the categories of the index defining the channels. """
+CHANNEL_NAMES = {
+    "get_CC": "CC", "get_NC": "NC",
+    "get_neutrino": "nu", "get_antineutrino": "antinu",
+    "get_nue": "e", "get_numu": "mu", "get_nutau": "tau"}
+
+""" PDG code of each flavor name of the channels. """
+FLAVOR_CODES = {"e": 12, "mu": 14, "tau": 16}
+
+
+def channel_names(layout):
+    """ Name (interaction, CP, flavor) of every category of the cube of an
+    index, "other" for the events outside the getters of an axis.
+    """
+    names = [["other"] * size for size in layout.shape]
+    for getter, (axis, code) in layout.codes.items():
+        names[axis][code] = CHANNEL_NAMES.get(getter, getter)
+    return [tuple(names[axis][code] for axis, code in enumerate(codes))
+            for codes in np.ndindex(*layout.shape)]
+
+
+def channel_flavor(channel):
+    """ Signed PDG code of the neutrino of a channel, 0 if unknown. """
+    __, cp, flavor = channel
+    if flavor not in FLAVOR_CODES or cp not in ("nu", "antinu"):
+        return 0
+    return FLAVOR_CODES[flavor] * (-1 if cp == "antinu" else 1)
+
+
+class ResponseMatrix:
+    """ Detector response of an experiment: the expected number of events in
+    every sample and reconstructed (energy, cosine zenith) bin coming from
+    every channel (interaction, CP, flavor) and true (energy, cosine zenith)
+    bin, with the weights and normalization of the experiment. It is a
+    sparse matrix in compressed rows, with rows [sample, reco energy, reco
+    cosine zenith] and columns [channel, true energy, true cosine zenith].
+    Predictions for a reweighting of the true bins, e.g. oscillations or a
+    flux change, are folded through it without touching the events.
+    """
+
+    def __init__(self, samples, channels, true_edges, reco_edges, indptr,
+                 indices, data, metadata=None):
+        r"""Response matrix.
+        Args:
+            samples ([str]): Names of the samples.
+            channels ([(str, str, str)]): Interaction, CP and flavor of each
+                channel.
+            true_edges ((array, array)): Edges in true energy and cosine
+                zenith.
+            reco_edges ((array, array)): Edges in reconstructed energy and
+                cosine zenith.
+            indptr (array): Start of each row in indices and data, with one
+                more entry for the end of the last row.
+            indices (array): Column of each entry, increasing in each row.
+            data (array): Expected events of each entry.
+            metadata (dict): Description of the simulation the matrix comes
+                from.
+        """
+        self.samples = list(samples)
+        self.channels = [tuple(channel) for channel in channels]
+        self.true_edges = [np.asarray(e, dtype=float) for e in true_edges]
+        self.reco_edges = [np.asarray(e, dtype=float) for e in reco_edges]
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data, dtype=float)
+        self.metadata = dict(metadata or {})
+        self.true_shape = (len(self.channels),) + tuple(len(e) - 1 for e in self.true_edges)
+        self.reco_shape = (len(self.samples),) + tuple(len(e) - 1 for e in self.reco_edges)
+        self.shape = (int(np.prod(self.reco_shape)), int(np.prod(self.true_shape)))
+        if len(self.indptr) != self.shape[0] + 1:
+            raise ValueError(f"Response matrix has {len(self.indptr) - 1} rows, not {self.shape[0]}.")
+
+        """ Columns as native indices for np.take, and rows with entries and
+        their start, for summing the entries of each row in one reduceat.
+        """
+        self.columns = self.indices.astype(np.intp)
+        self.filled = np.flatnonzero(np.diff(self.indptr))
+        self.starts = self.indptr[self.filled]
+        self.nominal = np.zeros(self.shape[0])
+        if self.data.size:
+            self.nominal[self.filled] = np.add.reduceat(self.data, self.starts)
+        self.nominal = self.nominal.reshape(self.reco_shape)
+        self.oscillator = None
+
+    @classmethod
+    def build(cls, exp, true_edges=None, reco_edges=None):
+        r"""Response of the events of an experiment in one pass over them.
+        Args:
+            exp (Experiment): Experiment with the simulation file.
+            true_edges ((array, array)): Edges in true energy and cosine
+                zenith. Default to the binning of the true variables of the
+                experiment.
+            reco_edges ((array, array)): Edges in reconstructed energy and
+                cosine zenith. Default to the binning of the reconstructed
+                variables of the experiment.
+
+        Returns:
+            ResponseMatrix of the experiment.
+        """
+        variables = [exp.reco_variables["energy"], exp.reco_variables["coszen"],
+                     exp.true_variables["energy"], exp.true_variables["coszen"]]
+        edges = list(reco_edges or [None, None]) + list(true_edges or [None, None])
+        bins = []
+        for i, var in enumerate(variables):
+            if edges[i] is None:
+                edges[i] = exp.get_edges(var)
+                bins.append(exp.get_bins(var))
+            else:
+                edges[i] = np.asarray(edges[i], dtype=float)
+                bins.append(digitize(exp.fdata[var], edges[i]))
+
+        """ One cut per category of the index holding events of the samples. """
+        index = exp.get_index()
+        nsamples = len(exp.samples)
+        counts = np.bincount(index.keys, minlength=index.nkeys)
+        filled = np.flatnonzero(counts.reshape(-1, index.ncube)[:nsamples].sum(axis=0))
+        names = channel_names(index)
+        cuts = [np.arange(index.ncube) == code for code in filled]
+        hists = histogram_nd(index, variables, bins, edges, exp.weights, cuts,
+                             [" ".join(names[code]) for code in filled], range(nsamples))
+
+        """ Entries of [sample, channel, reco bins, true bins] as (row, column). """
+        nreco, ntrue = [len(e) - 1 for e in edges[:2]], [len(e) - 1 for e in edges[2:]]
+        sample, channel, re, rz, te, tz = np.unravel_index(
+            hists.keys, [nsamples, len(cuts)] + nreco + ntrue)
+        rows = np.ravel_multi_index((sample, re, rz), [nsamples] + nreco)
+        columns = np.ravel_multi_index((channel, te, tz), [len(cuts)] + ntrue)
+        order = np.lexsort((columns, rows))
+        indptr = np.searchsorted(rows[order], np.arange(nsamples * int(np.prod(nreco)) + 1))
+        metadata = {
+            "experiment": exp.experiment,
+            "class": type(exp).__name__,
+            "input_hash": None if exp.cache is None else exp.cache.hash,
+            "weights": exp.weight_tag,
+            "normalization": float(exp.normalization),
+            "variables": variables}
+        return cls(exp.samples, [names[code] for code in filled], edges[2:], edges[:2],
+                   indptr, columns[order], hists.sumw[order] * exp.normalization, metadata)
+
+    def fold(self, factors=None):
+        r"""Expected events in every sample and reconstructed bin for a
+        reweighting of the channels and true bins, as one sparse matrix
+        product.
+        Args:
+            factors (array): Factor of every channel and true bin with shape
+                [channel, true energy, true cosine zenith], or a batch of
+                them with a last axis of hypotheses. None folds the nominal
+                weights.
+
+        Returns:
+            Array with shape [sample, reco energy, reco cosine zenith], and
+            the hypotheses as last axis for a batch.
+        """
+        if factors is None:
+            return self.nominal.copy()
+        factors = np.asarray(factors, dtype=float)
+        batch = factors.shape[len(self.true_shape):]
+        if factors.shape[:len(self.true_shape)] != self.true_shape:
+            raise ValueError(f"Factors have shape {factors.shape}, not {self.true_shape}.")
+        """ One product per hypothesis: gathering the factors of a single
+        hypothesis is several times faster than gathering rows of a batch.
+        """
+        x = factors.reshape(self.shape[1], -1).T.copy()
+        result = np.zeros((x.shape[0], self.shape[0]))
+        if self.data.size:
+            for k in range(x.shape[0]):
+                products = np.take(x[k], self.columns)
+                products *= self.data
+                result[k, self.filled] = np.add.reduceat(products, self.starts)
+        return np.moveaxis(result, 0, -1).reshape(self.reco_shape + batch)
+
+    def true_centers(self):
+        """ Energy (geometric mean of the edges) and cosine zenith at the
+        center of every true bin, with shape [true energy, true cosine
+        zenith].
+        """
+        energy, coszen = self.true_edges
+        return np.meshgrid(np.sqrt(energy[:-1] * energy[1:]),
+                           (coszen[:-1] + coszen[1:]) / 2, indexing="ij")
+
+    def oscillation_factors(self, params=None, flux_ratio=0.5, earth=None):
+        r"""Oscillation weights of every channel at the center of each true
+        bin, as factors for fold. Channels of unknown flavor are not
+        oscillated.
+        Args:
+            params (dict): Oscillation parameters, oscillation.DEFAULT_PARAMS
+                if None.
+            flux_ratio (float): Ratio of the electron to muon neutrino flux.
+            earth (EarthModel): Model of the Earth, used the first time.
+
+        Returns:
+            Array with shape [channel, true energy, true cosine zenith].
+        """
+        energy, coszen = (c.ravel() for c in self.true_centers())
+        n = energy.size
+        if self.oscillator is None:
+            """ Bin centers as neutrinos, then as antineutrinos. """
+            self.oscillator = Oscillator(
+                np.tile(energy, 2), np.tile(coszen, 2),
+                np.repeat([False, True], n), earth=earth)
+        prob = self.oscillator.probabilities(params)
+        factors = np.ones(self.true_shape)
+        for c, channel in enumerate(self.channels):
+            pdg = channel_flavor(channel)
+            if pdg:
+                events = slice(0, n) if pdg > 0 else slice(n, None)
+                beta = np.full(n, flavor_index(pdg))
+                factors[c] = oscillation_weights(
+                    prob[events, 0, beta[0]], prob[events, 1, beta[0]], beta,
+                    flux_ratio).reshape(self.true_shape[1:])
+        return factors
+
+    def save(self, fname):
+        """ Write the matrix to an NPZ file. """
+        with open(fname, 'wb') as f:
+            np.savez_compressed(
+                f, version=RESPONSE_VERSION, samples=np.array(self.samples),
+                channels=np.array(self.channels),
+                true_energy_edges=self.true_edges[0], true_coszen_edges=self.true_edges[1],
+                reco_energy_edges=self.reco_edges[0], reco_coszen_edges=self.reco_edges[1],
+                indptr=self.indptr, indices=self.indices, data=self.data,
+                metadata=json.dumps(self.metadata))
+
+    @classmethod
+    def load(cls, fname):
+        """ Read a matrix written by save. """
+        with np.load(fname) as f:
+            if int(f["version"]) != RESPONSE_VERSION:
+                raise ValueError(f"{fname} has response version {int(f['version'])}, "
+                                 f"not {RESPONSE_VERSION}.")
+            return cls(
+                [str(s) for s in f["samples"]],
+                [tuple(str(n) for n in channel) for channel in f["channels"]],
+                (f["true_energy_edges"], f["true_coszen_edges"]),
+                (f["reco_energy_edges"], f["reco_coszen_edges"]),
+                f["indptr"], f["indices"], f["data"], json.loads(str(f["metadata"])))
+
+
+def main():
+
+    from joint_fit import DETECTORS, load_detector
+    parser = argparse.ArgumentParser(
+        description="Build the detector response matrix of a simulation \
+        file, from true to reconstructed energy and cosine zenith per sample \
+        and channel, and save it for folding.")
+    optional = parser._action_groups.pop()
+    required = parser.add_argument_group("required arguments")
+    required.add_argument(
+        "--experiment",
+        type=str,
+        choices=tuple(DETECTORS),
+        required=True,
+        help="Experiment of the simulation file.")
+    required.add_argument(
+        "--fname",
+        type=str,
+        required=True,
+        help="Path to simulation file.")
+    required.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="Name of the NPZ file of the response matrix.")
+    optional.add_argument(
+        "--no-mmap",
+        action="store_true",
+        help="Copy every dataset into memory instead of memory-mapping the \
+        contiguous ones.")
+    optional.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the on-disk cache of derived columns and scalars.")
+    parser._action_groups.append(optional)
+    args = parser.parse_args()
+
+    begin = perf_counter()
+    exp = load_detector(args.experiment, args.fname,
+                        mmap=not args.no_mmap, cache=not args.no_cache)
+    response = exp.get_response()
+    response.save(args.output)
+    print(f"\nResponse of {exp.experiment}: {len(response.samples)} samples, "
+          f"{len(response.channels)} channels, {response.shape[0]} x {response.shape[1]} "
+          f"with {response.data.size} entries, built in {perf_counter() - begin:.2f} s "
+          f"and saved to {args.output}\n")
+
+
+# ------------------------------------------------------- #
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+import argparse
+import copy
+import io
+import json
+import os
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import parse_qs, urlsplit
+from joint_fit import DETECTORS, load_detector
+
+""" Variables whose columns are loaded when the server starts, as the
+defaults of plot_sim.py.
+"""
+DEFAULT_VARIABLES = ("Enu", "reco_coszen", "reco_energy")
+
+""" Content type of each figure format. """
+FORMATS = {"png": "image/png", "pdf": "application/pdf"}
+
+
+def parse_samples(samples):
+    """ Samples of a request, "All" or a list or comma separated string of
+    sample indices or names as in plot_sim.py. The experiment resolves the
+    names, see Experiment.sample_indices.
+    """
+    if samples is None or samples == "All":
+        return "All"
+    if isinstance(samples, str):
+        samples = samples.split(",")
+    return list(samples)
+
+
+class Service:
+    """ Experiments kept in memory between requests. Each experiment is
+    loaded once, with its columns, weights and index, and every request works
+    on a shallow copy of it holding the breakdown of the request. The copies
+    share the columns, bins and index of the experiment, which are filled
+    lazily, so the histograms of an experiment are computed under its lock.
+    Responses are kept in a bounded cache, and figures are rendered one at a
+    time since pyplot is not thread safe.
+    """
+
+    def __init__(self, experiments, variables=DEFAULT_VARIABLES,
+                 max_responses=256, **options):
+        r"""Load the experiments.
+        Args:
+            experiments ([(str, str)]): Name (as in joint_fit.DETECTORS) and
+                simulation file of each experiment. Requests refer to the
+                experiments by name.
+            variables ([str]): Variables whose columns are loaded up front.
+            max_responses (int): Number of responses kept in memory.
+            options: Passed to the experiment classes.
+        """
+        self.experiments = {}
+        self.locks = {}
+        for detector, fname in experiments:
+            exp = load_detector(detector, fname, variables, **options)
+            if exp.store is None:
+                exp.fdata.load(exp.required_variables())
+            exp.weights
+            exp.get_index()
+            self.experiments[detector] = exp
+            self.locks[detector] = threading.Lock()
+        self.responses = OrderedDict()
+        self.max_responses = max_responses
+        self.responses_lock = threading.Lock()
+        self.render_lock = threading.Lock()
+        import matplotlib.pyplot as plt
+        plt.switch_backend("Agg")
+
+    def describe(self):
+        """ Experiments served, with their files, samples and variables. """
+        return {tag: {"fname": exp.fdata.fname,
+                      "samples": list(exp.samples),
+                      "variables": {var: names for var, names in exp.variable_names.items()
+                                    if var in exp.fdata}}
+                for tag, exp in self.experiments.items()}
+
+    def lock(self, params):
+        """ Lock of the experiment of a request. """
+        tag = params.get("experiment")
+        if tag not in self.experiments:
+            raise ValueError(f"Experiment {tag} is not served.")
+        return self.locks[tag]
+
+    def breakdown(self, params):
+        r"""Experiment of a request with its breakdown.
+        Args:
+            params (dict): Parameters of the request: experiment, and
+                optionally variables, flavor, CP, interaction and samples
+                with the values of the options of plot_sim.py.
+
+        Returns:
+            (experiment, cuts, cut labels)
+        """
+        tag = params.get("experiment")
+        if tag not in self.experiments:
+            raise ValueError(f"Experiment {tag} is not served.")
+        exp = copy.copy(self.experiments[tag])
+        exp.plotting_variables = list(params.get("variables") or DEFAULT_VARIABLES)
+        exp.plotting_flavors = params.get("flavor", "e+mu")
+        exp.plotting_cp = params.get("CP", "both")
+        exp.plotting_interaction = params.get("interaction") or False
+        if exp.plotting_interaction == "False":
+            exp.plotting_interaction = False
+        exp.plotting_samples = parse_samples(params.get("samples"))
+        if exp.plotting_flavors not in ("e", "mu", "e+mu", "tau"):
+            raise ValueError(f"Unknown flavor {exp.plotting_flavors}.")
+        if exp.plotting_cp not in ("nu", "antinu", "both"):
+            raise ValueError(f"Unknown CP {exp.plotting_cp}.")
+        if exp.plotting_interaction not in ("CC", "NC", "ALL", False):
+            raise ValueError(f"Unknown interaction {exp.plotting_interaction}.")
+        cuts, cut_labels = exp.cuts_and_breakdown()
+        if any(s < 0 or s >= len(exp.samples) for s in exp.plotting_samples):
+            raise ValueError(f"Samples of {tag} are 0 to {len(exp.samples) - 1}.")
+        return exp, cuts, cut_labels
+
+    def variable(self, exp, name):
+        """ Name in the simulation file of a requested variable, with its
+        column loaded unless the histogram store holds its histograms. It is
+        called under the lock of the experiment.
+        """
+        for variable, names in exp.variable_names.items():
+            if name in names and variable in exp.fdata:
+                if exp.store is None:
+                    exp.fdata.load([variable])
+                return variable
+        raise ValueError(f"Variable {name} not found.")
+
+    def histograms(self, params):
+        """ Normalized histograms of the requested variables as a JSON
+        document, with the bin edges per sample and the sums of weights and
+        of squared weights per [sample, cut, bin].
+        """
+        with self.lock(params):
+            exp, cuts, cut_labels = self.breakdown(params)
+            histograms = {}
+            for name in exp.plotting_variables:
+                variable = self.variable(exp, name)
+                histograms[name] = variable, exp.histograms(variable, cuts, cut_labels)
+        result = {"experiment": params["experiment"],
+                  "samples": list(exp.plotting_samples),
+                  "sample_names": [exp.samples[s] for s in exp.plotting_samples],
+                  "cut_labels": cut_labels,
+                  "histograms": {}}
+        for name, (variable, hists) in histograms.items():
+            result["histograms"][name] = {
+                "variable": variable,
+                "label": exp.variable_labels[variable],
+                "edges": hists.edges.tolist(),
+                "sumw": hists.sumw.tolist(),
+                "sumw2": hists.sumw2.tolist()}
+        return json.dumps(result).encode()
+
+    def figure(self, params):
+        """ Figure of one variable, in the format given by the parameter
+        format (png by default).
+        """
+        fmt = params.get("format", "png")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt}.")
+        name = params.get("variable")
+        params = dict(params, variables=[name])
+        with self.lock(params):
+            exp, cuts, cut_labels = self.breakdown(params)
+            variable = self.variable(exp, name)
+            hists = {variable: exp.histograms(variable, cuts, cut_labels)}
+        buffer = io.BytesIO()
+        with self.render_lock:
+            exp.plot_variable(name, cuts, cut_labels, fname=buffer,
+                              histograms=hists, fmt=fmt)
+        return buffer.getvalue()
+
+    def respond(self, kind, params):
+        r"""Answer a request, from the cache of responses when possible.
+        Args:
+            kind (str): histograms or plot.
+            params (dict): Parameters of the request.
+
+        Returns:
+            (content type, body)
+        """
+        key = json.dumps([kind, params], sort_keys=True)
+        with self.responses_lock:
+            if key in self.responses:
+                self.responses.move_to_end(key)
+                return self.responses[key]
+        if kind == "histograms":
+            response = ("application/json", self.histograms(params))
+        else:
+            response = (FORMATS[params.get("format", "png")], self.figure(params))
+        with self.responses_lock:
+            self.responses[key] = response
+            while len(self.responses) > self.max_responses:
+                self.responses.popitem(last=False)
+        return response
+
+
+class Handler(BaseHTTPRequestHandler):
+    """ HTTP interface of the service:
+        GET /experiments: experiments served, their samples and variables.
+        GET or POST /histograms: histograms of variables as JSON.
+        GET or POST /plot: figure of a variable.
+    Parameters are given in the query string (lists comma separated) or as
+    a JSON object in the body of POST requests.
+    """
+
+    def address_string(self):
+        """ Unix sockets have no client address. """
+        return self.client_address[0] if self.client_address else "unix"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {}
+        for key, values in parse_qs(url.query).items():
+            value = values[-1]
+            params[key] = value.split(",") if key == "variables" else value
+        self.answer(url.path, params)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self.send(400, "application/json",
+                             json.dumps({"error": "Body is not JSON."}).encode())
+        self.answer(urlsplit(self.path).path, params)
+
+    def answer(self, path, params):
+        service = self.server.service
+        try:
+            if path == "/experiments":
+                self.send(200, "application/json", json.dumps(service.describe()).encode())
+            elif path in ("/histograms", "/plot"):
+                self.send(200, *service.respond(path[1:], params))
+            else:
+                self.send(404, "application/json",
+                          json.dumps({"error": f"Unknown path {path}."}).encode())
+        except (ValueError, TypeError) as error:
+            self.send(400, "application/json", json.dumps({"error": str(error)}).encode())
+        except Exception as error:
+            """ Any other failure is a bug of the server: it is logged and
+            answered, so the client is not left without a response.
+            """
+            self.log_error("%s", traceback.format_exc())
+            self.send(500, "application/json",
+                      json.dumps({"error": f"{type(error).__name__}: {error}"}).encode())
+
+    def send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    """ HTTP server on a Unix socket, one thread per request. """
+    daemon_threads = True
+
+
+def make_server(service, host="127.0.0.1", port=8765, socket=None):
+    """ HTTP server of a service on a TCP port, or on a Unix socket if its
+    path is given.
+    """
+    if socket is not None:
+        if os.path.exists(socket):
+            os.remove(socket)
+        server = UnixHTTPServer(socket, Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), Handler)
+    server.service = service
+    return server
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Serve histograms and figures of simulation files kept in \
+        memory between requests.")
+    optional = parser._action_groups.pop()
+    required = parser.add_argument_group("required arguments")
+    required.add_argument(
+        "--experiment",
+        type=str,
+        nargs="+",
+        choices=tuple(DETECTORS),
+        required=True,
+        help="Experiment(s) to serve, at most one of each.")
+    required.add_argument(
+        "--fname",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Path to simulation file of each experiment.")
+    optional.add_argument(
+        "--variables",
+        type=str,
+        nargs="+",
+        default=DEFAULT_VARIABLES,
+        help="Variables loaded when the server starts. Others are loaded by \
+        the first request needing them.")
+    optional.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address the server listens on. Default is 127.0.0.1.")
+    optional.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port the server listens on. Default is 8765.")
+    optional.add_argument(
+        "--socket",
+        type=str,
+        default=None,
+        help="Listen on this Unix socket instead of a TCP port.")
+    optional.add_argument(
+        "--max-responses",
+        type=int,
+        default=256,
+        help="Number of responses kept in memory. Default is 256.")
+    optional.add_argument(
+        "--no-mmap",
+        action="store_true",
+        help="Copy every dataset into memory instead of memory-mapping the \
+        contiguous ones.")
+    optional.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the on-disk cache of derived columns and scalars.")
+    optional.add_argument(
+        "--no-store",
+        action="store_true",
+        help="Do not reuse or save the histograms in the histogram store.")
+    parser._action_groups.append(optional)
+    args = parser.parse_args()
+    if len(args.experiment) != len(args.fname):
+        parser.error("--experiment and --fname need the same number of values.")
+    if len(set(args.experiment)) != len(args.experiment):
+        parser.error("Each experiment can be served once.")
+
+    service = Service(
+        list(zip(args.experiment, args.fname)), args.variables, args.max_responses,
+        mmap=not args.no_mmap, cache=not args.no_cache, store=not args.no_store)
+    server = make_server(service, args.host, args.port, args.socket)
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"\nServing {', '.join(service.experiments)} on {where}\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+# ------------------------------------------------------- #
+if __name__ == "__main__":
+    main()
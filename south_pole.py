@@ -1,9 +1,12 @@
+from binning import COSZEN_EDGES, Fixed, Integer, Linear, Log
 from experiment import Experiment
+from oscillation import EarthModel
 import numpy as np
 
 """ Class for the IceCube Upgrade experiment. """
 class IC(Experiment):
-    def __init__(self, fname, variables, flavors, cp, interaction, samples):
+    def __init__(self, fname, variables, flavors, cp,
+                 interaction, samples, **kwargs):
         super(
             IC,
             self).__init__(
@@ -12,7 +15,8 @@ class IC(Experiment):
             flavors,
             cp,
             interaction,
-            samples)
+            samples,
+            **kwargs)
 
         """ Name of the experiment. """
         self.experiment = "IceCube Upgrade"
@@ -80,9 +84,49 @@ class IC(Experiment):
             "dxsec": True,
             "pid": False}
 
+        """ Dictionary defining the bin edges of each variable, shared by every
+        sample and cut: logarithmic for energies, fixed for the cosines of
+        the zenith angles and one bin per value for integer variables.
+        """
+        self.variable_binning = {
+            "pdg": Integer(),
+            "true_energy": Log(),
+            "true_zenith": Fixed(COSZEN_EDGES),
+            "true_azimuth": Linear(),
+            "interaction_type": Integer(),
+            "current_type": Integer(),
+            "reco_energy": Log(),
+            "reco_azimuth": Linear(),
+            "reco_zenith": Fixed(COSZEN_EDGES),
+            "Q2": Linear(),
+            "W": Linear(),
+            "x": Linear(20, 0., 1.),
+            "y": Linear(20, 0., 1.),
+            "xsec": Linear(),
+            "dxsec": Linear(),
+            "pid": Integer()}
+
         """ Auxiliary variables for computing the weights. """
         self.aux_variables = ["weight"]
 
+        """ Variables used by the flavor, interaction and sample cuts. """
+        self.cut_variables = ["pdg", "current_type", "pid"]
+
+        """ True variables used for computing the oscillation weights. """
+        self.true_variables = {
+            "energy": "true_energy",
+            "coszen": "true_zenith",
+            "flavor": "pdg"}
+
+        """ Reconstructed variables used for binning the samples in fits. """
+        self.reco_variables = {"energy": "reco_energy", "coszen": "reco_zenith"}
+
+        """ IceCube Upgrade strings lie about 2 km under the ice surface. """
+        self.earth = EarthModel(detector_depth=2.)
+
+        """ Site of the flux tables (HKKM South Pole tables). """
+        self.flux_site = "spl"
+
         """ Apply cosine to zeniht """
         self.apply_cos2zenith()
 
@@ -94,7 +138,11 @@ class IC(Experiment):
         self.samples = ["Cascades", "Tracks"]
 
         # self.weights = self.get_weights()
-        self.weights = np.ones(self.fdata["true_energy"].size)
+        """ Unit weights as a read-only view of a single value, so they take
+        no memory whatever the size of the file. They are computed when they
+        are first needed.
+        """
+        self.weights = lambda: np.broadcast_to(1., self.fdata.length("true_energy"))
 
     def get_CC(self):
         """ Method for getting charged-current events. """
@@ -136,7 +184,15 @@ class IC(Experiment):
         """ Method for getting the weights based on the simulation. """
         return self.fdata["weight"]
 
+    def get_generation_weights(self):
+        """ Method for getting the weights per unit flux, the generation
+        weights of the simulation.
+        """
+        return self.fdata["weight"]
+
     def apply_cos2zenith(self):
-        """ Apply cosine to zenith angle from input MC file. """
-        self.fdata["true_zenith"] = np.cos(self.fdata["true_zenith"])
-        self.fdata["reco_zenith"] = np.cos(self.fdata["reco_zenith"])
+        """ Apply cosine to zenith angle from input MC file. The cosine is
+        computed when the zenith columns are first read.
+        """
+        self.fdata.add_transform("true_zenith", np.cos)
+        self.fdata.add_transform("reco_zenith", np.cos)
@@ -0,0 +1,89 @@
+import hashlib
+import numpy as np
+from categories import Categories
+from histogram import Histograms, fill, sample_edges
+
+""" Version of the layout of the entries, part of their names so that a new
+layout never reads old entries.
+"""
+STORE_VERSION = 2
+
+
+class HistogramStore:
+    """ Histograms of an experiment kept in its cache of derived quantities,
+    so they are reused across runs. The histograms are stored per sample and
+    per category of the index ([category, bin] arrays), for each variable,
+    binning and weights, from which the histograms of any breakdown of cuts
+    are sums over categories. Only the samples and variables missing from
+    the store are computed, and a run whose histograms are all stored does
+    not open the simulation file.
+    """
+
+    def __init__(self, exp):
+        r"""Store of the histograms of an experiment.
+        Args:
+            exp (Experiment): Experiment with an on-disk cache.
+        """
+        self.exp = exp
+        self.layout = None
+
+    def name(self, *parts):
+        """ Name of an entry in the cache of derived quantities. """
+        return "_".join(["store", str(STORE_VERSION)] + [str(p) for p in parts])
+
+    def categories(self):
+        """ Layout of the categories of the index of the experiment. """
+        if self.layout is None:
+            text = self.exp.cache.get(
+                self.name("categories"),
+                lambda: np.array(self.exp.get_index().to_json()))
+            self.layout = Categories.from_json(text)
+        return self.layout
+
+    def counts(self, variable, sample, edges):
+        """ Sums of weights and of squared weights of a variable in every
+        category of a sample, for the bin edges of Experiment.get_edges.
+        Returns:
+            Array with shape [2, category, bin].
+        """
+        def compute():
+            index = self.exp.get_index()
+            events = index.events(None, sample)
+            binned = self.exp.get_bins(variable)[events]
+            inside = binned >= 0
+            categories = (index.keys[events] % index.ncube)[inside]
+            weights = self.exp.weights[events][inside]
+            return np.array([
+                fill(categories, binned[inside], weights, index.ncube, len(edges) - 1),
+                fill(categories, binned[inside], weights * weights,
+                     index.ncube, len(edges) - 1)])
+
+        digest = hashlib.blake2b(edges.tobytes(), digest_size=8).hexdigest()
+        return self.exp.cache.get(
+            self.name("counts", variable, self.exp.weight_tag,
+                      sample, len(edges) - 1, digest), compute)
+
+    def histogram(self, variable, cuts, cut_labels, samples, edges):
+        r"""Histograms of a variable for every (sample, cut) pair, matching
+        histogram.histogram.
+        Args:
+            variable (str): Name of the variable in the simulation file.
+            cuts ([array]): Category selections of the cuts.
+            cut_labels ([str]): Labels of the cuts.
+            samples ([int]): Sample indices.
+            edges (array): Bin edges of the variable, from
+                Experiment.get_edges.
+
+        Returns:
+            Unnormalized histograms of the variable.
+        """
+        distinct = list(dict.fromkeys(samples))
+        sumw = np.zeros((2, len(distinct), len(cuts), len(edges) - 1))
+        for i, s in enumerate(distinct):
+            counts = self.counts(variable, s, edges)
+            for k, cut in enumerate(cuts):
+                sumw[:, i, k] = counts[:, cut].sum(axis=1)
+        rows = [distinct.index(s) for s in samples]
+        return Histograms(
+            variable, samples, cut_labels, sample_edges(edges, samples),
+            sumw[0, rows], sumw[1, rows])
@@ -0,0 +1,63 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+""" The modules of the repository are imported from its root, and the cache
+of derived quantities of the tests is kept apart from the user's one. It
+is set before any module reads it.
+"""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CACHE = tempfile.mkdtemp(prefix="atmo-mc-tests-")
+os.environ["ATMO_MC_CACHE"] = CACHE
+atexit.register(shutil.rmtree, CACHE, True)
+
+import numpy as np
+import pytest
+from benchmark import generate
+
+""" Number of events of the synthetic simulation files. """
+NEVENTS = 3000
+
+""" Signed PDG code selected by each cut of the default breakdown
+(e+mu, both), in the order of cuts_and_breakdown.
+"""
+CUT_FLAVORS = (14, -14, 12, -12)
+
+
+@pytest.fixture(scope="session")
+def data_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("data")
+
+
+@pytest.fixture(scope="session")
+def sk_file(data_dir):
+    """ Synthetic file in the layout of the SK files. """
+    fname = str(data_dir / "sk.h5")
+    generate("SK", fname, NEVENTS, seed=1)
+    return fname
+
+
+@pytest.fixture(scope="session")
+def ic_file(data_dir):
+    """ Synthetic file in the layout of the IceCube Upgrade files. """
+    fname = str(data_dir / "ic.h5")
+    generate("ICUp", fname, NEVENTS, seed=2)
+    return fname
+
+
+@pytest.fixture(params=["SK", "ICUp"])
+def simulation(request, sk_file, ic_file):
+    """ Name of a detector and its synthetic simulation file. """
+    return request.param, sk_file if request.param == "SK" else ic_file
+
+
+def cut_masks(exp):
+    """ Selection of the events of every (sample, cut) pair of the default
+    breakdown, computed from the columns without the event index.
+    """
+    flavor = np.asarray(exp.fdata[exp.cut_variables[0]])
+    sample = np.asarray(exp.fdata[exp.cut_variables[-1]])
+    return [[(sample == s) & (flavor == code) for code in CUT_FLAVORS]
+            for s in exp.plotting_samples]
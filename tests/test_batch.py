@@ -0,0 +1,26 @@
+import os
+import matplotlib
+from batch import render
+from joint_fit import load_detector
+
+matplotlib.use("Agg")
+
+
+def test_render_names_like_plot(sk_file, tmp_path):
+    """ The figures rendered in batch are named as those saved by
+    Experiment.plot, one per variable and heat map.
+    """
+    variables = ["Enu", "reco_coszen"]
+    exp = load_detector("SK", sk_file, variables, cache=False)
+    exp.plotting_samples = [0, 1]
+    exp.plotting_heatmaps = [("reco_energy", "reco_coszen")]
+    saved = render([("SK", exp)], str(tmp_path / "batch"), processes=1)
+    expected = ["SK_Enu.png", "SK_reco_coszen.png", "SK_reco_energy_vs_reco_coszen.png"]
+    assert sorted(os.path.basename(fname) for fname in saved) == sorted(expected)
+    assert sorted(os.listdir(tmp_path / "batch")) == sorted(expected)
+
+    exp = load_detector("SK", sk_file, variables, cache=False)
+    exp.plotting_samples = [0, 1]
+    exp.plotting_heatmaps = [("reco_energy", "reco_coszen")]
+    exp.plot(str(tmp_path / "plot"), tag="SK")
+    assert sorted(os.listdir(tmp_path / "plot")) == sorted(expected)
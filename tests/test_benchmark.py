@@ -0,0 +1,33 @@
+import json
+import pytest
+from benchmark import NSAMPLES, generate, record, run_stages
+from joint_fit import DETECTORS, load_detector
+
+
+@pytest.mark.parametrize("detector", list(DETECTORS))
+def test_synthetic_files(detector, tmp_path):
+    """ The synthetic file of every detector loads with its experiment
+    class, has the events of every sample, and goes through every stage.
+    """
+    fname = str(tmp_path / f"{detector}.h5")
+    generate(detector, fname, 2000, seed=5)
+    exp = load_detector(detector, fname, cache=False)
+    assert exp.fdata.length(exp.true_variables["energy"]) == 2000
+    assert len(exp.samples) == NSAMPLES[detector]
+    stages = run_stages(detector, fname, ["Enu", "reco_coszen"], {"cache": False})
+    names = [stage for stage, __, __ in stages]
+    assert names[:2] == ["load", "cuts_and_breakdown"]
+    assert any(name.startswith("histogram") for name in names)
+    assert all(seconds >= 0 and memory > 0 for __, seconds, memory in stages)
+
+
+def test_history(tmp_path):
+    """ Runs are appended to the history, with the previous run of the host. """
+    history = str(tmp_path / "benchmarks.json")
+    results = [{"experiment": "SK", "events": 10, "stage": "load",
+                "seconds": 1., "peak_mb": 10.}]
+    assert record(history, results) is None
+    previous = record(history, results)
+    assert previous["results"] == results
+    with open(history) as f:
+        assert len(json.load(f)) == 2
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from binning import Fixed, Integer, Linear, Log, Quantile, parse_binning, value_range
+from joint_fit import load_detector
+
+
+def test_parse_binning():
+    """ Specifications from text, and errors for invalid ones. """
+    assert parse_binning("log:30:0.1:100").key() == Log(30, 0.1, 100.).key()
+    assert parse_binning("linear").key() == Linear().key()
+    assert parse_binning("integer:5").key() == Integer(5).key()
+    assert parse_binning("quantile:4").key() == Quantile(4).key()
+    np.testing.assert_array_equal(
+        parse_binning("fixed:-1,0,1").edges(np.inf, -np.inf, np.inf), [-1, 0, 1])
+    for text in ("log:x", "cubic:3", "fixed:a,b"):
+        with pytest.raises(ValueError):
+            parse_binning(text)
+
+
+def test_edges():
+    """ Edges of each specification over the range of the values. """
+    values = np.array([-2., 0.5, 3., 10.])
+    lo, hi, positive = value_range(values)
+    np.testing.assert_allclose(Log(2).edges(lo, hi, positive), [0.5, np.sqrt(5), 10])
+    np.testing.assert_allclose(Linear(4).edges(lo, hi, positive), [-2, 1, 4, 7, 10])
+    np.testing.assert_array_equal(Integer().edges(lo, hi, positive), np.arange(-2.5, 11))
+    assert len(Integer(max_bins=4).edges(lo, hi, positive)) - 1 <= 4
+    np.testing.assert_array_equal(Linear(2).edges(*value_range([])), [0, 0.5, 1])
+    weights = np.ones(1000)
+    edges = Quantile(4).quantile_edges(np.arange(1000.), weights)
+    counts, __ = np.histogram(np.arange(1000.), edges)
+    assert counts.max() - counts.min() <= 2
+
+
+def test_binning_shared_by_samples(sk_file):
+    """ Every sample and cut shares the edges of the specification of the
+    variable.
+    """
+    exp = load_detector("SK", sk_file, ["Enu"], cache=False)
+    exp.variable_binning["pnu"] = Log(10, 0.1, 100.)
+    exp.variable_binning["recodirZ"] = Fixed(np.linspace(-1, 1, 5))
+    cuts, labels = exp.cuts_and_breakdown()
+    pnu = exp.histograms("pnu", cuts, labels)
+    np.testing.assert_allclose(pnu.edges, np.broadcast_to(np.geomspace(0.1, 100, 11), pnu.edges.shape))
+    zenith = exp.histograms("recodirZ", cuts, labels)
+    np.testing.assert_allclose(zenith.edges[3], np.linspace(-1, 1, 5))
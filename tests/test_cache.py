@@ -0,0 +1,60 @@
+import os
+import h5py
+import numpy as np
+from cache import DerivedCache, file_hash
+from joint_fit import load_detector
+
+
+def write(fname, values):
+    with h5py.File(fname, 'w') as hf:
+        hf["x"] = values
+
+
+def test_entries_follow_the_file(tmp_path):
+    """ Derived quantities are computed once per content of the file, and
+    the entries of a previous content are removed when the file changes.
+    """
+    fname, directory = str(tmp_path / "f.h5"), str(tmp_path / "cache")
+    write(fname, np.arange(5.))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        with h5py.File(fname, 'r') as hf:
+            return hf["x"][()].sum()
+
+    assert DerivedCache(fname, "E", directory).get("sum", compute) == 10
+    assert DerivedCache(fname, "E", directory).get("sum", compute) == 10
+    assert len(calls) == 1
+    old = DerivedCache(fname, "E", directory).path("sum")
+
+    write(fname, np.arange(5.) * 2)
+    stat = os.stat(fname)
+    os.utime(fname, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert DerivedCache(fname, "E", directory).get("sum", compute) == 20
+    assert len(calls) == 2
+    assert not os.path.exists(old)
+    assert DerivedCache(fname, "E", directory).prefix == f"{file_hash(fname, directory)}_E"
+
+
+def test_eviction(tmp_path):
+    """ The least recently used entries are evicted beyond the size limit. """
+    fname, directory = str(tmp_path / "f.h5"), str(tmp_path / "cache")
+    write(fname, np.arange(5.))
+    cache = DerivedCache(fname, "E", directory, max_bytes=3000)
+    for name in ("a", "b", "c"):
+        cache.get(name, lambda: np.zeros(128))
+    assert not os.path.exists(cache.path("a"))
+    assert os.path.exists(cache.path("c"))
+
+
+def test_experiment_uses_cache(ic_file):
+    """ The derived columns and normalization are read back from the cache
+    by another instance, equal to those computed without it.
+    """
+    reference = load_detector("ICUp", ic_file, ["Enu", "reco_coszen"], cache=False)
+    for attempt in range(2):
+        exp = load_detector("ICUp", ic_file, ["Enu", "reco_coszen"])
+        assert np.isclose(exp.normalization, reference.normalization, rtol=1e-12)
+        np.testing.assert_array_equal(exp.fdata["reco_zenith"], reference.fdata["reco_zenith"])
+    assert exp.fdata.access["reco_zenith"] == "cached"
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from categories import Categories, CategoryIndex
+
+
+def toy_index(flavor, interaction, sample, nsamples=3):
+    """ Index of events with a flavor and an interaction axis. """
+    def get_numu():
+        return ["numu", np.abs(flavor) == 14]
+
+    def get_nue():
+        return ["nue", np.abs(flavor) == 12]
+
+    def get_cc():
+        return ["CC", interaction == 1]
+
+    def get_all():
+        return ["", np.ones(flavor.size, dtype=bool)]
+
+    axes = [("flavor", [get_numu, get_nue]), ("interaction", [get_cc])]
+    index = CategoryIndex(axes, lambda s: sample == s, nsamples, [get_all])
+    return index, (get_numu, get_nue, get_cc, get_all)
+
+
+def test_events_match_masks():
+    """ The events of every cut and sample are those of the masks. """
+    rng = np.random.default_rng(7)
+    flavor = rng.choice([12, -12, 14, -14, 16], 5000)
+    interaction = rng.integers(0, 2, 5000)
+    sample = rng.integers(0, 4, 5000)
+    index, (get_numu, get_nue, get_cc, get_all) = toy_index(flavor, interaction, sample)
+    for getters in ([get_numu], [get_nue, get_cc], [get_cc], [get_all]):
+        label, selection = index.cut(getters)
+        assert label == "".join(getter()[0] for getter in getters)
+        mask = np.logical_and.reduce([getter()[1] for getter in getters])
+        for s in (None, 0, 2, 3):
+            expected = mask if s is None else mask & (sample == s)
+            np.testing.assert_array_equal(
+                np.sort(index.events(selection, s)), np.flatnonzero(expected))
+    layout = Categories.from_json(index.to_json())
+    np.testing.assert_array_equal(layout.cut([get_nue, get_cc])[1],
+                                  index.cut([get_nue, get_cc])[1])
+
+
+def test_overlaps_raise():
+    """ Categories of an axis, and samples, must not overlap. """
+    flavor = np.array([14, 14, 12, 12])
+    interaction = np.array([1, 0, 1, 0])
+
+    def get_numu():
+        return ["numu", flavor == 14]
+
+    def get_any():
+        return ["any", flavor > 0]
+
+    with pytest.raises(ValueError):
+        CategoryIndex([("flavor", [get_numu, get_any])], lambda s: flavor > 0, 1)
+    with pytest.raises(ValueError):
+        CategoryIndex([("flavor", [get_numu])], lambda s: interaction >= s, 2)
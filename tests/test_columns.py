@@ -0,0 +1,88 @@
+import h5py
+import numpy as np
+import pytest
+from columns import ChunkReader, LazyColumns
+
+
+@pytest.fixture
+def small_file(tmp_path):
+    fname = str(tmp_path / "small.h5")
+    with h5py.File(fname, 'w') as hf:
+        hf["a"] = np.arange(10.)
+        hf["b"] = np.arange(10, dtype=np.int32)
+        hf.create_dataset("c", data=np.linspace(0, 1, 10), chunks=(5,), compression="lzf")
+    return fname
+
+
+def test_columns_are_read_when_accessed(small_file):
+    """ Datasets are read the first time they are accessed, memory-mapped
+    when stored contiguously, and copied otherwise.
+    """
+    fdata = LazyColumns(small_file)
+    assert fdata.loaded() == []
+    assert sorted(fdata) == ["a", "b", "c"]
+    np.testing.assert_array_equal(fdata["a"], np.arange(10.))
+    assert fdata.loaded() == ["a"]
+    fdata.load(["b", "c"])
+    assert fdata.access == {"a": "mapped", "b": "mapped", "c": "copied"}
+    np.testing.assert_array_equal(fdata["c"], np.linspace(0, 1, 10))
+    assert fdata.length("b") == 10
+    with pytest.raises(KeyError):
+        fdata.load(["d"])
+    copied = LazyColumns(small_file, mmap=False)
+    copied.load(["a"])
+    assert copied.access == {"a": "copied"}
+
+
+def test_transforms_are_applied_when_read(small_file):
+    """ A transformation registered before the dataset is read is applied
+    when it is read, and right away otherwise.
+    """
+    fdata = LazyColumns(small_file)
+    fdata.add_transform("a", np.negative)
+    np.testing.assert_array_equal(fdata["a"], -np.arange(10.))
+    fdata["b"]
+    fdata.add_transform("b", lambda b: 2*b)
+    np.testing.assert_array_equal(fdata["b"], 2*np.arange(10))
+
+
+def test_delete_drops_from_memory(small_file):
+    """ Deleting a dataset of the file only drops it from memory, and it is
+    read again when next accessed. Added columns are removed.
+    """
+    fdata = LazyColumns(small_file)
+    names = list(fdata.names)
+    del fdata["b"]
+    assert fdata.names == names and "b" in fdata
+    fdata["a"]
+    del fdata["a"]
+    assert fdata.loaded() == [] and "a" in fdata
+    np.testing.assert_array_equal(fdata["a"], np.arange(10.))
+    fdata["d"] = np.ones(10)
+    assert len(fdata) == 4
+    del fdata["d"]
+    assert "d" not in fdata and len(fdata) == 3
+    with pytest.raises(KeyError):
+        del fdata["d"]
+
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_chunk_reader_matches_file(small_file, depth):
+    """ The ranges read ahead, from contiguous and chunked datasets, with
+    their transforms and weights, are those of the file.
+    """
+    ranges = [(0, 3), (3, 7), (7, 10)]
+    timing = {}
+    for weights in ("a", np.arange(10.) * 2):
+        reader = ChunkReader(small_file, ["b", "c"], ranges, {"b": lambda x: x * 10},
+                             weights, depth=depth, timing=timing)
+        chunks = list(reader)
+        assert [bounds for bounds, __, __ in chunks] == ranges
+        b = np.concatenate([columns["b"] for __, columns, __ in chunks])
+        c = np.concatenate([columns["c"] for __, columns, __ in chunks])
+        w = np.concatenate([chunk_weights for __, __, chunk_weights in chunks])
+        np.testing.assert_array_equal(b, np.arange(10) * 10)
+        np.testing.assert_array_equal(c, np.linspace(0, 1, 10))
+        np.testing.assert_array_equal(w, np.arange(10.) * (1 if isinstance(weights, str) else 2))
+    assert "b" in reader.layout and "c" not in reader.layout
+    assert set(timing) == {"read", "wait", "compute"}
@@ -0,0 +1,35 @@
+import numpy as np
+from fit import NOMINAL, BinnedFit, poisson_chi2
+from joint_fit import load_detector
+from oscillation import DEFAULT_PARAMS
+
+
+def test_poisson_chi2():
+    """ The chi^2 matches the Baker-Cousins formula, and is exactly zero
+    for observed counts equal to large expected ones.
+    """
+    expected = np.array([1., 2., 5., 1e-12])
+    observed = np.array([0., 3., 5., 2.])
+    terms = expected - observed
+    filled = observed > 0
+    terms[filled] += observed[filled] * np.log(observed[filled] / np.maximum(expected[filled], 1e-10))
+    terms[-1] = 1e-10 - 2 + 2 * np.log(2 / 1e-10)
+    assert np.isclose(poisson_chi2(expected, observed), 2 * terms.sum(), rtol=1e-12)
+    large = 6e11 * np.random.default_rng(8).uniform(0.5, 2, 1000)
+    assert poisson_chi2(large, large.copy()) == 0
+    assert poisson_chi2(large, large * (1 + 1e-9)) >= 0
+
+
+def test_fit_at_truth(ic_file):
+    """ The chi^2 of the Asimov data set vanishes at its parameters, with
+    nominal nuisance parameters, and grows away from them.
+    """
+    fit = BinnedFit(load_detector("ICUp", ic_file, cache=False), interpolate=False)
+    truth = dict(DEFAULT_PARAMS)
+    observed = fit.asimov(truth)
+    assert 0 <= fit.chi2(observed, truth) < 1e-6
+    chi2, nuisance = fit.profile(observed, truth)
+    assert 0 <= chi2 < 1e-6
+    assert all(abs(nuisance[name] - NOMINAL[name]) < 1e-2 for name in NOMINAL)
+    assert fit.chi2(observed, dict(truth, dm31=3e-3)) > 1
+    assert fit.chi2(observed, truth, {"norm": 1.1}) > fit.chi2(observed, truth)
@@ -0,0 +1,89 @@
+import numpy as np
+from conftest import cut_masks
+from joint_fit import load_detector
+
+""" Variables histogrammed by the tests: true energy (logarithmic bins),
+reconstructed cosine zenith (fixed bins) and reconstructed energy.
+"""
+VARIABLES = ("Enu", "reco_coszen", "reco_energy")
+
+
+def test_histograms_match_numpy(simulation):
+    """ The bincount histograms of every (sample, cut) pair match
+    numpy.histogram of the selected events with the same edges.
+    """
+    exp = load_detector(*simulation, VARIABLES, cache=False)
+    cuts, labels = exp.cuts_and_breakdown()
+    weights = np.broadcast_to(exp.weights, len(exp.fdata[exp.true_variables["energy"]]))
+    masks = cut_masks(exp)
+    for name in VARIABLES:
+        var = exp.find_variable(name)
+        hists = exp.histograms(var, cuts, labels)
+        values = np.asarray(exp.fdata[var])
+        for i, row in enumerate(masks):
+            for k, mask in enumerate(row):
+                expected, __ = np.histogram(
+                    values[mask], bins=hists.edges[i], weights=weights[mask])
+                np.testing.assert_allclose(
+                    hists.sumw[i, k], expected * exp.normalization, rtol=1e-12, atol=0)
+
+
+def test_streamed_histograms_match_histograms(simulation):
+    """ Histograms accumulated over chunks match the in-memory ones, and so
+    does the normalization found from the sums of the chunks.
+    """
+    exp = load_detector(*simulation, VARIABLES, cache=False)
+    cuts, labels = exp.cuts_and_breakdown()
+    streamed = load_detector(*simulation, VARIABLES, cache=False, mmap=False)
+    variables = [exp.find_variable(name) for name in VARIABLES]
+    result = streamed.streamed_histograms(variables, chunk_size=700)
+    assert np.isclose(streamed.normalization, exp.normalization, rtol=1e-12)
+    for var in variables:
+        hists = exp.histograms(var, cuts, labels)
+        np.testing.assert_array_equal(result[var].edges, hists.edges)
+        np.testing.assert_allclose(result[var].sumw, hists.sumw, rtol=1e-12, atol=0)
+        np.testing.assert_allclose(result[var].sumw2, hists.sumw2, rtol=1e-12, atol=0)
+
+
+def test_streaming_reads_weights_by_chunk(sk_file):
+    """ Streaming the nominal SK weights never reads the whole column. """
+    exp = load_detector("SK", sk_file, ["Enu"], cache=False, mmap=False)
+    exp.streamed_histograms(["pnu"], chunk_size=700)
+    assert callable(exp._weights)
+    assert "weightReco" not in exp.fdata.loaded()
+
+
+def test_store_round_trip(simulation):
+    """ Histograms written to the histogram store and read back by another
+    instance match those computed from the events, without reading the
+    file again.
+    """
+    reference = load_detector(*simulation, VARIABLES, cache=False)
+    cuts, labels = reference.cuts_and_breakdown()
+    variables = [reference.find_variable(name) for name in VARIABLES]
+    expected = {var: reference.histograms(var, cuts, labels) for var in variables}
+    for attempt in range(2):
+        exp = load_detector(*simulation, VARIABLES)
+        cuts, labels = exp.cuts_and_breakdown()
+        for var in variables:
+            hists = exp.histograms(var, cuts, labels)
+            np.testing.assert_array_equal(hists.edges, expected[var].edges)
+            np.testing.assert_allclose(hists.sumw, expected[var].sumw, rtol=1e-12, atol=0)
+            np.testing.assert_allclose(hists.sumw2, expected[var].sumw2, rtol=1e-12, atol=0)
+    assert exp.fdata.loaded() == []
+
+
+def test_histograms_nd_match_histogramdd(sk_file):
+    """ Dense N-dimensional histograms match numpy.histogramdd. """
+    exp = load_detector("SK", sk_file, ["Enu"], cache=False)
+    cuts, labels = exp.cuts_and_breakdown()
+    variables = ["evis", "recodirZ"]
+    hists = exp.histograms_nd(variables, cuts, labels)
+    dense = hists.dense()
+    values = np.stack([np.asarray(exp.fdata[var]) for var in variables], axis=-1)
+    weights = np.asarray(exp.weights)
+    for i, row in enumerate(cut_masks(exp)):
+        for k, mask in enumerate(row):
+            expected, __ = np.histogramdd(values[mask], bins=hists.edges, weights=weights[mask])
+            np.testing.assert_allclose(
+                dense[i, k], expected * exp.normalization, rtol=1e-12, atol=1e-300)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from flux import flux_systematics
+from hypotheses import block_size
+from joint_fit import load_detector
+from oscillation import DEFAULT_PARAMS
+
+""" Flux and oscillation hypotheses, with and without oscillations. """
+HYPOTHESES = [
+    {},
+    {"norm": 1.1, "tilt": 0.05},
+    {"nubar": -0.08, "params": DEFAULT_PARAMS},
+    {"norm": 0.9, "tilt": -0.1, "nubar": 0.05,
+     "params": dict(DEFAULT_PARAMS, dm31=2.6e-3, theta23=0.8)},
+    {"params": dict(DEFAULT_PARAMS, dm31=2.6e-3, theta23=0.8)}]
+
+
+@pytest.mark.parametrize("memory", [2**14, 2**30])
+def test_batch_matches_loop(simulation, memory):
+    """ The histograms of a batch of hypotheses match those of one pass per
+    hypothesis with reweighted events, whatever the size of the blocks.
+    """
+    exp = load_detector(*simulation, ["Enu", "reco_coszen"], cache=False)
+    cuts, labels = exp.cuts_and_breakdown()
+    exp.get_probability_table(energy_nodes=60, coszen_nodes=40)
+    variables = [exp.find_variable(name) for name in ("Enu", "reco_coszen")]
+    batch = exp.hypothesis_histograms(variables, cuts, labels, HYPOTHESES, memory=memory)
+
+    energy = exp.fdata[exp.true_variables["energy"]]
+    flavor = exp.fdata[exp.true_variables["flavor"]]
+    nominal = np.broadcast_to(exp.weights, len(energy))
+    for k, hypothesis in enumerate(HYPOTHESES):
+        weights = hypothesis.get("norm", 1.) * nominal * flux_systematics(
+            energy, flavor, hypothesis.get("tilt", 0.), hypothesis.get("nubar", 0.))
+        if "params" in hypothesis:
+            weights = weights * exp.get_osc_weights(hypothesis["params"], interpolate=True)
+        exp.weights = weights
+        for var in variables:
+            expected = exp.histograms(var, cuts, labels).sumw
+            np.testing.assert_allclose(batch[var][k], expected, rtol=1e-10, atol=1e-300)
+        exp.weights = nominal
+
+
+def test_block_size_within_budget():
+    """ Blocks fit in the memory budget, with at least one event. """
+    assert block_size(64, 2**20) * 64 * 32 <= 2**20
+    assert block_size(10**9, 1) == 1
@@ -0,0 +1,42 @@
+import multiprocessing
+import pytest
+from fit import BinnedFit
+from joint_fit import JointFit, load_detector
+from oscillation import DEFAULT_PARAMS
+
+""" Oscillation parameters away from the truth. """
+SHIFTED = dict(DEFAULT_PARAMS, dm31=2.9e-3, theta23=0.9)
+
+""" Options of the fits, fast to evaluate exactly. """
+FIT_OPTIONS = {"interpolate": False}
+
+
+def test_joint_fit_adds_detectors(sk_file, ic_file):
+    """ The combined chi^2 is the sum of the chi^2 of each detector, as
+    computed in this process, and vanishes at the truth.
+    """
+    detectors = [("SK", sk_file), ("ICUp", ic_file)]
+    with JointFit(detectors, DEFAULT_PARAMS, {"cache": False}, FIT_OPTIONS) as fit:
+        total, parts = fit.chi2(SHIFTED, profile=False)
+        at_truth, __ = fit.chi2(DEFAULT_PARAMS, profile=False)
+        scan = fit.scan([DEFAULT_PARAMS, SHIFTED], profile=False)
+        profiled, __ = fit.chi2(SHIFTED)
+    assert 0 <= at_truth < 1e-6
+    assert scan == [at_truth, total]
+    assert profiled <= total
+    assert total == pytest.approx(sum(chi2 for chi2, __ in parts.values()), rel=1e-12)
+    for detector, fname in detectors:
+        local = BinnedFit(load_detector(detector, fname, cache=False), **FIT_OPTIONS)
+        expected = local.chi2(local.asimov(DEFAULT_PARAMS), SHIFTED)
+        assert parts[detector][0] == pytest.approx(expected, rel=1e-9)
+    assert multiprocessing.active_children() == []
+
+
+def test_failed_start_stops_workers(sk_file, tmp_path):
+    """ A detector failing to load raises with its error, and the workers
+    already started are stopped.
+    """
+    detectors = [("SK", sk_file), ("ICUp", str(tmp_path / "missing.h5"))]
+    with pytest.raises(RuntimeError, match="ICUp"):
+        JointFit(detectors, options={"cache": False}, fit_options=FIT_OPTIONS)
+    assert multiprocessing.active_children() == []
@@ -0,0 +1,90 @@
+import numpy as np
+from joint_fit import load_detector
+from oscillation import (DEFAULT_PARAMS, EarthModel, Oscillator, ProbabilityTable,
+                         vacuum_hamiltonian)
+
+
+def evolution(h, length):
+    """ exp(-i H L) of a Hermitian matrix from its eigendecomposition. """
+    values, vectors = np.linalg.eigh(h)
+    return vectors @ np.diag(np.exp(-1j * values * length)) @ vectors.conj().T
+
+
+def reference_probabilities(energy, coszen, antineutrino, params, earth):
+    """ Probabilities of each event from the product of the evolution
+    matrices of the segments it crosses, one event at a time.
+    """
+    lengths, potentials = earth.segments(coszen)
+    prob = np.empty((len(energy), 2, 3))
+    for n in range(len(energy)):
+        h0 = vacuum_hamiltonian(params, antineutrino[n]) / energy[n]
+        sign = -1 if antineutrino[n] else 1
+        u = np.eye(3, dtype=complex)
+        for length, potential in zip(lengths[n], potentials):
+            h = h0 + np.diag([sign * potential, 0, 0])
+            u = evolution(h, length) @ u
+        prob[n] = np.abs(u[:, :2].T)**2
+    return prob
+
+
+def test_oscillator_matches_matrix_exponential():
+    """ The probabilities of the Oscillator match a per-event matrix
+    exponential through the layers of the Earth, for neutrinos and
+    antineutrinos crossing the core, the mantle or only the atmosphere.
+    """
+    rng = np.random.default_rng(3)
+    n = 300
+    energy = 10**rng.uniform(-1, 2, n)
+    coszen = rng.uniform(-1, 1, n)
+    antineutrino = rng.random(n) < 0.5
+    earth = EarthModel(detector_depth=1.)
+    params = dict(DEFAULT_PARAMS, theta23=0.8, dcp=1.)
+    prob = Oscillator(energy, coszen, antineutrino, earth=earth).probabilities(params)
+    expected = reference_probabilities(energy, coszen, antineutrino, params, earth)
+    np.testing.assert_allclose(prob, expected, rtol=0, atol=1e-9)
+
+
+def test_oscillator_is_unitary():
+    """ The probabilities from each initial flavor add up to one. """
+    rng = np.random.default_rng(4)
+    n = 2000
+    oscillator = Oscillator(
+        10**rng.uniform(-1, 3, n), rng.uniform(-1, 1, n), rng.random(n) < 0.5)
+    prob = oscillator.probabilities()
+    np.testing.assert_allclose(prob.sum(axis=-1), 1, rtol=0, atol=1e-12)
+    assert np.all((prob >= -1e-12) & (prob <= 1 + 1e-12))
+
+
+def test_probability_table_accuracy():
+    """ The interpolated probabilities stay close to the exact ones down to
+    100 MeV, where the events of the fast oscillating cells are computed
+    exactly, and events computed exactly match the Oscillator.
+    """
+    rng = np.random.default_rng(5)
+    n = 50000
+    energy = 10**rng.uniform(-1, 2, n)
+    coszen = rng.uniform(-1, 1, n)
+    antineutrino = rng.random(n) < 0.5
+    earth = EarthModel(detector_depth=1.)
+    table = ProbabilityTable(energy, coszen, antineutrino, earth=earth)
+    params = dict(DEFAULT_PARAMS, dm31=2.6e-3, theta23=0.8)
+    accuracy = table.accuracy(params, nevents=5000, seed=6)
+    assert accuracy["max"] < 0.02
+    assert accuracy["rms"] < 1e-3
+    events = table.exact_events[:100]
+    exact = Oscillator(energy[events], coszen[events], antineutrino[events],
+                       earth=earth).probabilities(params)
+    np.testing.assert_allclose(table.probabilities(params)[events], exact, rtol=0, atol=1e-12)
+
+
+def test_osc_weights_resolution(sk_file):
+    """ The oscillation weights follow the resolution they are asked for,
+    with one engine per resolution.
+    """
+    exp = load_detector("SK", sk_file, cache=False)
+    exact = exp.get_osc_weights(DEFAULT_PARAMS)
+    fine = exp.get_osc_weights(DEFAULT_PARAMS, resolution=(1e-7, 1e-7))
+    coarse = exp.get_osc_weights(DEFAULT_PARAMS, resolution=(0.5, 0.5))
+    assert exp.get_oscillator((0.5, 0.5)) is not exp.get_oscillator()
+    np.testing.assert_allclose(fine, exact, rtol=0, atol=1e-4)
+    assert np.abs(coarse - exact).max() > 0.01
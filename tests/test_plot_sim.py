@@ -0,0 +1,20 @@
+import sys
+import cache
+import plot_sim
+
+
+def test_listing_reads_no_events(sk_file, monkeypatch, capsys):
+    """ Listing the samples and variables neither hashes nor reads the
+    simulation file for the cache.
+    """
+    def file_hash(*args, **kwargs):
+        raise AssertionError("the simulation file was hashed")
+
+    monkeypatch.setattr(cache, "file_hash", file_hash)
+    monkeypatch.setattr(sys, "argv", [
+        "plot_sim.py", "--experiment", "SK", "--fname", sk_file,
+        "--list-samples", "--list-variables"])
+    plot_sim.main()
+    out = capsys.readouterr().out
+    assert "MultiRing Mulike" in out
+    assert "itype" in out
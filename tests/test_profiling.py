@@ -0,0 +1,55 @@
+import tracemalloc
+import numpy as np
+import pytest
+from joint_fit import load_detector
+from profiling import Profiler, profiler, timed
+
+
+def test_nested_stages():
+    """ Stages are recorded by path with their calls, bytes read and
+    allocated memory, and nothing is recorded while disabled.
+    """
+    stages = Profiler()
+    with stages.stage("outer"):
+        pass
+    assert stages.stats == {}
+    stages.enable()
+    try:
+        for attempt in range(2):
+            with stages.stage("outer"):
+                stages.read(100)
+                with stages.stage("inner"):
+                    data = np.ones(1 << 20)
+                del data
+    finally:
+        tracemalloc.stop()
+    assert list(stages.stats) == ["outer", "outer > inner"]
+    assert stages.stats["outer"]["calls"] == 2
+    assert stages.stats["outer"]["read"] == 200
+    assert stages.stats["outer > inner"]["read"] == 0
+    assert stages.stats["outer > inner"]["allocated"] >= 8 << 20
+    assert stages.stats["outer"]["allocated"] >= 8 << 20
+
+
+@pytest.fixture
+def enabled():
+    """ Shared profiler enabled for a test, then reset. """
+    profiler.enable()
+    yield profiler
+    profiler.enabled = False
+    profiler.stats.clear()
+    tracemalloc.stop()
+
+
+def test_pipeline_stages(sk_file, enabled, capsys):
+    """ Loading and histogramming an experiment records its stages. """
+    exp = load_detector("SK", sk_file, ["Enu"], cache=False)
+    cuts, labels = exp.cuts_and_breakdown()
+    exp.histograms("pnu", cuts, labels)
+    timed("decorated")(lambda: None)()
+    assert "cuts_and_breakdown" in enabled.stats
+    assert "decorated" in enabled.stats
+    assert any(path.endswith("read columns") and stats["read"] > 0
+               for path, stats in enabled.stats.items())
+    enabled.report()
+    assert "cuts_and_breakdown" in capsys.readouterr().out
@@ -0,0 +1,20 @@
+import numpy as np
+from columns import LazyColumns
+from repack import repack, verify
+
+
+def test_repacked_file_matches(sk_file, tmp_path):
+    """ A repacked file gives the same cuts, weights and histograms as the
+    original one, with narrower types, and its datasets are decompressed
+    rather than memory-mapped.
+    """
+    output = str(tmp_path / "sk_repacked.h5")
+    types = repack(sk_file, output, keep=["weightReco"])
+    assert types["weightReco"][1] == np.float64
+    assert types["itype"][1].itemsize < types["itype"][0].itemsize
+    assert verify("SK", sk_file, output) == []
+    fdata = LazyColumns(output)
+    assert fdata.repacked and fdata.chunk_events
+    fdata.load(["itype", "pnu"])
+    assert fdata.access == {"itype": "copied", "pnu": "copied"}
+    assert fdata["itype"].dtype.itemsize < 4
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from export import read_histograms
+from joint_fit import load_detector
+from resampling import bootstrap_multipliers, poisson_multipliers
+
+
+def test_multipliers():
+    """ Poisson multipliers have mean and variance 1, bootstrap ones add up
+    to the number of events.
+    """
+    rng = np.random.default_rng(10)
+    k = poisson_multipliers(rng, 10**6).astype(float)
+    assert abs(k.mean() - 1) < 5e-3 and abs(k.var() - 1) < 1e-2
+    expected = np.exp(-1) / np.array([1, 1, 2, 6])
+    np.testing.assert_allclose(np.bincount(k.astype(int))[:4] / k.size, expected, atol=3e-3)
+    assert bootstrap_multipliers(rng, 1000).sum() == 1000
+
+
+@pytest.mark.parametrize("method", ["poisson", "bootstrap"])
+def test_replicas_reproducible(sk_file, method):
+    """ The replicas depend on the seed only, not on the number of threads,
+    and scatter around the nominal histograms.
+    """
+    exp = load_detector("SK", sk_file, ["Enu"], cache=False)
+    cuts, labels = exp.cuts_and_breakdown()
+    first = exp.replica_histograms(["pnu"], cuts, labels, 50, method, seed=3)
+    again = exp.replica_histograms(["pnu"], cuts, labels, 50, method, seed=3, workers=3)
+    other = exp.replica_histograms(["pnu"], cuts, labels, 50, method, seed=4)
+    nominal, replicas = first["pnu"]
+    assert replicas.shape == (50,) + nominal.sumw.shape
+    np.testing.assert_array_equal(again["pnu"][1], replicas)
+    assert not np.array_equal(other["pnu"][1], replicas)
+    total = nominal.sumw.sum()
+    assert abs(replicas.sum(axis=(1, 2, 3)).mean() - total) < 0.05 * total
+
+
+def test_export_replicas(sk_file, tmp_path):
+    """ Exported replicas are those of the same seed. """
+    exp = load_detector("SK", sk_file, ["Enu"], cache=False)
+    fname = str(tmp_path / "replicas.npz")
+    exp.export(fname, replicas=5, seed=2)
+    histograms, __, metadata = read_histograms(fname)
+    cuts, labels = exp.cuts_and_breakdown()
+    __, replicas = exp.replica_histograms(["pnu"], cuts, labels, 5, seed=2)["pnu"]
+    np.testing.assert_array_equal(histograms["Enu"].replicas, replicas)
+    assert metadata["replicas"] == 5 and metadata["seed"] == 2
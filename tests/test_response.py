@@ -0,0 +1,53 @@
+import numpy as np
+from joint_fit import load_detector
+from response import ResponseMatrix
+
+
+def reco_histograms(exp, weights):
+    """ Dense histograms of the reconstructed energy and cosine zenith of
+    every sample, over all the events, with given weights.
+    """
+    exp.weights = weights
+    everything = [np.ones(exp.get_index().ncube, dtype=bool)]
+    variables = [exp.reco_variables["energy"], exp.reco_variables["coszen"]]
+    return exp.histograms_nd(variables, everything, [""]).dense()[:, 0]
+
+
+def test_fold_matches_histograms_nd(simulation):
+    """ Folding the response with unit factors gives the nominal histograms
+    of the reconstructed variables, and a factor per channel the histograms
+    of the events reweighted by channel.
+    """
+    exp = load_detector(*simulation, cache=False)
+    exp.cuts_and_breakdown()
+    response = exp.get_response()
+    nominal = np.asarray(exp.weights)
+    expected = reco_histograms(exp, nominal)
+    np.testing.assert_allclose(response.fold(), expected, rtol=1e-10, atol=1e-300)
+    np.testing.assert_allclose(
+        response.fold(np.ones(response.true_shape)), expected, rtol=1e-12, atol=1e-300)
+
+    factors = np.ones(response.true_shape)
+    for c, channel in enumerate(response.channels):
+        if channel[2] == "e":
+            factors[c] = 2.
+    flavor = np.abs(exp.fdata[exp.true_variables["flavor"]])
+    reweighted = reco_histograms(exp, np.where(flavor == 12, 2., 1.) * nominal)
+    np.testing.assert_allclose(response.fold(factors), reweighted, rtol=1e-10, atol=1e-300)
+
+    batch = np.stack([np.ones(response.true_shape), factors], axis=-1)
+    folded = response.fold(batch)
+    np.testing.assert_allclose(folded[..., 0], expected, rtol=1e-10, atol=1e-300)
+    np.testing.assert_allclose(folded[..., 1], reweighted, rtol=1e-10, atol=1e-300)
+
+
+def test_save_load_round_trip(sk_file, tmp_path):
+    """ A response matrix saved to NPZ folds the same once loaded. """
+    exp = load_detector("SK", sk_file, cache=False)
+    exp.cuts_and_breakdown()
+    response = exp.get_response()
+    fname = str(tmp_path / "response.npz")
+    response.save(fname)
+    loaded = ResponseMatrix.load(fname)
+    assert loaded.channels == response.channels
+    np.testing.assert_array_equal(loaded.fold(), response.fold())
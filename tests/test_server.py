@@ -0,0 +1,50 @@
+import json
+import threading
+import numpy as np
+import pytest
+from server import Service
+
+""" Variables requested from the service. """
+VARIABLES = ["Enu", "reco_coszen", "reco_energy"]
+
+
+@pytest.fixture(scope="module")
+def service(sk_file, ic_file):
+    return Service([("SK", sk_file), ("ICUp", ic_file)], VARIABLES[:1], cache=False)
+
+
+def test_samples_by_name(service):
+    """ IceCube samples can be requested by name as with plot_sim.py. """
+    by_name = json.loads(service.histograms(
+        {"experiment": "ICUp", "samples": "tracks", "variables": VARIABLES[:1]}))
+    by_index = json.loads(service.histograms(
+        {"experiment": "ICUp", "samples": "1", "variables": VARIABLES[:1]}))
+    assert by_name["samples"] == [1]
+    assert by_name["sample_names"] == ["Tracks"]
+    assert by_name["histograms"] == by_index["histograms"]
+    with pytest.raises(ValueError):
+        service.histograms({"experiment": "ICUp", "samples": "showers"})
+
+
+def test_concurrent_requests(service):
+    """ Concurrent requests loading and binning new variables get the same
+    histograms as requests served one at a time.
+    """
+    requests = [{"experiment": tag, "variables": [name], "samples": samples}
+                for tag in ("SK", "ICUp") for name in VARIABLES
+                for samples in ("All", "0,1")]
+    results = [None] * len(requests)
+
+    def answer(k):
+        results[k] = json.loads(service.histograms(requests[k]))
+
+    threads = [threading.Thread(target=answer, args=(k,)) for k in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for request, result in zip(requests, results):
+        expected = json.loads(service.histograms(request))
+        assert result is not None
+        for name, hist in expected["histograms"].items():
+            np.testing.assert_array_equal(result["histograms"][name]["sumw"], hist["sumw"])